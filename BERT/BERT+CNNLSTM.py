@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 
-from kashgari.embeddings import BERTEmbedding
+from embeddings import LazyBERTEmbedding
 from models import CNNLSTMModel
 import jieba
 from tqdm import tqdm
@@ -93,11 +93,11 @@ def train():
     print('The number of test-set:', len(test_x))
     # print(len(test_y))
 
-    embedding = BERTEmbedding('../dataset/chinese_L-12_H-768_A-12', sequence_length=100)
+    embedding = LazyBERTEmbedding('../dataset/chinese_L-12_H-768_A-12', sequence_length=100)
     print('embedding_size', embedding.embedding_size)
     # print(embedding.model.output
 
-    model = CNNLSTMModel(embedding)
+    model = CNNLSTMModel(embedding, model_cache_dir='./model/cache')
     model.fit(train_x, train_y, val_x, val_y, batch_size=128, epochs=20, fit_kwargs={'callbacks': [tf_board_callback]})
     model.evaluate(test_x, test_y)
     model.save('./model/cnnlstm_bert_model')
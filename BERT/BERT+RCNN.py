@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from kashgari.embeddings import BERTEmbedding
+from embeddings import LazyBERTEmbedding
 from models import RCNNModel
 import jieba
 from tqdm import tqdm
@@ -91,11 +91,11 @@ def train():
     print('The number of test-set:', len(test_x))
     # print(len(test_y))
 
-    embedding = BERTEmbedding('../dataset/chinese_L-12_H-768_A-12', sequence_length=100)
+    embedding = LazyBERTEmbedding('../dataset/chinese_L-12_H-768_A-12', sequence_length=100)
     print('embedding_size', embedding.embedding_size)
     # print(embedding.model.output
 
-    model = RCNNModel(embedding)
+    model = RCNNModel(embedding, model_cache_dir='./model/cache')
     model.fit(train_x, train_y, val_x, val_y, batch_size=128, epochs=20, fit_kwargs={'callbacks': [tf_board_callback]})
     model.evaluate(test_x, test_y)
     model.save('./model/rcnn_bert_model')
@@ -1,19 +1,54 @@
 # -*- coding: utf-8 -*-
 
-"""使用Bert-encode+LogisticRegression进行分类"""
-import gensim
+"""使用Bert-encode（或Doc2Vec）+LogisticRegression进行分类"""
 from sklearn.linear_model import LogisticRegression
-import pandas as pd
 from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 import numpy as np
-import jieba
-from gensim.test.utils import common_texts
-from gensim.models.doc2vec import Doc2Vec, TaggedDocument
 import tensorflow as tf
-from bert_serving.client import BertClient
+import os
+import pickle
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics
+from common.ann import IVFIndex, KNNClassifier
+from common.projection import VectorProjection
+from common.streaming_linear import StreamingLinearClassifier
+from common.vector_cache import VectorCache
 
 tf.flags.DEFINE_string('positive_data_file', './weibo60000/pos60000_utf8.txt', 'Data source for the positive data')
 tf.flags.DEFINE_string('negative_data_file', './weibo60000/neg60000_utf8.txt', 'Data source for the negative data')
+tf.flags.DEFINE_string('encoder', 'local', 'local: 在进程内加载BERT编码；service: 使用bert-as-service服务；doc2vec: 只用CPU的Doc2Vec句向量')
+tf.flags.DEFINE_string('bert_model_path', './chinese_L-12_H-768_A-12', '本地编码时BERT模型的目录')
+tf.flags.DEFINE_string('service_ip', '192.168.2.17', 'bert-as-service服务的地址')
+tf.flags.DEFINE_integer('encode_batch_size', 64, '本地编码时每个batch的句子数')
+tf.flags.DEFINE_integer('max_seq_len', 128, '本地编码时的最大句长（含[CLS]和[SEP]）')
+tf.flags.DEFINE_integer('encode_workers', 2, '本地编码时并发执行的batch数')
+tf.flags.DEFINE_string('doc2vec_path', './model/doc2vec.model', 'Doc2Vec模型的路径，不存在时在训练集句子上训练后保存')
+tf.flags.DEFINE_integer('doc2vec_size', 100, 'Doc2Vec句向量的维度')
+tf.flags.DEFINE_integer('doc2vec_epochs', 10, 'Doc2Vec训练和推断的轮数')
+tf.flags.DEFINE_integer('doc2vec_min_count', 5, 'Doc2Vec忽略出现次数少于该值的词')
+tf.flags.DEFINE_integer('doc2vec_workers', 0, 'Doc2Vec训练、jieba并行分词和推断的进程/线程数，0为全部CPU核')
+tf.flags.DEFINE_string('vector_cache_dir', './model/vector_cache', '句向量缓存目录，为空时不缓存')
+tf.flags.DEFINE_integer('vector_cache_max_mb', 0, '句向量缓存的大小上限（MB），超出时淘汰最久未用的句子，0为不限')
+tf.flags.DEFINE_boolean('streaming', False, '分块读取句向量并用SGD增量训练逻辑回归，句向量不整体载入内存（只支持--classifier=lr）')
+tf.flags.DEFINE_integer('chunk_size', 8192, '流式训练时每次读取的句子数')
+tf.flags.DEFINE_integer('sgd_epochs', 5, '流式训练的轮数')
+tf.flags.DEFINE_float('sgd_alpha', 1e-4, '流式训练的L2正则系数')
+tf.flags.DEFINE_integer('projection_dim', 0, '大于0时先用PCA把句向量降到该维度，再缓存和分类（建议64~256）')
+tf.flags.DEFINE_boolean('projection_whiten', False, 'PCA降维时是否白化')
+tf.flags.DEFINE_integer('projection_sample', 10000, '拟合PCA使用的训练集句子数')
+tf.flags.DEFINE_string('projection_path', '', 'PCA参数的保存路径，文件已存在时直接加载，不重新拟合')
+tf.flags.DEFINE_string('classifier_path', '', '训练后把降维参数和分类器一起保存到该路径（pickle）')
+tf.flags.DEFINE_string('classifier', 'lr', 'lr: 逻辑回归；knn: 在IVF近似最近邻索引上做kNN投票')
+tf.flags.DEFINE_integer('knn_k', 10, 'kNN的近邻数')
+tf.flags.DEFINE_string('knn_weighting', 'uniform', 'uniform: 多数投票；similarity: 按余弦相似度加权')
+tf.flags.DEFINE_integer('knn_nlist', 256, 'IVF索引的倒排列表数')
+tf.flags.DEFINE_integer('knn_nprobe', 8, '每个查询扫描的倒排列表数')
+tf.flags.DEFINE_string('solver', '', 'LogisticRegression的solver，为空时使用sklearn的默认值；'
+                                     'saga直接在float32矩阵上训练（liblinear会先复制一份float64），训练前先标准化')
+tf.flags.DEFINE_integer('saga_max_iter', 1000, 'solver为saga时的最大迭代轮数')
 FLAGS = tf.flags.FLAGS
 
 """从文件中读取数据和标签"""
@@ -46,49 +81,147 @@ def load_data_and_label(pos_filename, neg_filename):
     #     print(mat)
     return [x_text, y]
 
+if FLAGS.streaming and FLAGS.classifier != 'lr':
+    # 流式训练只支持SGD逻辑回归，kNN需要把全部训练集句向量加入索引
+    raise ValueError('--streaming only supports --classifier=lr, got --classifier={}'.format(FLAGS.classifier))
+
 x_text, y = load_data_and_label(FLAGS.positive_data_file, FLAGS.negative_data_file)
+# 只划分下标，之后训练Doc2Vec、拟合PCA和分类器都只用训练集
+train_index, test_index = train_test_split(np.arange(len(x_text)), test_size=0.4, random_state=0)
+
+if FLAGS.encoder == 'service':
+    from bert_serving.client import BertClient
+    bc = BertClient(ip=FLAGS.service_ip)
+    encoder_id = 'bert-as-service:{}'.format(FLAGS.service_ip)
+elif FLAGS.encoder == 'doc2vec':
+    from doc2vec_encoder import Doc2VecEncoder
+    if os.path.exists(FLAGS.doc2vec_path):
+        bc = Doc2VecEncoder.load(FLAGS.doc2vec_path, workers=FLAGS.doc2vec_workers)
+    else:
+        bc = Doc2VecEncoder(FLAGS.doc2vec_size, min_count=FLAGS.doc2vec_min_count, epochs=FLAGS.doc2vec_epochs,
+                            workers=FLAGS.doc2vec_workers).fit([x_text[i] for i in train_index])
+        os.makedirs(os.path.dirname(os.path.abspath(FLAGS.doc2vec_path)), exist_ok=True)
+        bc.save(FLAGS.doc2vec_path)
+    # 测试集句子不参与训练，和训练集句子一样通过推断得到句向量，与BERT一样写入vector_cache_dir
+    encoder_id = bc.encoder_id
+else:
+    from bert_encoder import BertEncoder
+    bc = BertEncoder(FLAGS.bert_model_path,
+                     max_seq_len=FLAGS.max_seq_len,
+                     batch_size=FLAGS.encode_batch_size,
+                     num_workers=FLAGS.encode_workers)
+    encoder_id = bc.encoder_id
+
+
+def fit_projection():
+    """在训练集的一部分句子上拟合PCA，原始向量有缓存时从缓存读取"""
+    if FLAGS.projection_path and os.path.exists(FLAGS.projection_path):
+        return VectorProjection.load(FLAGS.projection_path)
+    sample = np.random.RandomState(0).permutation(train_index)[:FLAGS.projection_sample]
+    sample_texts = [x_text[i] for i in sample]
+    if FLAGS.vector_cache_dir:
+        raw = VectorCache(FLAGS.vector_cache_dir, encoder_id).get_or_encode(sample_texts, bc.encode)
+    else:
+        raw = bc.encode(sample_texts)
+    projection = VectorProjection(FLAGS.projection_dim, whiten=FLAGS.projection_whiten).fit(raw)
+    print('PCA {} -> {}维，保留方差比例 {:.4f}'.format(raw.shape[1], FLAGS.projection_dim,
+                                                 projection.explained_variance_ratio))
+    if FLAGS.projection_path:
+        projection.save(FLAGS.projection_path)
+    return projection
+
 
-# documents = [TaggedDocument(doc, [i]) for i, doc in enumerate(x_text)]
-# model = Doc2Vec(documents, size=100, window=8, min_count=100, workers=8)
+projection = None
+encode = bc.encode
+if FLAGS.projection_dim > 0:
+    # 降维后的向量按新的编码器标识缓存
+    projection = fit_projection()
+    encode = lambda texts: projection.transform(bc.encode(texts))
+    encoder_id = '{}|{}'.format(encoder_id, projection.projection_id)
 
-bc = BertClient(ip='192.168.2.17')
-model = bc.encode(x_text)
+
+def streaming_source():
+    """流式训练时按样本下标取句向量：有缓存时从memmap读取，否则每次调用编码器"""
+    if FLAGS.vector_cache_dir:
+        # 先分块编码缓存中没有的句子，训练中不淘汰
+        cache = VectorCache(FLAGS.vector_cache_dir, encoder_id)
+        cache.encode_missing(x_text, encode, chunk_size=FLAGS.chunk_size)
+        rows = cache.rows_of(x_text)
+        return lambda index: cache.read_rows(rows[index])
+    return lambda index: np.asarray(encode([x_text[i] for i in index]), dtype=np.float32)
+
+
+# (句子数, 768)（Doc2Vec为(句子数, doc2vec_size)）的连续float32矩阵，之后只按下标划分，不再复制；流式训练时不生成
+if FLAGS.streaming:
+    model = None
+elif FLAGS.vector_cache_dir:
+    # 只编码缓存中没有的句子
+    cache = VectorCache(FLAGS.vector_cache_dir, encoder_id, max_bytes=FLAGS.vector_cache_max_mb << 20)
+    model = cache.get_or_encode(x_text, encode)
+else:
+    model = np.ascontiguousarray(encode(x_text), dtype=np.float32)
 
 #生成文本向量
-print(model[1])
+if model is not None:
+    print(model[1])
 # print(type(model.docvecs[1]))
 # print(type(model.docvecs))
 
 
 #使用逻辑回归进行预测
 def LR():
-    clf = LogisticRegression()
-    return clf
+    if FLAGS.solver == 'saga':
+        # saga在未标准化的句向量上收敛很慢
+        return make_pipeline(StandardScaler(), LogisticRegression(solver='saga', max_iter=FLAGS.saga_max_iter))
+    if FLAGS.solver:
+        return LogisticRegression(solver=FLAGS.solver)
+    return LogisticRegression()
 def getRecognitionRate(testPre, testClass):
-    testNum = len(testPre)
-    rightNum = 0
-    for i in range(0, testNum):
-        if testClass[i] == testPre[i]:
-            rightNum += 1
-    return float(rightNum) / float(testNum)
+    return metrics.accuracy(testClass, testPre)
 
 def getData():
-    #生成pandas
-    # tigs = []
-    data_dict = {}
-
-    for i in range(len(model)):
-        data_dict['p' + str(i)] = model[i]
-    # print(tigs)
-    print(data_dict)
-    data = pd.DataFrame(data_dict)
-    data = data.T
-    # data['class0'] = tigs
-    X_train1, X_test1, y_train1, y_test1 = train_test_split(data, y, test_size=0.4, random_state=0)
+    # 按下标划分，与直接划分矩阵得到的训练集/测试集相同
+    X_train1, X_test1 = model[train_index], model[test_index]
+    y_train1, y_test1 = y[train_index], y[test_index]
     return X_train1, y_train1, X_test1, y_test1
 
-T = getData()
-trainMatrix, trainClass, testMatrix, testClass = T[0], T[1], T[2], T[3]
-clf_LR=LR()
-clf_LR.fit(trainMatrix, trainClass)
-print('Logistic Regression recognition rate: ', getRecognitionRate(clf_LR.predict(testMatrix), testClass))
\ No newline at end of file
+if FLAGS.streaming:
+    # 与getData相同的划分
+    source = streaming_source()
+    clf_SGD = StreamingLinearClassifier(np.unique(y), chunk_size=FLAGS.chunk_size,
+                                        epochs=FLAGS.sgd_epochs, alpha=FLAGS.sgd_alpha)
+    clf_SGD.fit(source, train_index, y, eval_indices=test_index)
+    result = clf_SGD.evaluate(source, test_index, y)
+    print('Streaming Logistic Regression recognition rate: ', result.accuracy)
+    print(result.report())
+    classifier = clf_SGD
+else:
+    T = getData()
+    trainMatrix, trainClass, testMatrix, testClass = T[0], T[1], T[2], T[3]
+    if FLAGS.classifier == 'knn':
+        # 在训练集的一部分上训练IVF的聚类中心，再把训练集全部加入索引；新标注的句子可以随时add
+        index = IVFIndex(nlist=FLAGS.knn_nlist, nprobe=FLAGS.knn_nprobe)
+        index.train(trainMatrix[np.random.RandomState(0).permutation(len(trainMatrix))[:50 * FLAGS.knn_nlist]])
+        clf_kNN = KNNClassifier(index, k=FLAGS.knn_k, weighting=FLAGS.knn_weighting, classes=np.unique(y))
+        clf_kNN.add(trainMatrix, trainClass)
+        probs = clf_kNN.predict_proba(testMatrix)
+        testPre = clf_kNN.classes[probs.argmax(1)]
+        print('kNN recognition rate: ', getRecognitionRate(testPre, testClass))
+        print(metrics.classification_report(testClass, testPre, scores=probs[:, -1]))
+        speed = clf_kNN.benchmark(testMatrix)
+        print('kNN queries/s: {:.0f}, recall@{} against exact search: {:.4f}'.format(
+            speed['queries_per_second'], FLAGS.knn_k, speed['recall']))
+        classifier = clf_kNN
+    else:
+        clf_LR=LR()
+        clf_LR.fit(trainMatrix, trainClass)
+        testPre = clf_LR.predict(testMatrix)
+        print('Logistic Regression recognition rate: ', getRecognitionRate(testPre, testClass))
+        print(metrics.classification_report(testClass, testPre, scores=clf_LR.predict_proba(testMatrix)[:, 1]))
+        classifier = clf_LR
+
+if FLAGS.classifier_path:
+    # 预测新句子时先用同一个projection降维
+    with open(FLAGS.classifier_path, 'wb') as f:
+        pickle.dump({'encoder_id': encoder_id, 'projection': projection, 'classifier': classifier}, f)
+    print('分类器已保存至', FLAGS.classifier_path)
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import importlib
+import json
 import logging
+import os
 import random
+import sys
 from typing import Tuple, Dict
 
 import numpy as np
+from keras.models import Model
 from keras.preprocessing import sequence
 from keras.utils import to_categorical
 from sklearn import metrics
@@ -16,6 +21,15 @@ from kashgari.tasks.base import BaseModel
 from kashgari.embeddings import BaseEmbedding
 from kashgari.type_hints import *
 
+from early_exit import EXIT_CRITERIA, EarlyExitRunner, build_exit_model, encoder_layer_count, exit_head_layers
+from embeddings import HashingEmbedding
+from model_cache import ModelCache, model_cache_key
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common import layers
+from common import metrics as common_metrics
+
 
 class ClassificationModel(BaseModel):
 
@@ -23,17 +37,24 @@ class ClassificationModel(BaseModel):
                  embedding: BaseEmbedding = None,
                  hyper_parameters: Dict = None,
                  multi_label: bool = False,
+                 model_cache_dir: str = None,
                  **kwargs):
         """
 
         :param embedding:
         :param hyper_parameters:
         :param multi_label:
+        :param model_cache_dir: reuse compiled models built with the same architecture,
+               hyper parameters and embedding from this directory, see :class:`ModelCache`
         :param kwargs:
         """
         super(ClassificationModel, self).__init__(embedding, hyper_parameters, **kwargs)
         self.multi_label = multi_label
+        self.model_cache_dir = model_cache_dir
         self.multi_label_binarizer: MultiLabelBinarizer = None
+        self.early_exit_layers: List[int] = None
+        self.early_exit_model = None
+        self.early_exit_stats: Dict = None
 
         if self.multi_label:
             if not hyper_parameters or \
@@ -57,6 +78,8 @@ class ClassificationModel(BaseModel):
     def info(self):
         info = super(ClassificationModel, self).info()
         info['model_info']['multi_label'] = self.multi_label
+        if self.early_exit_layers:
+            info['model_info']['early_exit_layers'] = self.early_exit_layers
         return info
 
     @property
@@ -79,16 +102,75 @@ class ClassificationModel(BaseModel):
         """
         raise NotImplementedError()
 
+    def _compile_model(self, model: Model):
+        """
+        compile model with the optimizer and compile_params hyper parameters and set it as self.model
+        :param model:
+        :return:
+        """
+        optimizer_config = self.hyper_parameters['optimizer']
+        optimizer = getattr(importlib.import_module(optimizer_config['module']),
+                            optimizer_config['name'])(**optimizer_config['params'])
+        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
+        self.model = model
+        self.model.summary()
+
+    def build_or_load_model(self):
+        """
+        build_model, or load the compiled model from model_cache_dir when an identical one was built before
+        :return:
+        """
+        if not self.model_cache_dir:
+            self.build_model()
+            return
+        cache = ModelCache(self.model_cache_dir)
+        key = model_cache_key(self)
+        model = cache.load(key, custom_objects=self.create_custom_objects(self.info()))
+        if model is not None:
+            self.model = model
+        else:
+            self.build_model()
+            cache.store(key, self)
+
+    @staticmethod
+    def create_custom_objects(model_info):
+        custom_objects = BaseModel.create_custom_objects(model_info)
+        custom_objects.update(layers.custom_objects)
+        return custom_objects
+
     @classmethod
     def load_model(cls, model_path: str):
         agent: ClassificationModel = super(ClassificationModel, cls).load_model(model_path)
+        with open(os.path.join(model_path, 'model.json'), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        agent.model_info = info.get('model_info', {})
+        if info['embedding']['embedding_type'] == 'hashing':
+            embedding = HashingEmbedding.from_info(info['embedding'])
+            embedding.token2idx = agent.embedding.token2idx
+            agent.embedding = embedding
         agent.multi_label = agent.model_info.get('multi_label', False)
         if agent.multi_label:
             keys = list(agent.label2idx.keys())
             agent.multi_label_binarizer = MultiLabelBinarizer(classes=keys)
             agent.multi_label_binarizer.fit(keys[0])
+        exit_layers = agent.model_info.get('early_exit_layers')
+        if exit_layers:
+            agent.build_early_exit(exit_layers)
+            weights = np.load(os.path.join(model_path, 'early_exit.npz'))
+            for layer in exit_head_layers(agent.early_exit_model, exit_layers):
+                layer.set_weights([weights['{}:{}'.format(layer.name, i)]
+                                   for i in range(len(layer.weights))])
         return agent
 
+    def save(self, model_path: str):
+        super(ClassificationModel, self).save(model_path)
+        if self.early_exit_model is not None:
+            weights = {}
+            for layer in exit_head_layers(self.early_exit_model, self.early_exit_layers):
+                for i, value in enumerate(layer.get_weights()):
+                    weights['{}:{}'.format(layer.name, i)] = value
+            np.savez(os.path.join(model_path, 'early_exit.npz'), **weights)
+
     def build_token2id_label2id_dict(self,
                                      x_train: List[List[str]],
                                      y_train: List[str],
@@ -199,7 +281,7 @@ class ClassificationModel(BaseModel):
             if self.embedding.sequence_length == 0:
                 self.embedding.sequence_length = sorted([len(x) for x in x_train])[int(0.95 * len(x_train))]
                 logging.info('sequence length set to {}'.format(self.embedding.sequence_length))
-            self.build_model()
+            self.build_or_load_model()
 
         train_generator = self.get_data_generator(x_train,
                                                   y_train,
@@ -231,6 +313,83 @@ class ClassificationModel(BaseModel):
                                  class_weight=class_weights,
                                  **fit_kwargs)
 
+    def build_early_exit(self, exit_layers: List[int] = None):
+        """
+        attach exit classifiers to intermediate bert encoder layers
+        :param exit_layers: 1-based encoder block indexes, default every block except the last one
+        :return:
+        """
+        if not self.embedding.is_bert:
+            raise ValueError('early exit is only available for bert embedding')
+        num_layers = encoder_layer_count(self.model)
+        if exit_layers is None:
+            exit_layers = list(range(1, num_layers))
+        exit_layers = sorted(exit_layers)
+        if exit_layers[0] < 1 or exit_layers[-1] >= num_layers:
+            raise ValueError('exit layers must be in range [1, {})'.format(num_layers))
+
+        activation = 'sigmoid' if self.multi_label else 'softmax'
+        self.early_exit_layers = exit_layers
+        self.early_exit_model = build_exit_model(self.model,
+                                                 exit_layers,
+                                                 len(self.label2idx),
+                                                 activation=activation)
+
+    def fit_early_exit(self,
+                       x_train: List[List[str]],
+                       y_train: Union[List[str], List[List[str]], List[Tuple[str]]],
+                       x_validate: List[List[str]] = None,
+                       y_validate: Union[List[str], List[List[str]], List[Tuple[str]]] = None,
+                       batch_size: int = 64,
+                       epochs: int = 1,
+                       exit_layers: List[int] = None,
+                       fit_kwargs: Dict = None):
+        """
+        train the exit classifiers of a trained model, encoder and task layers stay frozen
+        :param x_train: list of training data.
+        :param y_train: list of training target label data.
+        :param x_validate: list of validation data.
+        :param y_validate: list of validation target label data.
+        :param batch_size: batch size for trainer model
+        :param epochs: Number of epochs to train the exit classifiers.
+        :param exit_layers: 1-based encoder block indexes to attach exit classifiers to
+        :param fit_kwargs: additional kwargs to be passed to
+               :func:`~keras.models.Model.fit`
+        :return:
+        """
+        if self.early_exit_model is None:
+            self.build_early_exit(exit_layers)
+        exit_model = self.early_exit_model
+        heads = exit_head_layers(exit_model, self.early_exit_layers)
+
+        trainable_state = [(layer, layer.trainable) for layer in exit_model.layers]
+        for layer in exit_model.layers:
+            layer.trainable = layer in heads
+        exit_model.compile(optimizer='adam',
+                           loss=self.hyper_parameters['compile_params']['loss'],
+                           metrics=self.hyper_parameters['compile_params'].get('metrics'))
+        for layer, trainable in trainable_state:
+            layer.trainable = trainable
+
+        def exit_generator(generator):
+            for x, y in generator:
+                yield x, [y] * len(heads)
+
+        if fit_kwargs is None:
+            fit_kwargs = {}
+        if x_validate:
+            fit_kwargs['validation_data'] = exit_generator(self.get_data_generator(x_validate,
+                                                                                   y_validate,
+                                                                                   batch_size,
+                                                                                   is_bert=True))
+            fit_kwargs['validation_steps'] = max(len(x_validate) // batch_size, 1)
+
+        train_generator = self.get_data_generator(x_train, y_train, batch_size, is_bert=True)
+        exit_model.fit_generator(exit_generator(train_generator),
+                                 steps_per_epoch=max(len(x_train) // batch_size, 1),
+                                 epochs=epochs,
+                                 **fit_kwargs)
+
     def _format_output_dic(self, words: List[str], res: np.ndarray):
         results = sorted(list(enumerate(res)), key=lambda x: -x[1])
         candidates = []
@@ -247,12 +406,28 @@ class ClassificationModel(BaseModel):
         }
         return data
 
+    def prepare_model_input(self, x_data: List[List[str]]) -> Union[np.ndarray, List[np.ndarray]]:
+        """
+        tokenize and pad a list of sentences into model input
+        :param x_data: list of sentence as List[List[str]]
+        :return:
+        """
+        tokens = self.embedding.tokenize(x_data)
+        padded_tokens = sequence.pad_sequences(tokens,
+                                               maxlen=self.embedding.sequence_length,
+                                               padding='post')
+        if self.embedding.is_bert:
+            return [padded_tokens, np.zeros(shape=(len(padded_tokens), self.embedding.sequence_length))]
+        return padded_tokens
+
     def predict(self,
                 sentence: Union[List[str], List[List[str]]],
                 batch_size=None,
                 output_dict=False,
                 multi_label_threshold=0.6,
-                debug_info=False) -> Union[List[str], str, List[Dict], Dict]:
+                debug_info=False,
+                early_exit_threshold: float = None,
+                early_exit_criterion: str = 'confidence') -> Union[List[str], str, List[Dict], Dict]:
         """
         predict with model
         :param sentence: single sentence as List[str] or list of sentence as List[List[str]]
@@ -260,23 +435,34 @@ class ClassificationModel(BaseModel):
         :param output_dict: return dict with result with confidence
         :param multi_label_threshold:
         :param debug_info: print debug info using logging.debug when True
+        :param early_exit_threshold: stop at the first exit classifier whose confidence reaches
+               this value (or whose entropy falls below it), needs :meth:`build_early_exit`
+        :param early_exit_criterion: `confidence` or `entropy`
         :return:
         """
-        tokens = self.embedding.tokenize(sentence)
+        if early_exit_threshold is not None:
+            if early_exit_criterion not in EXIT_CRITERIA:
+                raise ValueError('unknown early exit criterion `{}`, expected one of {}'.format(
+                    early_exit_criterion, EXIT_CRITERIA))
+            if self.early_exit_model is None:
+                raise ValueError('early_exit_threshold needs the exit classifiers, call build_early_exit first')
         is_list = not isinstance(sentence[0], str)
         if is_list:
-            padded_tokens = sequence.pad_sequences(tokens,
-                                                   maxlen=self.embedding.sequence_length,
-                                                   padding='post')
+            x = self.prepare_model_input(sentence)
         else:
-            padded_tokens = sequence.pad_sequences([tokens],
-                                                   maxlen=self.embedding.sequence_length,
-                                                   padding='post')
-        if self.embedding.is_bert:
-            x = [padded_tokens, np.zeros(shape=(len(padded_tokens), self.embedding.sequence_length))]
+            x = self.prepare_model_input([sentence])
+        if early_exit_threshold is not None:
+            runner = EarlyExitRunner(self.model,
+                                     self.early_exit_model,
+                                     self.early_exit_layers,
+                                     multi_label=self.multi_label)
+            res, layers_used = runner.predict(x,
+                                              early_exit_threshold,
+                                              criterion=early_exit_criterion,
+                                              batch_size=batch_size)
+            self.early_exit_stats = runner.stats(layers_used)
         else:
-            x = padded_tokens
-        res = self.model.predict(x, batch_size=batch_size)
+            res = self.model.predict(x, batch_size=batch_size)
 
         if self.multi_label:
             if debug_info:
@@ -318,7 +504,10 @@ class ClassificationModel(BaseModel):
         y_pred = self.predict(x_data, batch_size=batch_size)
         #report = metrics.classification_report(y_data, y_pred, output_dict=True, digits=digits)
 		#report = metrics.classification_report(y_data, y_pred, digits=digits)
-        print(metrics.classification_report(y_data, y_pred, digits=digits))
+        if self.multi_label:
+            print(metrics.classification_report(y_data, y_pred, digits=digits))
+        else:
+            print(common_metrics.classification_report(y_data, y_pred, digits=digits))
         if debug_info:
             for index in random.sample(list(range(len(x_data))), 5):
                 logging.debug('------ sample {} ------'.format(index))
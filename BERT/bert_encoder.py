@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""进程内的BERT句向量编码，接口与bert_serving的BertClient.encode一致，不需要单独部署bert-as-service"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import keras_bert
+import numpy as np
+from keras import backend as K
+from keras.models import Model
+
+
+class BertEncoder(object):
+    """
+    Sentence vectors from a local BERT checkpoint (e.g. chinese_L-12_H-768_A-12), pooled as
+    bert-as-service does by default: the mean of `pooling_layer` (-2, the second to last encoder)
+    over the real tokens.
+
+    The model is built with a variable sequence length. Sentences are sorted by length and
+    every batch is padded only to its own longest sentence, and batches run on a thread pool
+    (the session releases the GIL), so short texts no longer pay for `max_seq_len` positions.
+    """
+
+    def __init__(self,
+                 model_path: str,
+                 max_seq_len: int = 128,
+                 batch_size: int = 64,
+                 num_workers: int = 2,
+                 pooling_layer: int = -2):
+        """
+        :param model_path: directory with bert_config.json, bert_model.ckpt and vocab.txt
+        :param max_seq_len: longer sentences are truncated, including [CLS] and [SEP]
+        :param batch_size: sentences per forward pass
+        :param num_workers: batches run concurrently
+        :param pooling_layer: encoder layer to pool, -1 for the last one
+        """
+        self.max_seq_len = max_seq_len
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        # 句向量只由checkpoint、最大句长和池化层决定，作为common.vector_cache.VectorCache的编码器标识
+        self.encoder_id = 'bert:{}:max_seq_len={}:pooling_layer={}'.format(os.path.abspath(model_path),
+                                                                           max_seq_len, pooling_layer)
+
+        with open(os.path.join(model_path, 'bert_config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        with open(os.path.join(model_path, 'vocab.txt'), 'r', encoding='utf-8') as f:
+            self.token_dict = dict((token, i) for i, token in enumerate(f.read().splitlines()))
+        self.tokenizer = keras_bert.Tokenizer(self.token_dict)
+
+        logging.info('loading bert model from {}\n'.format(model_path))
+        inputs, outputs = keras_bert.get_model(token_num=config['vocab_size'],
+                                               pos_num=config['max_position_embeddings'],
+                                               seq_len=None,
+                                               embed_dim=config['hidden_size'],
+                                               transformer_num=config['num_hidden_layers'],
+                                               head_num=config['num_attention_heads'],
+                                               feed_forward_dim=config['intermediate_size'],
+                                               training=False)
+        self.model = Model(inputs, outputs)
+        keras_bert.load_model_weights_from_checkpoint(self.model, config,
+                                                      os.path.join(model_path, 'bert_model.ckpt'))
+        self.embedding_size = config['hidden_size']
+
+        layer_index = config['num_hidden_layers'] + 1 + pooling_layer
+        hidden = self.model.get_layer('Encoder-{}-FeedForward-Norm'.format(layer_index)).output
+        mask = K.expand_dims(K.cast(K.not_equal(inputs[0], 0), K.floatx()), 2)
+        pooled = K.sum(hidden * mask, 1) / K.maximum(K.sum(mask, 1), 1.)
+
+        feed_list = list(inputs)
+        if self.model.uses_learning_phase:
+            feed_list.append(K.learning_phase())
+        self.session = K.get_session()
+        self._encode_batch = self.session.make_callable(pooled, feed_list=feed_list)
+        self._feed_learning_phase = self.model.uses_learning_phase
+
+    def token_ids(self, text: str) -> List[int]:
+        tokens = self.tokenizer.tokenize(text)
+        if len(tokens) > self.max_seq_len:
+            tokens = tokens[:self.max_seq_len - 1] + [keras_bert.TOKEN_SEP]
+        unk = self.token_dict[keras_bert.TOKEN_UNK]
+        return [self.token_dict.get(token, unk) for token in tokens]
+
+    def _run(self, batch: List[List[int]]) -> np.ndarray:
+        token_ids = np.zeros((len(batch), max(len(ids) for ids in batch)), dtype='int32')
+        for i, ids in enumerate(batch):
+            token_ids[i, :len(ids)] = ids
+        feeds = [token_ids, np.zeros_like(token_ids)]
+        if self._feed_learning_phase:
+            feeds.append(0)
+        return self._encode_batch(*feeds)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        :param texts: sentences
+        :return: float32 array of shape (len(texts), embedding_size), in the order of `texts`
+        """
+        ids = [self.token_ids(text) for text in texts]
+        order = np.argsort([len(i) for i in ids], kind='mergesort')
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+        vectors = np.empty((len(texts), self.embedding_size), dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            results = executor.map(self._run, [[ids[i] for i in batch] for batch in batches])
+            for batch, result in zip(batches, results):
+                vectors[batch] = result
+        return vectors
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""gensim Doc2Vec句向量，只用CPU，接口与BertEncoder.encode一致，可以替换BERT编码器作为逻辑回归/kNN的输入"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.dataset import cut_texts
+
+
+class Doc2VecEncoder(object):
+    """
+    Doc2Vec (PV-DM) trained on jieba-segmented sentences with all cores.
+
+    Segmentation goes through jieba's parallel mode. :meth:`encode` infers the vectors of new
+    sentences: the texts are segmented together, then split into `batch_size` slices inferred on a
+    thread pool (gensim's inference loop releases the GIL), so throughput scales with the cores.
+    """
+
+    def __init__(self,
+                 vector_size: int = 100,
+                 window: int = 8,
+                 min_count: int = 5,
+                 epochs: int = 10,
+                 workers: int = 0,
+                 batch_size: int = 1024,
+                 seed: int = 0):
+        """
+        :param vector_size: dimension of the sentence vectors
+        :param window:
+        :param min_count: words rarer than this are ignored
+        :param epochs: training epochs, also used by inference
+        :param workers: training threads, segmentation processes and inference threads, 0 for all cores
+        :param batch_size: sentences per inference task
+        :param seed:
+        """
+        self.vector_size = vector_size
+        self.window = window
+        self.min_count = min_count
+        self.epochs = epochs
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.seed = seed
+        self.model = None
+
+    @property
+    def encoder_id(self) -> str:
+        """由训练得到的词向量决定，作为common.vector_cache.VectorCache的编码器标识"""
+        digest = hashlib.sha1(np.ascontiguousarray(self.model.wv.vectors).tobytes()).hexdigest()[:16]
+        return 'doc2vec:vector_size={}:epochs={}:{}'.format(self.vector_size, self.epochs, digest)
+
+    def fit(self, texts: List[str]) -> 'Doc2VecEncoder':
+        """无监督训练，不使用标签；只传入训练集句子，测试集句子由encode推断"""
+        documents = [TaggedDocument(words, [i]) for i, words in enumerate(cut_texts(texts, self.workers))]
+        logging.info('training doc2vec on {} sentences with {} workers'.format(len(documents), self.workers))
+        self.model = Doc2Vec(documents,
+                             vector_size=self.vector_size,
+                             window=self.window,
+                             min_count=self.min_count,
+                             epochs=self.epochs,
+                             workers=self.workers,
+                             seed=self.seed)
+        return self
+
+    def save(self, path: str):
+        self.model.save(path)
+
+    @classmethod
+    def load(cls, path: str, workers: int = 0, batch_size: int = 1024) -> 'Doc2VecEncoder':
+        model = Doc2Vec.load(path)
+        encoder = cls(model.vector_size, window=model.window, epochs=model.epochs, workers=workers,
+                      batch_size=batch_size)
+        encoder.model = model
+        return encoder
+
+    def _infer(self, batch: List[List[str]]) -> np.ndarray:
+        return np.asarray([self.model.infer_vector(words, epochs=self.epochs) for words in batch], dtype=np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        :param texts: sentences
+        :return: float32 array of shape (len(texts), vector_size), in the order of `texts`
+        """
+        words = cut_texts(texts, self.workers)
+        batches = [words[i:i + self.batch_size] for i in range(0, len(words), self.batch_size)]
+        vectors = np.empty((len(texts), self.vector_size), dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i, result in enumerate(executor.map(self._infer, batches)):
+                vectors[i * self.batch_size:i * self.batch_size + len(result)] = result
+        return vectors
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Dict, List
+
+import numpy as np
+from keras import backend as K
+from keras.layers import Dense, Lambda
+from keras.models import Model
+
+ENCODER_OUTPUT_NAME = 'Encoder-{}-FeedForward-Norm'
+
+
+def encoder_layer_count(model: Model) -> int:
+    """
+    number of transformer blocks in a keras_bert backed model
+    :param model:
+    :return:
+    """
+    count = 0
+    while True:
+        try:
+            model.get_layer(ENCODER_OUTPUT_NAME.format(count + 1))
+        except ValueError:
+            return count
+        count += 1
+
+
+def encoder_output(model: Model, layer_index: int):
+    return model.get_layer(ENCODER_OUTPUT_NAME.format(layer_index)).get_output_at(0)
+
+
+def build_exit_model(model: Model,
+                     exit_layers: List[int],
+                     num_classes: int,
+                     activation: str = 'softmax') -> Model:
+    """
+    attach a lightweight classifier to the [CLS] vector of every exit layer
+    :param model: trained classification model with a keras_bert encoder
+    :param exit_layers: 1-based indexes of the encoder blocks to exit after
+    :param num_classes:
+    :param activation: softmax, or sigmoid for multi label task
+    :return: model from the bert inputs to one probability output per exit layer
+    """
+    outputs = []
+    for layer_index in exit_layers:
+        hidden = encoder_output(model, layer_index)
+        cls_vector = Lambda(lambda t: t[:, 0], name='exit_{}_cls'.format(layer_index))(hidden)
+        outputs.append(Dense(num_classes,
+                             activation=activation,
+                             name='exit_{}'.format(layer_index))(cls_vector))
+    return Model(model.inputs, outputs)
+
+
+def exit_head_layers(exit_model: Model, exit_layers: List[int]):
+    return [exit_model.get_layer('exit_{}'.format(layer_index)) for layer_index in exit_layers]
+
+
+EXIT_CRITERIA = ('confidence', 'entropy')
+
+
+def exit_mask(probs: np.ndarray,
+              threshold: float,
+              criterion: str = 'confidence',
+              multi_label: bool = False) -> np.ndarray:
+    """
+    decide which examples are confident enough to stop at the current layer
+    :param probs: exit classifier output, shape (batch, num_classes)
+    :param threshold: min confidence, or max entropy when criterion is `entropy`
+    :param criterion: `confidence` or `entropy`
+    :param multi_label: treat every output as an independent binary decision
+    :return: bool array, shape (batch,)
+    """
+    if criterion not in EXIT_CRITERIA:
+        raise ValueError('unknown early exit criterion `{}`'.format(criterion))
+    if multi_label:
+        probs = np.clip(probs, 1e-7, 1 - 1e-7)
+        if criterion == 'confidence':
+            return np.maximum(probs, 1 - probs).min(axis=-1) >= threshold
+        entropy = -(probs * np.log(probs) + (1 - probs) * np.log(1 - probs)).mean(axis=-1)
+        return entropy <= threshold
+
+    if criterion == 'confidence':
+        return probs.max(axis=-1) >= threshold
+    entropy = -(probs * np.log(np.clip(probs, 1e-7, 1.0))).sum(axis=-1)
+    return entropy <= threshold
+
+
+class EarlyExitRunner(object):
+    """
+    run a keras_bert classification model block by block and drop examples from the
+    batch as soon as one of the exit classifiers is confident about them.
+
+    Later blocks are evaluated by feeding the cached hidden state of the last exit layer
+    into the session, so tensorflow only computes the remaining part of the graph for
+    the examples still in the batch.
+    """
+
+    def __init__(self,
+                 model: Model,
+                 exit_model: Model,
+                 exit_layers: List[int],
+                 multi_label: bool = False):
+        self.model = model
+        self.exit_layers = list(exit_layers)
+        self.multi_label = multi_label
+        self.num_layers = encoder_layer_count(model)
+        self.hidden = [encoder_output(model, layer_index) for layer_index in self.exit_layers]
+        self.exit_outputs = exit_model.outputs
+        self.session = K.get_session()
+
+    def _run(self, fetches, inputs: List[np.ndarray], hidden=None, stage: int = 0):
+        feed_dict = dict(zip(self.model.inputs, inputs))
+        if hidden is not None:
+            feed_dict[self.hidden[stage - 1]] = hidden
+        if not isinstance(K.learning_phase(), int):
+            feed_dict[K.learning_phase()] = 0
+        return self.session.run(fetches, feed_dict=feed_dict)
+
+    def predict_on_batch(self,
+                         x: List[np.ndarray],
+                         threshold: float,
+                         criterion: str = 'confidence'):
+        """
+        :param x: bert model inputs, [token ids, segment ids]
+        :param threshold:
+        :param criterion:
+        :return: (probabilities, number of encoder blocks used by each example)
+        """
+        total = len(x[0])
+        result = None
+        layers_used = np.full(total, self.num_layers, dtype=np.int32)
+        remaining = np.arange(total)
+        hidden = None
+
+        for stage, layer_index in enumerate(self.exit_layers):
+            inputs = [item[remaining] for item in x]
+            hidden, probs = self._run([self.hidden[stage], self.exit_outputs[stage]],
+                                      inputs,
+                                      hidden,
+                                      stage)
+            if result is None:
+                result = np.zeros((total, probs.shape[-1]), dtype=probs.dtype)
+
+            exited = exit_mask(probs, threshold, criterion, self.multi_label)
+            result[remaining[exited]] = probs[exited]
+            layers_used[remaining[exited]] = layer_index
+
+            remaining = remaining[~exited]
+            hidden = hidden[~exited]
+            if len(remaining) == 0:
+                return result, layers_used
+
+        inputs = [item[remaining] for item in x]
+        probs = self._run(self.model.outputs[0], inputs, hidden, len(self.exit_layers))
+        if result is None:
+            result = np.zeros((total, probs.shape[-1]), dtype=probs.dtype)
+        result[remaining] = probs
+        return result, layers_used
+
+    def predict(self,
+                x: List[np.ndarray],
+                threshold: float,
+                criterion: str = 'confidence',
+                batch_size: int = None):
+        if batch_size is None:
+            batch_size = 32
+        results = []
+        layers_used = []
+        for start in range(0, len(x[0]), batch_size):
+            batch = [item[start: start + batch_size] for item in x]
+            probs, layers = self.predict_on_batch(batch, threshold, criterion)
+            results.append(probs)
+            layers_used.append(layers)
+        return np.concatenate(results, axis=0), np.concatenate(layers_used, axis=0)
+
+    def stats(self, layers_used: np.ndarray) -> Dict:
+        exit_counts = {}
+        for layer_index in self.exit_layers + [self.num_layers]:
+            exit_counts[layer_index] = int((layers_used == layer_index).sum())
+        stats = {
+            'average_layers': float(layers_used.mean()) if len(layers_used) else 0.0,
+            'total_layers': self.num_layers,
+            'exit_counts': exit_counts
+        }
+        logging.info('early exit: {:.2f}/{} encoder layers per example, exits: {}'.format(
+            stats['average_layers'], self.num_layers, exit_counts))
+        return stats
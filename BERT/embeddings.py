@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict
+
+import keras_bert
+from keras.models import Model
+
+from kashgari import macros as k
+from kashgari.embeddings import BERTEmbedding, CustomEmbedding
+from kashgari.type_hints import *
+from kashgari.utils import helper
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.vocabulary import StreamingTopK, bucket_hash
+
+
+class LazyBERTEmbedding(BERTEmbedding):
+    """
+    BERTEmbedding that reads the vocabulary and config up front but only loads the
+    checkpoint when `model` is first used, so tokenization and a cached model
+    (see :class:`model_cache.ModelCache`) never pay for building the BERT graph
+    """
+
+    def build(self):
+        self.embedding_type = 'bert'
+        url = self.pre_trained_models.get(self.model_key_map.get(self.name, self.name))
+        self.model_path = helper.cached_path(self.model_key_map.get(self.name, self.name),
+                                             url,
+                                             ['embedding', 'bert'])
+        with open(os.path.join(self.model_path, 'bert_config.json'), 'r', encoding='utf-8') as f:
+            self.embedding_size = json.load(f)['hidden_size']
+
+        dict_path = os.path.join(self.model_path, 'vocab.txt')
+        word2idx = {}
+        with open(dict_path, 'r', encoding='utf-8') as f:
+            words = f.read().splitlines()
+        for word in words:
+            word2idx[word] = len(word2idx)
+        for key, value in self.special_tokens.items():
+            word2idx[key] = word2idx[value]
+        self.token2idx = word2idx
+        self._model = None
+
+    @property
+    def model(self) -> Model:
+        if self._model is None:
+            config_path = os.path.join(self.model_path, 'bert_config.json')
+            check_point_path = os.path.join(self.model_path, 'bert_model.ckpt')
+            logging.info('loading bert model from {}\n'.format(self.model_path))
+            model = keras_bert.load_trained_model_from_checkpoint(config_path,
+                                                                  check_point_path,
+                                                                  seq_len=self.sequence_length)
+            output_layer = helper.NonMaskingLayer()(model.output)
+            self._model = Model(model.inputs, output_layer)
+        return self._model
+
+
+class HashingEmbedding(CustomEmbedding):
+    """
+    CustomEmbedding with a fixed number of rows: the special tokens, the `top_k` most frequent
+    words and `num_buckets` hash buckets shared by every other word (see
+    :class:`common.vocabulary.HashingTokenizer`). token2idx only holds the special tokens and
+    frequent words, bucket `b` is row `len(token2idx) + b`.
+    """
+
+    def __init__(self,
+                 name_or_path: str = 'hashing-embedding',
+                 sequence_length: int = None,
+                 embedding_size: int = None,
+                 num_buckets: int = 100000,
+                 top_k: int = 0,
+                 **kwargs):
+        """
+        :param name_or_path: just a name for the embedding
+        :param sequence_length: length of max sequence
+        :param embedding_size: embedding vector size
+        :param num_buckets: number of hash buckets
+        :param top_k: number of frequent words with their own row, 0 for pure hashing
+        :param kwargs:
+        """
+        self.num_buckets = num_buckets
+        self.top_k = top_k
+        super(HashingEmbedding, self).__init__(name_or_path, sequence_length, embedding_size, **kwargs)
+        self.embedding_type = 'hashing'
+
+    @classmethod
+    def from_info(cls, info: Dict[str, Any]):
+        embedding = cls(info['name'],
+                        sequence_length=info['sequence_length'],
+                        embedding_size=info['embedding_size'],
+                        num_buckets=info['num_buckets'],
+                        top_k=info['top_k'])
+        embedding.update(info)
+        return embedding
+
+    def update(self, info: Dict[str, Any]):
+        super(HashingEmbedding, self).update(info)
+        self.num_buckets = info['num_buckets']
+        self.top_k = info['top_k']
+
+    def info(self):
+        info = super(HashingEmbedding, self).info()
+        info['num_buckets'] = self.num_buckets
+        info['top_k'] = self.top_k
+        return info
+
+    @property
+    def token_count(self):
+        return len(self._token2idx) + self.num_buckets
+
+    def build_token2idx_dict(self, x_data: List[TextSeqType], min_count: int = 5):
+        if self.token2idx is None:
+            word2idx = self.base_dict.copy()
+            if self.top_k > 0:
+                counter = StreamingTopK(self.top_k)
+                for x_item in x_data:
+                    counter.update(x_item)
+                for word in counter.most_common():
+                    if counter.counts[word] >= min_count and word not in word2idx:
+                        word2idx[word] = len(word2idx)
+            self.token2idx = word2idx
+        self.build()
+
+    def token_to_index(self, token: str) -> int:
+        idx = self.token2idx.get(token)
+        if idx is not None:
+            return idx
+        return len(self.token2idx) + bucket_hash(token, self.num_buckets)
+
+    def tokenize(self,
+                 sentence: TextSeqInputType,
+                 add_bos_eos: bool = True) -> TokenSeqInputType:
+        is_list = isinstance(sentence[0], list)
+
+        def tokenize_sentence(text: TextSeqType) -> TokenSeqType:
+            tokens = [self.token_to_index(token) for token in text]
+            if add_bos_eos:
+                tokens = [self.token2idx[k.BOS]] + tokens + [self.token2idx[k.EOS]]
+            return tokens
+
+        if is_list:
+            return [tokenize_sentence(sen) for sen in sentence]
+        else:
+            return tokenize_sentence(sentence)
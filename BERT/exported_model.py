@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+from typing import Dict, List, Union
+
+import numpy as np
+from keras.preprocessing import sequence
+
+from kashgari import macros as k
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.vocabulary import bucket_hash
+
+
+def write_model_files(agent, export_path: str):
+    """
+    write the label/token dicts and model info of a ClassificationModel next to an exported model
+    :param agent: trained ClassificationModel
+    :param export_path:
+    :return:
+    """
+    os.makedirs(export_path, exist_ok=True)
+    with open(os.path.join(export_path, 'labels.json'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(agent.label2idx, indent=2, ensure_ascii=False))
+    with open(os.path.join(export_path, 'words.json'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(agent.token2idx, indent=2, ensure_ascii=False))
+    with open(os.path.join(export_path, 'model.json'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(agent.info(), indent=2, ensure_ascii=False))
+
+
+class ExportedClassificationModel(object):
+    """
+    lightweight predictor for a model exported from a ClassificationModel,
+    only reads the exported files and never builds the kashgari embedding or keras model
+    """
+
+    def __init__(self, model_path: str):
+        with open(os.path.join(model_path, 'labels.json'), 'r', encoding='utf-8') as f:
+            self.label2idx: Dict[str, int] = json.load(f)
+        with open(os.path.join(model_path, 'words.json'), 'r', encoding='utf-8') as f:
+            self.token2idx: Dict[str, int] = json.load(f)
+        with open(os.path.join(model_path, 'model.json'), 'r', encoding='utf-8') as f:
+            self.model_info = json.load(f)
+
+        self.idx2label = dict([(val, key) for (key, val) in self.label2idx.items()])
+        self.sequence_length = self.model_info['embedding']['sequence_length']
+        self.is_bert = self.model_info['embedding']['embedding_type'] == 'bert'
+        # HashingEmbedding: words outside token2idx go to hash buckets instead of UNK
+        self.num_buckets = self.model_info['embedding'].get('num_buckets') \
+            if self.model_info['embedding']['embedding_type'] == 'hashing' else None
+        self.multi_label = self.model_info['model_info'].get('multi_label', False)
+        self.model_path = model_path
+
+    @classmethod
+    def load_model(cls, model_path: str):
+        return cls(model_path)
+
+    def token_to_index(self, token: str) -> int:
+        idx = self.token2idx.get(token)
+        if idx is not None:
+            return idx
+        if self.num_buckets:
+            return len(self.token2idx) + bucket_hash(token, self.num_buckets)
+        return self.token2idx[k.UNK]
+
+    def tokenize(self, sentence: List[str]) -> List[int]:
+        tokens = [self.token_to_index(token) for token in sentence]
+        return [self.token2idx[k.BOS]] + tokens + [self.token2idx[k.EOS]]
+
+    def prepare_model_input(self, x_data: List[List[str]]) -> List[np.ndarray]:
+        padded_tokens = sequence.pad_sequences([self.tokenize(sentence) for sentence in x_data],
+                                               maxlen=self.sequence_length,
+                                               padding='post')
+        if self.is_bert:
+            return [padded_tokens, np.zeros(shape=(len(padded_tokens), self.sequence_length))]
+        return [padded_tokens]
+
+    def predict_raw(self, x: List[np.ndarray], batch_size: int = None) -> np.ndarray:
+        raise NotImplementedError()
+
+    def predict(self,
+                sentence: Union[List[str], List[List[str]]],
+                batch_size=None,
+                output_dict=False,
+                multi_label_threshold=0.6) -> Union[List[str], str, List[Dict], Dict]:
+        """
+        same interface and outputs as :meth:`ClassificationModel.predict`
+        """
+        is_list = not isinstance(sentence[0], str)
+        words_list = sentence if is_list else [sentence]
+        res = self.predict_raw(self.prepare_model_input(words_list), batch_size=batch_size or 32)
+
+        if output_dict:
+            results = []
+            for words, probs in zip(words_list, res):
+                candidates = [{'name': self.idx2label[int(idx)], 'confidence': float(probs[idx])}
+                              for idx in np.argsort(-probs)]
+                results.append({
+                    'words': words,
+                    'class': candidates[0],
+                    'class_candidates': candidates
+                })
+        elif self.multi_label:
+            results = [tuple(self.idx2label[int(idx)] for idx in np.where(probs >= multi_label_threshold)[0])
+                       for probs in res]
+        else:
+            results = [self.idx2label[int(idx)] for idx in res.argmax(-1)]
+
+        if is_list:
+            return results
+        return results[0]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""把训练好的ClassificationModel导出为冻结、裁剪后的推理graph，并用轻量的加载器推理"""
+import json
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.export import freeze_inference_graph
+from exported_model import ExportedClassificationModel, write_model_files
+
+tf.flags.DEFINE_string('model_dir', './model/cnn_bert_model', '已保存的模型目录')
+tf.flags.DEFINE_string('export_dir', './model/cnn_bert_inference', '推理graph的导出目录')
+tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated',
+                       'Data source for the positive data')
+tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf8.txt_updated',
+                       'Data source for the negative data')
+tf.flags.DEFINE_integer('batch_size', 32, '测试单次调用耗时的batch大小')
+tf.flags.DEFINE_integer('repeats', 50, '测试单次调用耗时的重复次数')
+FLAGS = tf.flags.FLAGS
+
+
+def export_inference_graph(agent, export_path: str) -> str:
+    """
+    :param agent: 训练好的ClassificationModel
+    :param export_path: 导出目录，可用 :class:`InferenceClassificationModel` 加载
+    :return:
+    """
+    graph_def, input_names, output_names = freeze_inference_graph(
+        agent.model,
+        custom_objects=agent.create_custom_objects(agent.info()))
+
+    write_model_files(agent, export_path)
+    with open(os.path.join(export_path, 'frozen_model.pb'), 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    with open(os.path.join(export_path, 'inference.json'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'inputs': input_names, 'outputs': output_names}, indent=2))
+    return export_path
+
+
+class InferenceClassificationModel(ExportedClassificationModel):
+    """
+    加载冻结的推理graph，不构建kashgari embedding和keras模型，
+    predict接口与ClassificationModel一致，每个batch只调用一次预先生成的session callable
+    """
+
+    def __init__(self, model_path: str, session_config: tf.ConfigProto = None):
+        super(InferenceClassificationModel, self).__init__(model_path)
+        with open(os.path.join(model_path, 'inference.json'), 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        graph_def = tf.GraphDef()
+        with open(os.path.join(model_path, 'frozen_model.pb'), 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.session = tf.Session(graph=self.graph, config=session_config)
+        self.inputs = [self.graph.get_tensor_by_name(name + ':0') for name in names['inputs']]
+        self.output = self.graph.get_tensor_by_name(names['outputs'][0] + ':0')
+        self._callable = self.session.make_callable(self.output, self.inputs)
+
+    def predict_raw(self, x: List[np.ndarray], batch_size: int = None) -> np.ndarray:
+        batch_size = batch_size or 32
+        results = []
+        for start in range(0, len(x[0]), batch_size):
+            batch = [item[start: start + batch_size].astype(tensor.dtype.as_numpy_dtype)
+                     for item, tensor in zip(x, self.inputs)]
+            results.append(self._callable(*batch))
+        return np.concatenate(results, axis=0)
+
+
+def main():
+    from base_model import ClassificationModel
+    from common.dataset import load_weibo_splits
+
+    agent = ClassificationModel.load_model(FLAGS.model_dir)
+    export_inference_graph(agent, FLAGS.export_dir)
+
+    _, _, (test_x, _) = load_weibo_splits(FLAGS.positive_data_file, FLAGS.negative_data_file)
+    batch = test_x[:FLAGS.batch_size]
+
+    start = time.time()
+    ClassificationModel.load_model(FLAGS.model_dir)
+    keras_startup = time.time() - start
+    start = time.time()
+    exported = InferenceClassificationModel.load_model(FLAGS.export_dir)
+    frozen_startup = time.time() - start
+
+    def latency(predict_fn):
+        predict_fn(batch)
+        start = time.time()
+        for _ in range(FLAGS.repeats):
+            predict_fn(batch)
+        return (time.time() - start) * 1000 / FLAGS.repeats
+
+    keras_latency = latency(lambda x: agent.predict(x, batch_size=FLAGS.batch_size))
+    frozen_latency = latency(lambda x: exported.predict(x, batch_size=FLAGS.batch_size))
+
+    agreement = np.mean(np.array(agent.predict(test_x)) == np.array(exported.predict(test_x)))
+    print('启动耗时：keras {:.2f}s, frozen graph {:.2f}s'.format(keras_startup, frozen_startup))
+    print('单次调用耗时：keras {:.2f}ms, frozen graph {:.2f}ms'.format(keras_latency, frozen_latency))
+    print('测试集预测一致率：{:.4f}'.format(agreement))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+import keras
+from keras.models import Model
+
+
+def model_cache_key(agent) -> str:
+    """
+    cache key of the model a ClassificationModel would build,
+    covers the architecture name, hyper parameters, embedding info, label count and vocabulary
+    :param agent: ClassificationModel with label2idx and token2idx ready
+    :return:
+    """
+    info = agent.info()
+    token_digest = hashlib.sha1()
+    if not agent.embedding.is_bert:
+        # bert vocabulary is fixed by the pre-trained model (part of the embedding info)
+        for token, idx in sorted(agent.token2idx.items(), key=lambda kv: kv[1]):
+            token_digest.update('{}\t{}\n'.format(token, idx).encode('utf-8'))
+    content = {
+        'keras': keras.__version__,
+        'architect_name': info['architect_name'],
+        'hyper_parameters': info['hyper_parameters'],
+        'embedding': info['embedding'],
+        'multi_label': info['model_info'].get('multi_label', False),
+        'num_labels': len(agent.label2idx),
+        'tokens': token_digest.hexdigest()
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ModelCache(object):
+    """
+    on-disk cache of freshly built and compiled keras models.
+
+    Each entry holds the graph, the initial weights and the optimizer config of one
+    `build_model` call, so a later job with the same key gets the compiled model with
+    `keras.models.load_model` instead of loading the BERT checkpoint and rebuilding the graph.
+    The task layers of a cache hit start from the same initial weights every time.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str, custom_objects: Dict = None) -> Optional[Model]:
+        model_file = os.path.join(self.entry_path(key), 'model.h5')
+        if not os.path.exists(model_file):
+            return None
+        logging.info('loading cached model {}'.format(model_file))
+        return keras.models.load_model(model_file, custom_objects=custom_objects)
+
+    def store(self, key: str, agent):
+        """
+        write the model of `agent` to the cache, the entry appears atomically
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            agent.model.save(os.path.join(tmp_dir, 'model.h5'))
+            with open(os.path.join(tmp_dir, 'model.json'), 'w', encoding='utf-8') as f:
+                f.write(json.dumps(agent.info(), indent=2, ensure_ascii=False))
+            try:
+                os.rename(tmp_dir, self.entry_path(key))
+            except OSError:
+                # 另一个任务已经写入了同样的条目
+                shutil.rmtree(tmp_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        logging.info('model cached to {}'.format(self.entry_path(key)))
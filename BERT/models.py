@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-import keras
+import os
+import sys
+
 from keras.layers import Bidirectional, Conv1D
 from keras.layers import Dense, Lambda, Flatten
 from keras.layers import Dropout, SpatialDropout1D
@@ -9,9 +11,26 @@ from keras.layers import concatenate
 from keras.models import Model
 
 from kashgari.layers import AttentionWeightedAverage, KMaxPooling, LSTMLayer, GRULayer
-from kashgari.tasks.classification.base_model import ClassificationModel
+from base_model import ClassificationModel
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.layers import FusedConvPool1D, FusedGRU, FusedLSTM, KMaxPooling1D
 
 
+def rnn_layers(backend):
+    """
+    LSTM and GRU layer classes of an `rnn_backend` hyper parameter
+    :param backend: `keras` for kashgari's LSTMLayer/GRULayer (CuDNN when enabled in kashgari),
+        `fused` for FusedLSTM/FusedGRU with the input projection batched over all steps (CPU)
+    :return: (lstm, gru)
+    """
+    if backend == 'keras':
+        return LSTMLayer, GRULayer
+    if backend == 'fused':
+        return FusedLSTM, FusedGRU
+    raise ValueError('unknown rnn_backend `{}`'.format(backend))
+
 
 class CNNModel(ClassificationModel):
     __architect_name__ = 'CNNModel'
@@ -51,18 +70,14 @@ class CNNModel(ClassificationModel):
         dense_1_layer = Dense(**self.hyper_parameters['dense_1_layer'])(max_pool_layer)
         dense_2_layer = Dense(len(self.label2idx), **self.hyper_parameters['activation_layer'])(dense_1_layer)
 
-        model = Model(base_model.inputs, dense_2_layer)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, dense_2_layer))
 
 
 class BLSTMModel(ClassificationModel):
     __architect_name__ = 'BLSTMModel'
     __base_hyper_parameters__ = {
+        # 'keras' or 'fused', see rnn_layers
+        'rnn_backend': 'keras',
         'lstm_layer': {
             'units': 256,
             'return_sequences': False
@@ -87,17 +102,12 @@ class BLSTMModel(ClassificationModel):
 
     def build_model(self):
         base_model = self.embedding.model
-        blstm_layer = Bidirectional(LSTMLayer(**self.hyper_parameters['lstm_layer']))(base_model.output)
+        lstm_layer, _ = rnn_layers(self.hyper_parameters.get('rnn_backend', 'keras'))
+        blstm_layer = Bidirectional(lstm_layer(**self.hyper_parameters['lstm_layer']))(base_model.output)
         dense_layer = Dense(len(self.label2idx), **self.hyper_parameters['activation_layer'])(blstm_layer)
         output_layers = [dense_layer]
 
-        model = Model(base_model.inputs, output_layers)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output_layers))
 
 
 class CNNLSTMModel(ClassificationModel):
@@ -142,13 +152,7 @@ class CNNLSTMModel(ClassificationModel):
                             **self.hyper_parameters['activation_layer'])(lstm_layer)
         output_layers = [dense_layer]
 
-        model = Model(base_model.inputs, output_layers)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output_layers))
 
 
 class AVCNNModel(ClassificationModel):
@@ -185,6 +189,8 @@ class AVCNNModel(ClassificationModel):
             'padding': 'valid',
             'activation': 'relu'
         },
+        # compute conv_0 ~ conv_3 and their poolings with one FusedConvPool1D layer
+        'fused_conv': False,
         # ---
         'attn_0': {},
         'avg_0': {},
@@ -246,47 +252,55 @@ class AVCNNModel(ClassificationModel):
     def build_model(self):
         base_model = self.embedding.model
         embedded_seq = SpatialDropout1D(**self.hyper_parameters['spatial_dropout'])(base_model.output)
-        conv_0 = Conv1D(**self.hyper_parameters['conv_0'])(embedded_seq)
-        conv_1 = Conv1D(**self.hyper_parameters['conv_1'])(embedded_seq)
-        conv_2 = Conv1D(**self.hyper_parameters['conv_2'])(embedded_seq)
-        conv_3 = Conv1D(**self.hyper_parameters['conv_3'])(embedded_seq)
-
-        maxpool_0 = GlobalMaxPooling1D()(conv_0)
-        attn_0 = AttentionWeightedAverage()(conv_0)
-        avg_0 = GlobalAveragePooling1D()(conv_0)
-
-        maxpool_1 = GlobalMaxPooling1D()(conv_1)
-        attn_1 = AttentionWeightedAverage()(conv_1)
-        avg_1 = GlobalAveragePooling1D()(conv_1)
-
-        maxpool_2 = GlobalMaxPooling1D()(conv_2)
-        attn_2 = AttentionWeightedAverage()(conv_2)
-        avg_2 = GlobalAveragePooling1D()(conv_2)
-
-        maxpool_3 = GlobalMaxPooling1D()(conv_3)
-        attn_3 = AttentionWeightedAverage()(conv_3)
-        avg_3 = GlobalAveragePooling1D()(conv_3)
-
-        v0_col = concatenate([maxpool_0, maxpool_1, maxpool_2, maxpool_3],
-                             **self.hyper_parameters['v0_col'])
-        v1_col = concatenate([attn_0, attn_1, attn_2, attn_3],
-                             **self.hyper_parameters['v1_col'])
-        v2_col = concatenate([avg_1, avg_2, avg_0, avg_3],
-                             **self.hyper_parameters['v2_col'])
-        merged_tensor = concatenate([v0_col, v1_col, v2_col],
-                                    **self.hyper_parameters['merged_tensor'])
+        if self.hyper_parameters.get('fused_conv'):
+            conv_params = [self.hyper_parameters['conv_{}'.format(i)] for i in range(4)]
+            fused = FusedConvPool1D.from_conv_params(conv_params,
+                                                     pooling=['max', 'attention', 'average'],
+                                                     name='fused_conv')(embedded_seq)
+            # 与下面逐层的计算图保持一致：average部分按分支1, 2, 0, 3的顺序拼接
+            total = sum(params['filters'] for params in conv_params)
+            offsets = [2 * total + sum(params['filters'] for params in conv_params[:i]) for i in range(5)]
+            avg = [Lambda(lambda t, start=offsets[i], end=offsets[i + 1]: t[:, start:end],
+                          name='fused_avg_{}'.format(i))(fused) for i in range(4)]
+            v01_col = Lambda(lambda t, end=2 * total: t[:, :end], name='fused_max_attn')(fused)
+            merged_tensor = concatenate([v01_col, avg[1], avg[2], avg[0], avg[3]],
+                                        **self.hyper_parameters['merged_tensor'])
+        else:
+            conv_0 = Conv1D(**self.hyper_parameters['conv_0'])(embedded_seq)
+            conv_1 = Conv1D(**self.hyper_parameters['conv_1'])(embedded_seq)
+            conv_2 = Conv1D(**self.hyper_parameters['conv_2'])(embedded_seq)
+            conv_3 = Conv1D(**self.hyper_parameters['conv_3'])(embedded_seq)
+
+            maxpool_0 = GlobalMaxPooling1D()(conv_0)
+            attn_0 = AttentionWeightedAverage()(conv_0)
+            avg_0 = GlobalAveragePooling1D()(conv_0)
+
+            maxpool_1 = GlobalMaxPooling1D()(conv_1)
+            attn_1 = AttentionWeightedAverage()(conv_1)
+            avg_1 = GlobalAveragePooling1D()(conv_1)
+
+            maxpool_2 = GlobalMaxPooling1D()(conv_2)
+            attn_2 = AttentionWeightedAverage()(conv_2)
+            avg_2 = GlobalAveragePooling1D()(conv_2)
+
+            maxpool_3 = GlobalMaxPooling1D()(conv_3)
+            attn_3 = AttentionWeightedAverage()(conv_3)
+            avg_3 = GlobalAveragePooling1D()(conv_3)
+
+            v0_col = concatenate([maxpool_0, maxpool_1, maxpool_2, maxpool_3],
+                                 **self.hyper_parameters['v0_col'])
+            v1_col = concatenate([attn_0, attn_1, attn_2, attn_3],
+                                 **self.hyper_parameters['v1_col'])
+            v2_col = concatenate([avg_1, avg_2, avg_0, avg_3],
+                                 **self.hyper_parameters['v2_col'])
+            merged_tensor = concatenate([v0_col, v1_col, v2_col],
+                                        **self.hyper_parameters['merged_tensor'])
         output = Dropout(**self.hyper_parameters['dropout'])(merged_tensor)
         output = Dense(**self.hyper_parameters['dense'])(output)
         output = Dense(len(self.label2idx),
                        **self.hyper_parameters['activation_layer'])(output)
 
-        model = Model(base_model.inputs, output)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output))
 
 
 class KMaxCNNModel(ClassificationModel):
@@ -323,6 +337,16 @@ class KMaxCNNModel(ClassificationModel):
             'padding': 'valid',
             'activation': 'relu'
         },
+        # compute conv_0 ~ conv_3 and their k-max poolings with one FusedConvPool1D layer
+        'fused_conv': False,
+        # batched: k-max pool conv_0 ~ conv_3 with one KMaxPooling1D layer instead of
+        #   four KMaxPooling + Flatten, needs the same k for maxpool_0 ~ maxpool_3
+        # keep_order: keep the k values in sequence order instead of value order,
+        #   changes the pooled features so it needs retraining
+        'kmax_pooling': {
+            'batched': False,
+            'keep_order': False
+        },
         'maxpool_0': {
             'k': 3
         },
@@ -367,32 +391,53 @@ class KMaxCNNModel(ClassificationModel):
     def build_model(self):
         base_model = self.embedding.model
         embedded_seq = SpatialDropout1D(**self.hyper_parameters['spatial_dropout'])(base_model.output)
-        conv_0 = Conv1D(**self.hyper_parameters['conv_0'])(embedded_seq)
-        conv_1 = Conv1D(**self.hyper_parameters['conv_1'])(embedded_seq)
-        conv_2 = Conv1D(**self.hyper_parameters['conv_2'])(embedded_seq)
-        conv_3 = Conv1D(**self.hyper_parameters['conv_3'])(embedded_seq)
-
-        maxpool_0 = KMaxPooling(**self.hyper_parameters['maxpool_0'])(conv_0)
-        # maxpool_0f = Reshape((-1,))(maxpool_0)
-        maxpool_0f = Flatten()(maxpool_0)
-        maxpool_1 = KMaxPooling(**self.hyper_parameters['maxpool_1'])(conv_1)
-        # maxpool_1f = Reshape((-1,))(maxpool_1)
-        maxpool_1f = Flatten()(maxpool_1)
-        maxpool_2 = KMaxPooling(**self.hyper_parameters['maxpool_2'])(conv_2)
-        # maxpool_2f = Reshape((-1,))(maxpool_2)
-        maxpool_2f = Flatten()(maxpool_2)
-        maxpool_3 = KMaxPooling(**self.hyper_parameters['maxpool_3'])(conv_3)
-        # maxpool_3f = Reshape((-1,))(maxpool_3)
-        maxpool_3f = Flatten()(maxpool_3)
-        # maxpool_0 = GlobalMaxPooling1D()(conv_0)
-        # maxpool_1 = GlobalMaxPooling1D()(conv_1)
-        # maxpool_2 = GlobalMaxPooling1D()(conv_2)
-        # maxpool_3 = GlobalMaxPooling1D()(conv_3)
-
-        # merged_tensor = concatenate([maxpool_0, maxpool_1, maxpool_2, maxpool_3],
-        #                            **self.hyper_parameters['merged_tensor'])
-        merged_tensor = concatenate([maxpool_0f, maxpool_1f, maxpool_2f, maxpool_3f],
-                                    **self.hyper_parameters['merged_tensor'])
+        kmax_pooling = self.hyper_parameters.get('kmax_pooling', {})
+        keep_order = kmax_pooling.get('keep_order', False)
+        if self.hyper_parameters.get('fused_conv') or kmax_pooling.get('batched'):
+            k_values = set(self.hyper_parameters['maxpool_{}'.format(i)]['k'] for i in range(4))
+            if len(k_values) != 1:
+                raise ValueError('fused_conv and batched k-max pooling need the same k '
+                                 'for maxpool_0 ~ maxpool_3')
+            k = k_values.pop()
+        if self.hyper_parameters.get('fused_conv'):
+            conv_params = [self.hyper_parameters['conv_{}'.format(i)] for i in range(4)]
+            merged_tensor = FusedConvPool1D.from_conv_params(conv_params,
+                                                             pooling=['kmax'],
+                                                             k=k,
+                                                             keep_order=keep_order,
+                                                             name='fused_conv')(embedded_seq)
+        elif kmax_pooling.get('batched'):
+            convs = [Conv1D(**self.hyper_parameters['conv_{}'.format(i)])(embedded_seq) for i in range(4)]
+            merged_tensor = KMaxPooling1D(k=k, keep_order=keep_order, name='kmax_pooling')(convs)
+        elif keep_order:
+            raise ValueError('keep_order needs fused_conv or batched k-max pooling')
+        else:
+            conv_0 = Conv1D(**self.hyper_parameters['conv_0'])(embedded_seq)
+            conv_1 = Conv1D(**self.hyper_parameters['conv_1'])(embedded_seq)
+            conv_2 = Conv1D(**self.hyper_parameters['conv_2'])(embedded_seq)
+            conv_3 = Conv1D(**self.hyper_parameters['conv_3'])(embedded_seq)
+
+            maxpool_0 = KMaxPooling(**self.hyper_parameters['maxpool_0'])(conv_0)
+            # maxpool_0f = Reshape((-1,))(maxpool_0)
+            maxpool_0f = Flatten()(maxpool_0)
+            maxpool_1 = KMaxPooling(**self.hyper_parameters['maxpool_1'])(conv_1)
+            # maxpool_1f = Reshape((-1,))(maxpool_1)
+            maxpool_1f = Flatten()(maxpool_1)
+            maxpool_2 = KMaxPooling(**self.hyper_parameters['maxpool_2'])(conv_2)
+            # maxpool_2f = Reshape((-1,))(maxpool_2)
+            maxpool_2f = Flatten()(maxpool_2)
+            maxpool_3 = KMaxPooling(**self.hyper_parameters['maxpool_3'])(conv_3)
+            # maxpool_3f = Reshape((-1,))(maxpool_3)
+            maxpool_3f = Flatten()(maxpool_3)
+            # maxpool_0 = GlobalMaxPooling1D()(conv_0)
+            # maxpool_1 = GlobalMaxPooling1D()(conv_1)
+            # maxpool_2 = GlobalMaxPooling1D()(conv_2)
+            # maxpool_3 = GlobalMaxPooling1D()(conv_3)
+
+            # merged_tensor = concatenate([maxpool_0, maxpool_1, maxpool_2, maxpool_3],
+            #                            **self.hyper_parameters['merged_tensor'])
+            merged_tensor = concatenate([maxpool_0f, maxpool_1f, maxpool_2f, maxpool_3f],
+                                        **self.hyper_parameters['merged_tensor'])
         # flatten = Reshape((-1,))(merged_tensor)
         # output = Dropout(**self.hyper_parameters['dropout'])(flatten)
         output = Dropout(**self.hyper_parameters['dropout'])(merged_tensor)
@@ -400,13 +445,7 @@ class KMaxCNNModel(ClassificationModel):
         output = Dense(len(self.label2idx),
                        **self.hyper_parameters['activation_layer'])(output)
 
-        model = Model(base_model.inputs, output)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output))
 
 
 class RCNNModel(ClassificationModel):
@@ -415,6 +454,8 @@ class RCNNModel(ClassificationModel):
         'spatial_dropout': {
             'rate': 0.2
         },
+        # 'keras' or 'fused', see rnn_layers
+        'rnn_backend': 'keras',
         'rnn_0': {
             'units': 64,
             'return_sequences': True
@@ -462,7 +503,8 @@ class RCNNModel(ClassificationModel):
     def build_model(self):
         base_model = self.embedding.model
         embedded_seq = SpatialDropout1D(**self.hyper_parameters['spatial_dropout'])(base_model.output)
-        rnn_0 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_0']))(embedded_seq)
+        _, gru_layer = rnn_layers(self.hyper_parameters.get('rnn_backend', 'keras'))
+        rnn_0 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_0']))(embedded_seq)
         conv_0 = Conv1D(**self.hyper_parameters['conv_0'])(rnn_0)
         maxpool = GlobalMaxPooling1D()(conv_0)
         attn = AttentionWeightedAverage()(conv_0)
@@ -475,13 +517,7 @@ class RCNNModel(ClassificationModel):
         output = Dense(len(self.label2idx),
                        **self.hyper_parameters['activation_layer'])(output)
 
-        model = Model(base_model.inputs, output)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output))
 
 
 class AVRNNModel(ClassificationModel):
@@ -490,6 +526,8 @@ class AVRNNModel(ClassificationModel):
         'spatial_dropout': {
             'rate': 0.25
         },
+        # 'keras' or 'fused', see rnn_layers
+        'rnn_backend': 'keras',
         'rnn_0': {
             'units': 60,
             'return_sequences': True
@@ -537,8 +575,9 @@ class AVRNNModel(ClassificationModel):
     def build_model(self):
         base_model = self.embedding.model
         embedded_seq = SpatialDropout1D(**self.hyper_parameters['spatial_dropout'])(base_model.output)
-        rnn_0 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_0']))(embedded_seq)
-        rnn_1 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_1']))(rnn_0)
+        _, gru_layer = rnn_layers(self.hyper_parameters.get('rnn_backend', 'keras'))
+        rnn_0 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_0']))(embedded_seq)
+        rnn_1 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_1']))(rnn_0)
         concat_rnn = concatenate([rnn_0, rnn_1],
                                  **self.hyper_parameters['concat_rnn'])
 
@@ -554,13 +593,7 @@ class AVRNNModel(ClassificationModel):
         output = Dense(len(self.label2idx),
                        **self.hyper_parameters['activation_layer'])(output)
 
-        model = Model(base_model.inputs, output)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output))
 
 
 class DropoutBGRUModel(ClassificationModel):
@@ -569,6 +602,8 @@ class DropoutBGRUModel(ClassificationModel):
         'spatial_dropout': {
             'rate': 0.15
         },
+        # 'keras' or 'fused', see rnn_layers
+        'rnn_backend': 'keras',
         'rnn_0': {
             'units': 64,
             'return_sequences': True
@@ -614,9 +649,10 @@ class DropoutBGRUModel(ClassificationModel):
     def build_model(self):
         base_model = self.embedding.model
         embedded_seq = SpatialDropout1D(**self.hyper_parameters['spatial_dropout'])(base_model.output)
-        rnn_0 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_0']))(embedded_seq)
+        _, gru_layer = rnn_layers(self.hyper_parameters.get('rnn_backend', 'keras'))
+        rnn_0 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_0']))(embedded_seq)
         dropout_rnn = Dropout(**self.hyper_parameters['dropout_rnn'])(rnn_0)
-        rnn_1 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_1']))(dropout_rnn)
+        rnn_1 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_1']))(dropout_rnn)
         last = Lambda(lambda t: t[:, -1], name='last')(rnn_1)
         maxpool = GlobalMaxPooling1D()(rnn_1)
         # attn = AttentionWeightedAverage()(rnn_1)
@@ -629,13 +665,7 @@ class DropoutBGRUModel(ClassificationModel):
         output = Dense(len(self.label2idx),
                        **self.hyper_parameters['activation_layer'])(output)
 
-        model = Model(base_model.inputs, output)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output))
 
 
 class DropoutAVRNNModel(ClassificationModel):
@@ -644,6 +674,8 @@ class DropoutAVRNNModel(ClassificationModel):
         'spatial_dropout': {
             'rate': 0.25
         },
+        # 'keras' or 'fused', see rnn_layers
+        'rnn_backend': 'keras',
         'rnn_0': {
             'units': 56,
             'return_sequences': True
@@ -694,9 +726,10 @@ class DropoutAVRNNModel(ClassificationModel):
     def build_model(self):
         base_model = self.embedding.model
         embedded_seq = SpatialDropout1D(**self.hyper_parameters['spatial_dropout'])(base_model.output)
-        rnn_0 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_0']))(embedded_seq)
+        _, gru_layer = rnn_layers(self.hyper_parameters.get('rnn_backend', 'keras'))
+        rnn_0 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_0']))(embedded_seq)
         rnn_dropout = SpatialDropout1D(**self.hyper_parameters['rnn_dropout'])(rnn_0)
-        rnn_1 = Bidirectional(GRULayer(**self.hyper_parameters['rnn_1']))(rnn_dropout)
+        rnn_1 = Bidirectional(gru_layer(**self.hyper_parameters['rnn_1']))(rnn_dropout)
 
         last = Lambda(lambda t: t[:, -1], name='last')(rnn_1)
         maxpool = GlobalMaxPooling1D()(rnn_1)
@@ -711,13 +744,7 @@ class DropoutAVRNNModel(ClassificationModel):
         output = Dense(len(self.label2idx),
                        **self.hyper_parameters['activation_layer'])(output)
 
-        model = Model(base_model.inputs, output)
-        optimizer = getattr(eval(self.hyper_parameters['optimizer']['module']),
-                            self.hyper_parameters['optimizer']['name'])(
-            **self.hyper_parameters['optimizer']['params'])
-        model.compile(optimizer=optimizer, **self.hyper_parameters['compile_params'])
-        self.model = model
-        self.model.summary()
+        self._compile_model(Model(base_model.inputs, output))
 
 
 if __name__ == '__main__':
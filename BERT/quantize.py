@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""把训练好的ClassificationModel量化为int8的TFLite模型，并报告准确率、模型大小和推理延迟的变化"""
+import json
+import os
+import random
+import sys
+from typing import List
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.quantization import TFLiteRunner, compare_int8, convert_to_int8, print_report
+from exported_model import ExportedClassificationModel, write_model_files
+
+tf.flags.DEFINE_string('model_dirs', './model/cnn_bert_model,./model/rcnn_bert_model,./model/cnnlstm_bert_model',
+                       '用逗号分隔的已保存模型目录')
+tf.flags.DEFINE_string('export_dir', './model/int8', '量化模型的导出目录')
+tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated',
+                       'Data source for the positive data')
+tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf8.txt_updated',
+                       'Data source for the negative data')
+tf.flags.DEFINE_integer('calibration_size', 500, '从训练集中抽取的校准样本数')
+tf.flags.DEFINE_integer('batch_size', 32, '测试延迟时的batch大小')
+FLAGS = tf.flags.FLAGS
+
+
+def model_inputs(agent, x: List[List[str]]) -> List[np.ndarray]:
+    """分词后的句子转换为模型输入，统一为ndarray列表"""
+    inputs = agent.prepare_model_input(x)
+    return inputs if isinstance(inputs, list) else [inputs]
+
+
+def export_quantized(agent, calibration_x: List[List[str]], export_path: str) -> str:
+    """
+    :param agent: 训练好的ClassificationModel
+    :param calibration_x: 校准用的分词后句子
+    :param export_path: 导出目录，可用 :class:`QuantizedClassificationModel` 加载
+    :return: int8模型（model.tflite）的路径
+    """
+    write_model_files(agent, export_path)
+    return convert_to_int8(agent.model,
+                           model_inputs(agent, calibration_x),
+                           os.path.join(export_path, 'model.tflite'),
+                           custom_objects=agent.create_custom_objects(agent.info()))
+
+
+class QuantizedClassificationModel(ExportedClassificationModel):
+    """在CPU上用TFLite解释器运行int8模型，predict接口与ClassificationModel一致"""
+
+    def __init__(self, model_path: str):
+        super(QuantizedClassificationModel, self).__init__(model_path)
+        self.runner = TFLiteRunner(os.path.join(model_path, 'model.tflite'))
+
+    def predict_raw(self, x: List[np.ndarray], batch_size: int = None) -> np.ndarray:
+        return self.runner.predict(x, batch_size=batch_size or 32)
+
+
+def main():
+    from base_model import ClassificationModel
+    from common.dataset import load_weibo_splits
+
+    (train_x, train_y), _, (test_x, test_y) = load_weibo_splits(FLAGS.positive_data_file,
+                                                                FLAGS.negative_data_file)
+    random.seed(10)
+    calibration_x = random.sample(train_x, FLAGS.calibration_size)
+
+    reports = []
+    for model_dir in FLAGS.model_dirs.split(','):
+        agent = ClassificationModel.load_model(model_dir)
+        with open(os.path.join(model_dir, 'model.json'), 'r', encoding='utf-8') as f:
+            name = json.load(f)['architect_name']
+        export_path = os.path.join(FLAGS.export_dir, os.path.basename(model_dir.rstrip('/')))
+        tflite_path = export_quantized(agent, calibration_x, export_path)
+        reports.append(compare_int8(agent.model,
+                                    model_inputs(agent, test_x),
+                                    agent.convert_label_to_idx(test_y),
+                                    tflite_path,
+                                    name=name,
+                                    batch_size=FLAGS.batch_size))
+    print_report(reports)
+
+
+if __name__ == '__main__':
+    main()
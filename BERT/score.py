@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+对每行一条微博的大文件批量打分，输出每行的 行号\\t类别\\t置信度。
+多台机器/多个进程用num_shards和shard_index分片；中断后用相同参数重新运行即从断点继续
+"""
+import logging
+import os
+import pickle
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.bulk_scoring import BulkScorer, available_cores
+from common.metrics import probabilities_to_labels
+
+tf.flags.DEFINE_string('input_file', '', '待打分的文件，每行一条')
+tf.flags.DEFINE_string('output_file', '', '结果文件，分片时每个分片写入 output_file.part-xxxxx-of-xxxxx')
+tf.flags.DEFINE_string('model_dir', './model/cnn_bert_model', 'ClassificationModel保存的目录，或inference_graph.py导出的目录')
+tf.flags.DEFINE_string('keras_model', '', '不为空时改为加载单独的keras模型（.h5），如Transformer_ATT_sentiment.py --model_path保存的模型')
+tf.flags.DEFINE_string('tokenizer_path', '', 'keras模型的词表，Transformer_ATT_sentiment.py --tokenizer_path保存的文件')
+tf.flags.DEFINE_integer('batch_size', 256, '每次调用模型的句子数')
+tf.flags.DEFINE_integer('workers', 0, '分词进程数，0为CPU核数减一')
+tf.flags.DEFINE_integer('chunk_size', 1000, '每个分词任务的句子数')
+tf.flags.DEFINE_integer('num_shards', 1, '分片总数')
+tf.flags.DEFINE_integer('shard_index', 0, '本进程处理的分片，行号除以num_shards余shard_index的行')
+FLAGS = tf.flags.FLAGS
+
+
+def classification_model_scorer(model_dir: str, batch_size: int):
+    if os.path.exists(os.path.join(model_dir, 'inference.json')):
+        from inference_graph import InferenceClassificationModel
+        agent = InferenceClassificationModel.load_model(model_dir)
+    else:
+        from base_model import ClassificationModel
+        agent = ClassificationModel.load_model(model_dir)
+
+    def score(words_list):
+        results = agent.predict(words_list, batch_size=batch_size, output_dict=True)
+        return [result['class']['name'] for result in results], [result['class']['confidence'] for result in results]
+
+    return score
+
+
+def keras_model_scorer(model_path: str, tokenizer_path: str, batch_size: int):
+    from keras.models import load_model
+    from keras.preprocessing.sequence import pad_sequences
+    from common.layers import custom_objects
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Transformer_ATT'))
+    from Transformer_Attention import custom_objects as attention_objects
+
+    model = load_model(model_path, custom_objects=dict(custom_objects, **attention_objects))
+    with open(tokenizer_path, 'rb') as f:
+        vocab = pickle.load(f)
+    max_len = model.input_shape[1] or vocab['max_len']
+
+    def score(words_list):
+        sequences = vocab['tokenizer'].texts_to_sequences([' '.join(words) for words in words_list])
+        x = pad_sequences(sequences, maxlen=max_len, padding=vocab['padding'], truncating=vocab['padding'])
+        if model.input_shape[1] is None and vocab['padding'] == 'post':
+            # 输入长度不固定（如Transformer）时截断到batch内最长的句子
+            x = x[:, :max(int((x != 0).sum(1).max()), 1)]
+        probs = model.predict(x, batch_size=batch_size)
+        labels = probabilities_to_labels(probs)
+        if probs.ndim == 1 or probs.shape[-1] == 1:
+            probs = probs.reshape(-1)
+            return labels, np.where(labels == 1, probs, 1 - probs)
+        return labels, probs.max(-1)
+
+    return score
+
+
+def main(_):
+    logging.basicConfig(level=logging.INFO)
+    # 先启动分词进程，再加载模型
+    scorer = BulkScorer(batch_size=FLAGS.batch_size, workers=FLAGS.workers, chunk_size=FLAGS.chunk_size)
+    if FLAGS.keras_model:
+        scorer.score = keras_model_scorer(FLAGS.keras_model, FLAGS.tokenizer_path, FLAGS.batch_size)
+    else:
+        scorer.score = classification_model_scorer(FLAGS.model_dir, FLAGS.batch_size)
+
+    result = scorer.run(FLAGS.input_file, FLAGS.output_file,
+                        shard_index=FLAGS.shard_index, num_shards=FLAGS.num_shards)
+    scorer.close()
+    print('{} posts in {:.1f}s: {:.0f} posts/s, {:.1f} posts/s per core ({} cores, {} segmentation workers)'.format(
+        result['posts'], result['seconds'], result['posts_per_second'], result['posts_per_second_per_core'],
+        available_cores(), scorer.workers))
+
+
+if __name__ == '__main__':
+    tf.app.run()
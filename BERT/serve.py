@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""加载保存的模型并启动HTTP推理服务，并发请求合并成micro-batch后一次调用model.predict，压测见benchmarks/bench_serving.py"""
+import logging
+import os
+import sys
+
+import tensorflow as tf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.serving import InferenceServer, MicroBatcher
+
+tf.flags.DEFINE_string('model_dir', './model/cnn_bert_model', 'ClassificationModel保存的目录，或inference_graph.py导出的目录')
+tf.flags.DEFINE_string('host', '0.0.0.0', '监听地址')
+tf.flags.DEFINE_integer('port', 8000, '监听端口')
+tf.flags.DEFINE_integer('max_batch_size', 32, '一个micro-batch最多的句子数，为1时每个请求单独调用一次模型')
+tf.flags.DEFINE_float('max_wait_ms', 5., 'batch中第一个句子最多等待其他句子的时间（毫秒）')
+tf.flags.DEFINE_integer('tokenize_workers', 2, 'jieba分词的进程数，0为在模型线程中分词')
+FLAGS = tf.flags.FLAGS
+
+
+def load_predictor(model_dir: str):
+    """
+    :return: 对一个batch的分词结果调用一次predict、返回每个句子的类别和置信度的函数
+    """
+    if os.path.exists(os.path.join(model_dir, 'inference.json')):
+        from inference_graph import InferenceClassificationModel
+        agent = InferenceClassificationModel.load_model(model_dir)
+        graph = agent.graph
+    else:
+        from base_model import ClassificationModel
+        agent = ClassificationModel.load_model(model_dir)
+        # keras模型在加载它的线程之外调用时，需要预先生成predict函数并指定graph
+        agent.model._make_predict_function()
+        graph = tf.get_default_graph()
+
+    def predict(words_list):
+        with graph.as_default():
+            return agent.predict(words_list, batch_size=len(words_list), output_dict=True)
+
+    return predict
+
+
+def main(_):
+    logging.basicConfig(level=logging.INFO)
+    # 先启动分词进程，再加载模型
+    batcher = MicroBatcher(None,
+                           max_batch_size=FLAGS.max_batch_size,
+                           max_wait_ms=FLAGS.max_wait_ms,
+                           tokenize_workers=FLAGS.tokenize_workers)
+    batcher.predict = load_predictor(FLAGS.model_dir)
+    InferenceServer(batcher, host=FLAGS.host, port=FLAGS.port).run_forever()
+
+
+if __name__ == '__main__':
+    tf.app.run()
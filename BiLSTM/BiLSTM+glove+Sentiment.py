@@ -19,6 +19,12 @@ from keras.models import Model
 from keras.layers import Dense, Dropout, Embedding, LSTM, Bidirectional
 
 
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.layers import FusedLSTM, custom_objects
+from common.metrics import binary_report
+from common.quantization import quantization_report, print_report
+
 #读取数据参数设置
 # tf.flags.DEFINE_float('dev_sample_percentage', .1, 'Percentage of the training data to use for validation')
 tf.flags.DEFINE_float("dev_sample_percentage", .1, "Percentage of the training data to use for validation")
@@ -27,6 +33,10 @@ tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf
 tf.flags.DEFINE_string('glove_dir', '../dataset/glove.6B.100d.txt', 'Data source for the pretrained glove word vector')
 tf.flags.DEFINE_integer('max_num_words', '40000', '出现频率最高的40000个词语保留在词表中')
 
+tf.flags.DEFINE_string('int8_export', '', '训练后导出int8量化TFLite模型的路径，为空时不导出')
+tf.flags.DEFINE_integer('calibration_size', '500', 'int8量化时使用的校准样本数')
+tf.flags.DEFINE_string('rnn_backend', 'keras', 'keras: keras.layers.LSTM; fused: 输入投影在整个序列上一次完成的FusedLSTM，CPU上更快')
+
 # FLAGS = tf.flags.FLAGS
 FLAGS = tf.flags.FLAGS
 
@@ -184,7 +194,8 @@ if __name__ == '__main__':
     sequence_input = Input(shape=(Max_Sequence_Length,), dtype=tf.int32)
     embeddings = embedding_layer(sequence_input)
 
-    x = Bidirectional(LSTM(64))(embeddings)
+    lstm_layer = FusedLSTM if FLAGS.rnn_backend == 'fused' else LSTM
+    x = Bidirectional(lstm_layer(64))(embeddings)
     x = Dropout(0.5)(x)
     preds = Dense(1, activation='sigmoid')(x)
     model = Model(sequence_input, preds)
@@ -193,3 +204,12 @@ if __name__ == '__main__':
 
     print('Train...')
     model.fit(x_train, y_train, batch_size=64, validation_data=[x_dev, y_dev], epochs=5, callbacks=[tf_board_callback])
+
+    print(binary_report(y_dev, model.predict(x_dev, batch_size=256)))
+
+    if FLAGS.int8_export:
+        print('Quantize...')
+        report = quantization_report(model, x_train[:FLAGS.calibration_size], x_dev, y_dev,
+                                     FLAGS.int8_export, name='BiLSTM+glove',
+                                     custom_objects=custom_objects)
+        print_report([report])
@@ -19,6 +19,14 @@ from keras.layers import Dense, Dropout, Embedding, LSTM, Bidirectional
 from keras.datasets import imdb
 
 
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.layers import FusedLSTM, custom_objects
+from common.metrics import binary_report
+from common.optimizers import LazyAdam
+from common.quantization import quantization_report, print_report
+from common.vocabulary import HashingTokenizer, PrunedTokenizer
+
 #读取数据参数设置
 # tf.flags.DEFINE_float('dev_sample_percentage', .1, 'Percentage of the training data to use for validation')
 tf.flags.DEFINE_float("dev_sample_percentage", .1, "Percentage of the training data to use for validation")
@@ -27,6 +35,15 @@ tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf
 tf.flags.DEFINE_string('glove_dir', '../dataset/glove.6B.100d.txt', 'Data source for the pretrained glove word vector')
 tf.flags.DEFINE_integer('max_num_words', '40000', '出现频率最高的40000个词语保留在词表中')
 
+tf.flags.DEFINE_string('int8_export', '', '训练后导出int8量化TFLite模型的路径，为空时不导出')
+tf.flags.DEFINE_integer('calibration_size', '500', 'int8量化时使用的校准样本数')
+tf.flags.DEFINE_string('rnn_backend', 'keras', 'keras: keras.layers.LSTM; fused: 输入投影在整个序列上一次完成的FusedLSTM，CPU上更快')
+tf.flags.DEFINE_integer('hash_buckets', '0', '大于0时使用哈希词表：词语按哈希落入固定数目的桶，embedding矩阵行数与语料无关')
+tf.flags.DEFINE_integer('hash_top_k', '0', '哈希词表中单独占一行的高频词数目')
+tf.flags.DEFINE_integer('min_count', '1', '出现次数少于min_count的词语不进入词表')
+tf.flags.DEFINE_integer('oov_buckets', '100', '词表之外的词语按哈希落入的桶数，为0时直接丢弃')
+tf.flags.DEFINE_boolean('lazy_adam', False, '使用LazyAdam：embedding矩阵只更新batch中出现过的行')
+
 # FLAGS = tf.flags.FLAGS
 FLAGS = tf.flags.FLAGS
 
@@ -78,12 +95,21 @@ def construct_dataset():
     # #x:每一个句子中的单词对应词汇表的位置,word2id
     # x = np.array(list(vocab_processor.fit_transform(x_text)))
 
-    tokenizer = Tokenizer()
+    if FLAGS.hash_buckets > 0:
+        tokenizer = HashingTokenizer(FLAGS.hash_buckets, top_k=FLAGS.hash_top_k)
+    elif FLAGS.max_num_words > 0:
+        tokenizer = PrunedTokenizer(FLAGS.max_num_words, min_count=FLAGS.min_count, oov_buckets=FLAGS.oov_buckets)
+    else:
+        tokenizer = Tokenizer()
     tokenizer.fit_on_texts(x_text)
     sequences = tokenizer.texts_to_sequences(x_text)
 
     word_index = tokenizer.word_index
     print('词表大小：', len(word_index))
+    vocab_size = len(word_index) + 1 if isinstance(tokenizer, Tokenizer) else tokenizer.vocab_size
+    print('embedding矩阵行数：', vocab_size)
+    if isinstance(tokenizer, PrunedTokenizer):
+        print(tokenizer.summary(128))
 
     x = pad_sequences(sequences, maxlen=max_sentence_length)
 
@@ -127,11 +153,11 @@ def construct_dataset():
     print('y的数据类型：', type(y_train[1]))
 
     # return x_train, x_dev, y_train, y_dev, vocab_processor
-    return x_train, y_train, x_dev, y_dev, word_index
+    return x_train, y_train, x_dev, y_dev, vocab_size
 
 if __name__ == '__main__':
     print('Load dataset...')
-    x_train, y_train, x_dev, y_dev, word_index = construct_dataset()
+    x_train, y_train, x_dev, y_dev, vocab_size = construct_dataset()
     Max_Sequence_Length = x_train.shape[1]
     print('Max_Sequence_Length: ', Max_Sequence_Length) #202
     print('x_train.shape: ', np.shape(x_train))
@@ -143,18 +169,28 @@ if __name__ == '__main__':
     maxlen = Max_Sequence_Length
     batch_size = 32
 
+    lstm_layer = FusedLSTM if FLAGS.rnn_backend == 'fused' else LSTM
     model = Sequential()
-    model.add(Embedding(len(word_index)+1, 128, input_length=maxlen))
-    model.add(Bidirectional(LSTM(64)))
+    model.add(Embedding(vocab_size, 128, input_length=maxlen))
+    model.add(Bidirectional(lstm_layer(64)))
     model.add(Dropout(0.5))
     model.add(Dense(1, activation='sigmoid'))
 
     # try using different optimizers and different optimizer configs
-    model.compile('adam', 'binary_crossentropy', metrics=['accuracy'])
+    model.compile(LazyAdam() if FLAGS.lazy_adam else 'adam', 'binary_crossentropy', metrics=['accuracy'])
 
     print('Train...')
     model.fit(x_train, y_train,
               batch_size=batch_size,
               epochs=4,
               validation_data=[x_dev, y_dev],
-              callbacks=[tf_board_callback])
\ No newline at end of file
+              callbacks=[tf_board_callback])
+
+    print(binary_report(y_dev, model.predict(x_dev, batch_size=256)))
+
+    if FLAGS.int8_export:
+        print('Quantize...')
+        report = quantization_report(model, x_train[:FLAGS.calibration_size], x_dev, y_dev,
+                                     FLAGS.int8_export, name='BiLSTM+random',
+                                     custom_objects=custom_objects)
+        print_report([report])
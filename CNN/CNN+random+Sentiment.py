@@ -16,6 +16,14 @@ from keras.layers import Dense, Dropout, Activation
 from keras.layers import Embedding
 from keras.layers import Conv1D, GlobalMaxPooling1D
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.metrics import binary_report
+from common.optimizers import LazyAdam
+from common.quantization import quantization_report, print_report
+from common.vocabulary import HashingTokenizer, PrunedTokenizer
+
 #读取数据参数设置
 # tf.flags.DEFINE_float('dev_sample_percentage', .1, 'Percentage of the training data to use for validation')
 tf.flags.DEFINE_float("dev_sample_percentage", .1, "Percentage of the training data to use for validation")
@@ -29,6 +37,14 @@ tf.flags.DEFINE_integer('hidden_dims', '250', '全连阶层的单元数目')
 tf.flags.DEFINE_integer('epochs', '5', 'The number of epoch')
 tf.flags.DEFINE_integer('batch_size', '64', '批量大小')
 
+tf.flags.DEFINE_string('int8_export', '', '训练后导出int8量化TFLite模型的路径，为空时不导出')
+tf.flags.DEFINE_integer('calibration_size', '500', 'int8量化时使用的校准样本数')
+tf.flags.DEFINE_integer('hash_buckets', '0', '大于0时使用哈希词表：词语按哈希落入固定数目的桶，embedding矩阵行数与语料无关')
+tf.flags.DEFINE_integer('hash_top_k', '0', '哈希词表中单独占一行的高频词数目')
+tf.flags.DEFINE_integer('max_num_words', '40000', '出现频率最高的40000个词语保留在词表中')
+tf.flags.DEFINE_integer('min_count', '1', '出现次数少于min_count的词语不进入词表')
+tf.flags.DEFINE_integer('oov_buckets', '100', '词表之外的词语按哈希落入的桶数，为0时直接丢弃')
+tf.flags.DEFINE_boolean('lazy_adam', False, '使用LazyAdam：embedding矩阵只更新batch中出现过的行')
 
 # FLAGS = tf.flags.FLAGS
 FLAGS = tf.flags.FLAGS
@@ -81,12 +97,21 @@ def construct_dataset():
     # #x:每一个句子中的单词对应词汇表的位置,word2id
     # x = np.array(list(vocab_processor.fit_transform(x_text)))
 
-    tokenizer = Tokenizer()
+    if FLAGS.hash_buckets > 0:
+        tokenizer = HashingTokenizer(FLAGS.hash_buckets, top_k=FLAGS.hash_top_k)
+    elif FLAGS.max_num_words > 0:
+        tokenizer = PrunedTokenizer(FLAGS.max_num_words, min_count=FLAGS.min_count, oov_buckets=FLAGS.oov_buckets)
+    else:
+        tokenizer = Tokenizer()
     tokenizer.fit_on_texts(x_text)
     sequences = tokenizer.texts_to_sequences(x_text)
 
     word_index = tokenizer.word_index
     print('词表大小：', len(word_index))
+    vocab_size = len(word_index) + 1 if isinstance(tokenizer, Tokenizer) else tokenizer.vocab_size
+    print('embedding矩阵行数：', vocab_size)
+    if isinstance(tokenizer, PrunedTokenizer):
+        print(tokenizer.summary(FLAGS.embedding_dims))
 
     x = pad_sequences(sequences, maxlen=max_sentence_length)
 
@@ -130,11 +155,11 @@ def construct_dataset():
     print('y的数据类型：', type(y_train[1]))
 
     # return x_train, x_dev, y_train, y_dev, vocab_processor
-    return x_train, y_train, x_dev, y_dev, word_index
+    return x_train, y_train, x_dev, y_dev, vocab_size
 
 if __name__ == '__main__':
     print('Load dataset...')
-    x_train, y_train, x_dev, y_dev, word_index = construct_dataset()
+    x_train, y_train, x_dev, y_dev, vocab_size = construct_dataset()
     Max_Sequence_Length = x_train.shape[1]
     print('Max_Sequence_Length: ', Max_Sequence_Length) #202
     print('x_train.shape: ', np.shape(x_train))
@@ -144,7 +169,7 @@ if __name__ == '__main__':
 
     # we start off with an efficient embedding layer which maps
     # our vocab indices into embedding_dims dimensions
-    model.add(Embedding(len(word_index)+1,
+    model.add(Embedding(vocab_size,
                         FLAGS.embedding_dims,
                         input_length=Max_Sequence_Length))
     model.add(Dropout(0.2))
@@ -169,7 +194,7 @@ if __name__ == '__main__':
     model.add(Activation('sigmoid'))
 
     model.compile(loss='binary_crossentropy',
-                  optimizer='adam',
+                  optimizer=LazyAdam() if FLAGS.lazy_adam else 'adam',
                   metrics=['accuracy'])
     model.fit(x_train, y_train,
               batch_size=FLAGS.batch_size,
@@ -177,3 +202,10 @@ if __name__ == '__main__':
               validation_data=(x_dev, y_dev),
               callbacks=[tf_board_callback])
 
+    print(binary_report(y_dev, model.predict(x_dev, batch_size=256)))
+
+    if FLAGS.int8_export:
+        print('Quantize...')
+        report = quantization_report(model, x_train[:FLAGS.calibration_size], x_dev, y_dev,
+                                     FLAGS.int8_export, name='CNN+random')
+        print_report([report])
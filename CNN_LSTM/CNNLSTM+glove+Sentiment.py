@@ -16,6 +16,12 @@ from keras.models import Model
 import keras
 tf_board_callback = keras.callbacks.TensorBoard(log_dir='./logs', histogram_freq=1000, write_graph=True, write_images=False, embeddings_freq=0, embeddings_layer_names=None, embeddings_metadata=None)
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.metrics import binary_report
+from common.quantization import quantization_report, print_report
+
 #读取数据参数设置
 # tf.flags.DEFINE_float('dev_sample_percentage', .1, 'Percentage of the training data to use for validation')
 tf.flags.DEFINE_float("dev_sample_percentage", .1, "Percentage of the training data to use for validation")
@@ -30,6 +36,8 @@ tf.flags.DEFINE_integer('lstm_output_size', '70', '单向LSTM网络的单元数
 tf.flags.DEFINE_integer('epochs', '5', 'The number of epoch')
 tf.flags.DEFINE_integer('batch_size', '64', '批量大小')
 
+tf.flags.DEFINE_string('int8_export', '', '训练后导出int8量化TFLite模型的路径，为空时不导出')
+tf.flags.DEFINE_integer('calibration_size', '500', 'int8量化时使用的校准样本数')
 
 # FLAGS = tf.flags.FLAGS
 FLAGS = tf.flags.FLAGS
@@ -214,3 +222,11 @@ if __name__ == '__main__':
     score, acc = model.evaluate(x_dev, y_dev, batch_size=FLAGS.batch_size)
     print('Test score:', score)
     print('Test accuracy:', acc)
+
+    print(binary_report(y_dev, model.predict(x_dev, batch_size=256)))
+
+    if FLAGS.int8_export:
+        print('Quantize...')
+        report = quantization_report(model, x_train[:FLAGS.calibration_size], x_dev, y_dev,
+                                     FLAGS.int8_export, name='CNNLSTM+glove')
+        print_report([report])
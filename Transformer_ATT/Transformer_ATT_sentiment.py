@@ -7,15 +7,21 @@ from tensorflow.contrib import learn
 import tensorflow as tf
 from sklearn.model_selection import train_test_split
 import os
+import pickle
 import keras
 tf_board_callback = keras.callbacks.TensorBoard(log_dir='./logs', histogram_freq=1000, write_graph=True, write_images=False, embeddings_freq=0, embeddings_layer_names=None, embeddings_metadata=None)
 
 from keras.models import Model
-from keras.layers import Embedding, Input, GlobalAveragePooling1D, Dropout, Dense
+from keras.layers import Embedding, Input, Dropout, Dense
 from keras.initializers import Constant
 from keras.preprocessing.text import Tokenizer
 from keras.preprocessing.sequence import pad_sequences
-from Transformer_Attention import Position_Embedding, Attention
+from Transformer_Attention import Position_Embedding, Attention, Sequence_Length, Masked_Average_Pooling
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.dataset import LengthTrimmedBatches
+from common.metrics import binary_report
 
 #读取数据参数设置
 # tf.flags.DEFINE_float('dev_sample_percentage', .1, 'Percentage of the training data to use for validation')
@@ -24,6 +30,14 @@ tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf
 tf.flags.DEFINE_string('negative_data_file', '../dataset//weibo60000/neg60000_utf8.txt_updated', 'Data source for the negative data')
 tf.flags.DEFINE_string('glove_dir', '../dataset/glove.6B.100d.txt', 'Data source for the pretrained glove word vector')
 tf.flags.DEFINE_integer('max_num_words', '40000', '出现频率最高的40000个词语保留在词表中')
+tf.flags.DEFINE_integer('batch_size', '128', '批量大小')
+tf.flags.DEFINE_integer('epochs', '50', 'The number of epoch')
+tf.flags.DEFINE_boolean('trim_batches', True, '每个batch截断到batch内最长句子的长度，padding部分不参与attention计算')
+tf.flags.DEFINE_integer('bucket_size', '0', '大于0时在每bucket_size个样本内按长度排序后再分batch，进一步减少padding')
+tf.flags.DEFINE_string('attention_mode', 'full', 'full/linear/local，长文本用linear或local，计算量与序列长度成正比')
+tf.flags.DEFINE_integer('attention_window', '64', 'local attention中每个位置前后可见的位置数')
+tf.flags.DEFINE_string('model_path', '', '训练后保存模型的路径（供prune_heads.py剪枝），为空时不保存')
+tf.flags.DEFINE_string('tokenizer_path', '', '保存词表和补齐方式的路径（供BERT/score.py对模型批量打分），为空时不保存')
 
 # FLAGS = tf.flags.FLAGS
 FLAGS = tf.flags.FLAGS
@@ -83,7 +97,11 @@ def construct_dataset():
     word_index = tokenizer.word_index
     print('词表大小：', len(word_index))
 
-    x = pad_sequences(sequences, maxlen=max_sentence_length)
+    # 在末尾补齐，Sequence_Length/Attention的mask按前seq_len个位置有效处理
+    x = pad_sequences(sequences, maxlen=max_sentence_length, padding='post', truncating='post')
+    if FLAGS.tokenizer_path:
+        with open(FLAGS.tokenizer_path, 'wb') as f:
+            pickle.dump({'tokenizer': tokenizer, 'max_len': max_sentence_length, 'padding': 'post'}, f)
 
     print('词汇表建立完毕！')
     print('len(x):',len(x))
@@ -141,7 +159,7 @@ def load_glove_model():
     print('Found %s word vectors.' % len(embeddings_index))
     return embeddings_index
 
-def word_embedding(Max_Sequence_Length, embedding_dim, word_index):
+def word_embedding(embedding_dim, word_index):
     # prepare embedding matrix
     # num_words = min(MAX_NUM_WORDS, len(word_index)) + 1
     num_words = len(word_index) + 1
@@ -159,8 +177,8 @@ def word_embedding(Max_Sequence_Length, embedding_dim, word_index):
     # note that we set trainable = False so as to keep the embeddings fixed
     embedding_layer = Embedding(num_words,
                                 embedding_dim,
-                                embeddings_initializer=Constant(embedding_matrix),
-                                input_length=Max_Sequence_Length,
+                                # 用weights而不是Constant初始化，否则保存模型时embedding矩阵会写进模型配置
+                                weights=[embedding_matrix],
                                 trainable=False)
     return embedding_layer
 
@@ -177,14 +195,18 @@ if __name__ == '__main__':
     embedding_dim = 100
     # print(word_index)
 
-    embedding_layer = word_embedding(Max_Sequence_Length, embedding_dim, word_index)
+    embedding_layer = word_embedding(embedding_dim, word_index)
 
-    sequence_input = Input(shape=(Max_Sequence_Length,), dtype=tf.int32)
+    # 序列长度不固定，每个batch可以截断到batch内最长句子的长度
+    sequence_input = Input(shape=(None,), dtype=tf.int32)
+    seq_len = Sequence_Length()(sequence_input)
     embeddings = embedding_layer(sequence_input)
 
-    embeddings = Position_Embedding()(embeddings)  # 增加Position_Embedding能轻微提高准确率
-    O_seq = Attention(8, 16)([embeddings, embeddings, embeddings])
-    O_seq = GlobalAveragePooling1D()(O_seq)
+    embeddings = Position_Embedding(max_len=Max_Sequence_Length)(embeddings)  # 增加Position_Embedding能轻微提高准确率
+    # 传入Q_len/V_len，padding位置既不作为key参与attention，输出也被置零
+    O_seq = Attention(8, 16, mode=FLAGS.attention_mode, window=FLAGS.attention_window)(
+        [embeddings, embeddings, embeddings, seq_len, seq_len])
+    O_seq = Masked_Average_Pooling()([O_seq, seq_len])
     O_seq = Dropout(0.5)(O_seq)
     outputs = Dense(1, activation='sigmoid')(O_seq)
 
@@ -196,8 +218,23 @@ if __name__ == '__main__':
 
     print('Train...')
 
-    model.fit(x_train, y_train,
-            batch_size=128,
-            epochs=50,
-            validation_data=(x_dev, y_dev),
-            callbacks=[tf_board_callback])
+    if FLAGS.trim_batches:
+        train_batches = LengthTrimmedBatches(x_train, y_train, FLAGS.batch_size, bucket_size=FLAGS.bucket_size)
+        print('截断后参与计算的位置比例：{:.3f}'.format(train_batches.computed_fraction()))
+        # TensorBoard画直方图时验证集不能是generator，验证集仍按补齐后的数组传入，mask保证结果相同
+        model.fit_generator(train_batches,
+                            epochs=FLAGS.epochs,
+                            validation_data=(x_dev, y_dev),
+                            callbacks=[tf_board_callback])
+    else:
+        model.fit(x_train, y_train,
+                batch_size=FLAGS.batch_size,
+                epochs=FLAGS.epochs,
+                validation_data=(x_dev, y_dev),
+                callbacks=[tf_board_callback])
+
+    print(binary_report(y_dev, model.predict(x_dev, batch_size=FLAGS.batch_size)))
+
+    if FLAGS.model_path:
+        model.save(FLAGS.model_path)
+        print('模型已保存至', FLAGS.model_path)
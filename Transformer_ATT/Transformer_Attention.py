@@ -1,32 +1,39 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
+import tensorflow as tf
 from keras import backend as K
 from keras.engine.topology import Layer
 
 
 class Position_Embedding(Layer):
 
-    def __init__(self, size=None, mode='sum', **kwargs):
+    def __init__(self, size=None, mode='sum', max_len=None, **kwargs):
         self.size = size  # 必须为偶数
         self.mode = mode
+        self.max_len = max_len  # 位置编码表的最大长度，默认取输入的序列长度（变长输入时为2048）
         super(Position_Embedding, self).__init__(**kwargs)
 
-    def call(self, x):
+    def build(self, input_shape):
         if (self.size == None) or (self.mode == 'sum'):
-            self.size = int(x.shape[-1])
+            self.size = int(input_shape[-1])
+        if self.max_len is None:
+            self.max_len = input_shape[1] if input_shape[1] is not None else 2048
+        # sin/cos表只在构图时计算一次，call时按实际序列长度切片
+        position_j = 1. / np.power(10000., 2 * np.arange(self.size / 2, dtype='float32') / self.size)
+        position_i = np.arange(self.max_len, dtype='float32')
+        position_ij = np.outer(position_i, position_j.astype('float32')).astype('float32')
+        table = np.concatenate([np.cos(position_ij), np.sin(position_ij)], 1)
+        self.table = K.constant(table, dtype='float32')
+        super(Position_Embedding, self).build(input_shape)
+
+    def call(self, x):
         batch_size, seq_len = K.shape(x)[0], K.shape(x)[1]
-        position_j = 1. / K.pow(10000., \
-                                2 * K.arange(self.size / 2, dtype='float32' \
-                                             ) / self.size)
-        position_j = K.expand_dims(position_j, 0)
-        position_i = K.cumsum(K.ones_like(x[:, :, 0]), 1) - 1  # K.arange不支持变长，只好用这种方法生成
-        position_i = K.expand_dims(position_i, 2)
-        position_ij = K.dot(position_i, position_j)
-        position_ij = K.concatenate([K.cos(position_ij), K.sin(position_ij)], 2)
+        position_ij = K.expand_dims(self.table[:seq_len], 0)
         if self.mode == 'sum':
             return position_ij + x
         elif self.mode == 'concat':
-            return K.concatenate([position_ij, x], 2)
+            return K.concatenate([K.tile(position_ij, [batch_size, 1, 1]), x], 2)
 
     def compute_output_shape(self, input_shape):
         if self.mode == 'sum':
@@ -34,13 +41,52 @@ class Position_Embedding(Layer):
         elif self.mode == 'concat':
             return (input_shape[0], input_shape[1], input_shape[2] + self.size)
 
+    def get_config(self):
+        config = {
+            'size': self.size,
+            'mode': self.mode,
+            'max_len': self.max_len
+        }
+        base_config = super(Position_Embedding, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class Sequence_Length(Layer):
+    """post-padding的词id序列 -> 每个样本的实际长度，形状为(batch, 1)，作为Attention的Q_len/V_len"""
+
+    def call(self, x):
+        return K.sum(K.cast(K.not_equal(x, 0), 'int32'), 1, keepdims=True)
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], 1)
+
+
+class Masked_Average_Pooling(Layer):
+    """只对前seq_len个位置求平均的GlobalAveragePooling1D，输入为[seq, seq_len]"""
+
+    def call(self, x):
+        seq, seq_len = x
+        mask = K.expand_dims(K.cast(K.arange(K.shape(seq)[1])[None, :] < seq_len, K.floatx()), 2)
+        return K.sum(seq * mask, 1) / K.maximum(K.sum(mask, 1), 1.)
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0][0], input_shape[0][-1])
+
 
 class Attention(Layer):
 
-    def __init__(self, nb_head, size_per_head, **kwargs):
+    def __init__(self, nb_head, size_per_head, fused_qkv=True, mode='full', window=64, **kwargs):
         self.nb_head = nb_head
         self.size_per_head = size_per_head
         self.output_dim = nb_head * size_per_head
+        self.fused_qkv = fused_qkv  # Q、K、V为同一个张量时用一次矩阵乘法完成三个线性变换
+        # full: 标准的softmax attention，计算量与序列长度的平方成正比
+        # linear: elu(x)+1核函数的线性attention，先算K^T V，计算量与序列长度成正比
+        # local: 每个位置只attend前后window个位置，按window大小分块计算，计算量与序列长度成正比
+        if mode not in ('full', 'linear', 'local'):
+            raise ValueError('mode must be one of full, linear, local')
+        self.mode = mode
+        self.window = window
         super(Attention, self).__init__(**kwargs)
 
     def build(self, input_shape):
@@ -71,6 +117,18 @@ class Attention(Layer):
             if mode == 'add':
                 return inputs - (1 - mask) * 1e12
 
+    def Key_Mask(self, A, seq_len):
+        """A的形状为(batch, head, q, k)，直接在最后一维上mask掉多余的key，不需要来回转置"""
+        if seq_len == None:
+            return A
+        mask = K.one_hot(seq_len[:, 0], K.shape(A)[-1])
+        mask = 1 - K.cumsum(mask, 1)
+        mask = K.expand_dims(K.expand_dims(mask, 1), 1)
+        return A - (1 - mask) * 1e12
+
+    def heads(self, seq):
+        return K.reshape(seq, (-1, K.shape(seq)[1], self.nb_head, self.size_per_head))
+
     def call(self, x):
         # 如果只传入Q_seq,K_seq,V_seq，那么就不做Mask
         # 如果同时传入Q_seq,K_seq,V_seq,Q_len,V_len，那么对多余部分做Mask
@@ -79,28 +137,93 @@ class Attention(Layer):
             Q_len, V_len = None, None
         elif len(x) == 5:
             Q_seq, K_seq, V_seq, Q_len, V_len = x
-        # 对Q、K、V做线性变换
-        Q_seq = K.dot(Q_seq, self.WQ)
-        Q_seq = K.reshape(Q_seq, (-1, K.shape(Q_seq)[1], self.nb_head, self.size_per_head))
-        Q_seq = K.permute_dimensions(Q_seq, (0, 2, 1, 3))
-        K_seq = K.dot(K_seq, self.WK)
-        K_seq = K.reshape(K_seq, (-1, K.shape(K_seq)[1], self.nb_head, self.size_per_head))
-        K_seq = K.permute_dimensions(K_seq, (0, 2, 1, 3))
-        V_seq = K.dot(V_seq, self.WV)
-        V_seq = K.reshape(V_seq, (-1, K.shape(V_seq)[1], self.nb_head, self.size_per_head))
-        V_seq = K.permute_dimensions(V_seq, (0, 2, 1, 3))
-        # 计算内积，然后mask，然后softmax
-        A = K.batch_dot(Q_seq, K_seq, axes=[3, 3]) / self.size_per_head ** 0.5
-        A = K.permute_dimensions(A, (0, 3, 2, 1))
-        A = self.Mask(A, V_len, 'add')
-        A = K.permute_dimensions(A, (0, 3, 2, 1))
-        A = K.softmax(A)
+        # 对Q、K、V做线性变换，形状均为(batch, seq_len, head, size_per_head)
+        if self.fused_qkv and Q_seq is K_seq and K_seq is V_seq:
+            # self-attention：拼接WQ、WK、WV，一次矩阵乘法得到Q、K、V
+            QKV = K.dot(Q_seq, K.concatenate([self.WQ, self.WK, self.WV], 1))
+            QKV = K.reshape(QKV, (-1, K.shape(QKV)[1], 3, self.nb_head, self.size_per_head))
+            Q_seq, K_seq, V_seq = QKV[:, :, 0], QKV[:, :, 1], QKV[:, :, 2]
+        else:
+            Q_seq = self.heads(K.dot(Q_seq, self.WQ))
+            K_seq = self.heads(K.dot(K_seq, self.WK))
+            V_seq = self.heads(K.dot(V_seq, self.WV))
+        if self.mode == 'linear':
+            O_seq = self.linear_attention(Q_seq, K_seq, V_seq, V_len)
+        elif self.mode == 'local':
+            O_seq = self.local_attention(Q_seq, K_seq, V_seq, V_len)
+        else:
+            # 计算内积，然后mask，然后softmax
+            A = tf.einsum('bqhd,bkhd->bhqk', Q_seq, K_seq) / self.size_per_head ** 0.5
+            A = self.Key_Mask(A, V_len)
+            A = K.softmax(A)
+            O_seq = tf.einsum('bhqk,bkhd->bqhd', A, V_seq)
         # 输出并mask
-        O_seq = K.batch_dot(A, V_seq, axes=[3, 2])
-        O_seq = K.permute_dimensions(O_seq, (0, 2, 1, 3))
         O_seq = K.reshape(O_seq, (-1, K.shape(O_seq)[1], self.output_dim))
         O_seq = self.Mask(O_seq, Q_len, 'mul')
         return O_seq
 
+    def linear_attention(self, Q_seq, K_seq, V_seq, V_len):
+        """softmax(QK^T)V 换成 phi(Q)(phi(K)^T V) / phi(Q)sum(phi(K))，phi(x)=elu(x)+1，不需要(q, k)的得分矩阵"""
+        Q_seq = K.elu(Q_seq) + 1
+        K_seq = K.elu(K_seq) + 1
+        if V_len is not None:
+            # 多余的key置零，不参与求和
+            mask = K.cast(K.arange(K.shape(K_seq)[1])[None, :] < V_len, K.floatx())
+            K_seq = K_seq * K.expand_dims(K.expand_dims(mask, 2), 3)
+        KV = tf.einsum('bkhd,bkhe->bhde', K_seq, V_seq)
+        Z = 1. / (tf.einsum('bqhd,bhd->bqh', Q_seq, K.sum(K_seq, 1)) + K.epsilon())
+        return tf.einsum('bqhd,bhde->bqhe', Q_seq, KV) * K.expand_dims(Z, 3)
+
+    def local_attention(self, Q_seq, K_seq, V_seq, V_len):
+        """
+        每个位置attend距离不超过window的位置：序列切成长为window的块，
+        每块的query只与本块及前后相邻两块的key计算得分，(q, k)的得分矩阵变成(块数, window, 3 * window)
+        """
+        w = self.window
+        seq_len = K.shape(Q_seq)[1]
+        n = (seq_len + w - 1) // w
+        pad = n * w - seq_len
+        valid = K.arange(seq_len)[None, :] < (V_len if V_len is not None else seq_len)
+        valid = K.cast(valid, K.floatx())
+
+        def blocks(seq):
+            return K.reshape(tf.pad(seq, [[0, 0], [0, pad], [0, 0], [0, 0]]),
+                             (-1, n, w, self.nb_head, self.size_per_head))
+
+        def neighbours(seq, tail_shape):
+            # 两端各补一块，再拼接前一块、本块、后一块
+            seq = tf.pad(seq, [[0, 0], [w, w + pad]] + [[0, 0]] * len(tail_shape))
+            seq = K.reshape(seq, [-1, n + 2, w] + tail_shape)
+            return K.concatenate([seq[:, :-2], seq[:, 1:-1], seq[:, 2:]], 2)
+
+        head_shape = [self.nb_head, self.size_per_head]
+        A = tf.einsum('bnqhd,bnkhd->bnhqk', blocks(Q_seq), neighbours(K_seq, head_shape)) / self.size_per_head ** 0.5
+        # 块内第q个query与相邻三块中第k个key的距离为|q + w - k|，与块的下标无关
+        band = np.abs(np.arange(w)[:, None] + w - np.arange(3 * w)[None, :]) <= w
+        mask = neighbours(valid, [])[:, :, None, None, :] * K.constant(band.astype('float32'))
+        A = K.softmax(A - (1 - mask) * 1e12)
+        O_seq = tf.einsum('bnhqk,bnkhd->bnqhd', A, neighbours(V_seq, head_shape))
+        O_seq = K.reshape(O_seq, (-1, n * w, self.nb_head, self.size_per_head))
+        return O_seq[:, :seq_len]
+
     def compute_output_shape(self, input_shape):
         return (input_shape[0][0], input_shape[0][1], self.output_dim)
+
+    def get_config(self):
+        config = {
+            'nb_head': self.nb_head,
+            'size_per_head': self.size_per_head,
+            'fused_qkv': self.fused_qkv,
+            'mode': self.mode,
+            'window': self.window
+        }
+        base_config = super(Attention, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+custom_objects = {
+    'Position_Embedding': Position_Embedding,
+    'Sequence_Length': Sequence_Length,
+    'Masked_Average_Pooling': Masked_Average_Pooling,
+    'Attention': Attention
+}
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+Transformer_ATT模型的attention头剪枝：
+在开发集上逐个置零每个头的输出，以开发集loss的增加量作为该头的重要性；
+按重要性从低到高依次去掉头，得到准确率随头数变化的曲线；
+然后真正删去选中的头（缩小WQ/WK/WV和output_dim，以及后面全连接层对应的行），短暂微调后保存
+"""
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras.models import Model, load_model
+from keras.optimizers import Adam
+
+from Transformer_ATT_sentiment import construct_dataset
+from Transformer_Attention import Attention, custom_objects
+
+tf.flags.DEFINE_string('pruned_model_path', './model/transformer_pruned.h5', '剪枝并微调后的模型保存路径')
+tf.flags.DEFINE_string('layer_name', '', '剪枝的Attention层名，为空时取模型中的第一个Attention层')
+tf.flags.DEFINE_integer('keep_heads', '0', '保留的头数，为0时按max_accuracy_drop自动选择')
+tf.flags.DEFINE_float('max_accuracy_drop', 0.005, '自动选择头数时，允许的开发集准确率下降（微调前）')
+tf.flags.DEFINE_integer('finetune_epochs', '1', '剪枝后微调的轮数')
+tf.flags.DEFINE_float('finetune_lr', 1e-4, '微调的学习率')
+tf.flags.DEFINE_integer('eval_batch_size', '128', '评估和计时的批量大小')
+FLAGS = tf.flags.FLAGS
+
+
+def head_columns(layer, heads):
+    """WQ/WK/WV以及Attention输出中属于heads的列"""
+    return np.concatenate([np.arange(h * layer.size_per_head, (h + 1) * layer.size_per_head) for h in heads])
+
+
+def evaluate(model, x, y):
+    loss, accuracy = model.evaluate(x, y, batch_size=FLAGS.eval_batch_size, verbose=0)[:2]
+    return loss, accuracy
+
+
+def ablate(layer, weights, heads):
+    """把heads的WV列置零，这些头的输出为0，与删去这些头等价"""
+    WQ, WK, WV = weights
+    WV = WV.copy()
+    if len(heads) > 0:
+        WV[:, head_columns(layer, heads)] = 0
+    layer.set_weights([WQ, WK, WV])
+
+
+def head_importance(model, layer, x, y):
+    """每个头被置零后开发集loss的增加量"""
+    weights = layer.get_weights()
+    base_loss, _ = evaluate(model, x, y)
+    importance = []
+    for head in range(layer.nb_head):
+        ablate(layer, weights, [head])
+        importance.append(evaluate(model, x, y)[0] - base_loss)
+    layer.set_weights(weights)
+    return np.asarray(importance)
+
+
+def pruning_curve(model, layer, order, x, y):
+    """按order依次去掉头，返回去掉0, 1, ..., nb_head - 1个头时的开发集准确率"""
+    weights = layer.get_weights()
+    accuracies = []
+    for removed in range(layer.nb_head):
+        ablate(layer, weights, order[:removed])
+        accuracies.append(evaluate(model, x, y)[1])
+    layer.set_weights(weights)
+    return accuracies
+
+
+def prune_model(model, layer, heads):
+    """
+    只保留layer中的heads，返回新模型。
+    Attention之后第一维等于原output_dim的权重（如平均池化后的Dense的kernel）按保留的列截取对应的行
+    """
+    config = model.get_config()
+    for layer_config in config['layers']:
+        if layer_config['config']['name'] == layer.name:
+            layer_config['config']['nb_head'] = len(heads)
+    pruned = Model.from_config(config, custom_objects=custom_objects)
+
+    columns = head_columns(layer, heads)
+    for old_layer, new_layer in zip(model.layers, pruned.layers):
+        weights = old_layer.get_weights()
+        if old_layer.name == layer.name:
+            weights = [w[:, columns] for w in weights]
+        elif [w.shape for w in weights] != [w.shape for w in new_layer.get_weights()]:
+            weights = [w[columns] if w.shape[0] == layer.output_dim else w for w in weights]
+        new_layer.set_weights(weights)
+    return pruned
+
+
+def latency(model, x):
+    """每个batch的预测耗时（毫秒）"""
+    model.predict(x[:FLAGS.eval_batch_size], batch_size=FLAGS.eval_batch_size)
+    start = time.time()
+    model.predict(x, batch_size=FLAGS.eval_batch_size)
+    return (time.time() - start) * 1000 / int(np.ceil(len(x) / float(FLAGS.eval_batch_size)))
+
+
+def main(_):
+    x_train, y_train, x_dev, y_dev, _ = construct_dataset()
+    model = load_model(FLAGS.model_path, custom_objects=custom_objects)
+    attention_layers = [layer for layer in model.layers if isinstance(layer, Attention)]
+    layer = model.get_layer(FLAGS.layer_name) if FLAGS.layer_name else attention_layers[0]
+
+    importance = head_importance(model, layer, x_dev, y_dev)
+    order = [int(h) for h in np.argsort(importance)]
+    for head in order:
+        print('head {}: 置零后开发集loss增加 {:.5f}'.format(head, importance[head]))
+
+    accuracies = pruning_curve(model, layer, order, x_dev, y_dev)
+    print('{:>8}{:>12}'.format('heads', 'dev acc'))
+    for removed, accuracy in enumerate(accuracies):
+        print('{:>8}{:>12.4f}'.format(layer.nb_head - removed, accuracy))
+
+    if FLAGS.keep_heads > 0:
+        removed = min(max(layer.nb_head - FLAGS.keep_heads, 0), layer.nb_head - 1)
+    else:
+        removed = max(n for n, accuracy in enumerate(accuracies) if accuracy >= accuracies[0] - FLAGS.max_accuracy_drop)
+    heads = sorted(order[removed:])
+    print('保留的头：', heads)
+
+    pruned = prune_model(model, layer, heads)
+    pruned.compile(loss='binary_crossentropy', optimizer=Adam(lr=FLAGS.finetune_lr), metrics=['accuracy'])
+    before_finetune = evaluate(pruned, x_dev, y_dev)[1]
+    if FLAGS.finetune_epochs > 0:
+        pruned.fit(x_train, y_train,
+                   batch_size=FLAGS.batch_size,
+                   epochs=FLAGS.finetune_epochs,
+                   validation_data=(x_dev, y_dev))
+
+    pruned_layer = pruned.get_layer(layer.name)
+    print('{:<10}{:>8}{:>14}{:>12}{:>14}'.format('model', 'heads', 'attn params', 'dev acc', 'ms/batch'))
+    for name, m, attention in [('original', model, layer), ('pruned', pruned, pruned_layer)]:
+        print('{:<10}{:>8}{:>14}{:>12.4f}{:>14.2f}'.format(name, attention.nb_head, attention.count_params(),
+                                                          evaluate(m, x_dev, y_dev)[1], latency(m, x_dev)))
+    print('剪枝后微调前的开发集准确率：{:.4f}'.format(before_finetune))
+
+    pruned.save(FLAGS.pruned_model_path)
+    print('剪枝后的模型已保存至', FLAGS.pruned_model_path)
+
+
+if __name__ == '__main__':
+    tf.app.run()
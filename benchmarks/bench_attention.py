@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""对比原来的Attention（三次投影+多次转置）与融合QKV投影、einsum布局的self-attention的输出和吞吐量"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Input
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Transformer_ATT'))
+
+from Transformer_Attention import Attention
+
+tf.flags.DEFINE_string('seq_lens', '202,500', '用逗号分隔的序列长度，202为Transformer_ATT_sentiment.py中的最大句长')
+tf.flags.DEFINE_integer('batch_size', 64, '批量大小')
+tf.flags.DEFINE_integer('embedding_dim', 100, '词向量维度')
+tf.flags.DEFINE_integer('nb_head', 8, '注意力头数')
+tf.flags.DEFINE_integer('size_per_head', 16, '每个头的维度')
+tf.flags.DEFINE_integer('repeats', 20, '重复次数')
+FLAGS = tf.flags.FLAGS
+
+
+class ReferenceAttention(Attention):
+    """原来的Attention.call"""
+
+    def call(self, x):
+        if len(x) == 3:
+            Q_seq, K_seq, V_seq = x
+            Q_len, V_len = None, None
+        elif len(x) == 5:
+            Q_seq, K_seq, V_seq, Q_len, V_len = x
+        Q_seq = K.dot(Q_seq, self.WQ)
+        Q_seq = K.reshape(Q_seq, (-1, K.shape(Q_seq)[1], self.nb_head, self.size_per_head))
+        Q_seq = K.permute_dimensions(Q_seq, (0, 2, 1, 3))
+        K_seq = K.dot(K_seq, self.WK)
+        K_seq = K.reshape(K_seq, (-1, K.shape(K_seq)[1], self.nb_head, self.size_per_head))
+        K_seq = K.permute_dimensions(K_seq, (0, 2, 1, 3))
+        V_seq = K.dot(V_seq, self.WV)
+        V_seq = K.reshape(V_seq, (-1, K.shape(V_seq)[1], self.nb_head, self.size_per_head))
+        V_seq = K.permute_dimensions(V_seq, (0, 2, 1, 3))
+        A = K.batch_dot(Q_seq, K_seq, axes=[3, 3]) / self.size_per_head ** 0.5
+        A = K.permute_dimensions(A, (0, 3, 2, 1))
+        A = self.Mask(A, V_len, 'add')
+        A = K.permute_dimensions(A, (0, 3, 2, 1))
+        A = K.softmax(A)
+        O_seq = K.batch_dot(A, V_seq, axes=[3, 2])
+        O_seq = K.permute_dimensions(O_seq, (0, 2, 1, 3))
+        O_seq = K.reshape(O_seq, (-1, K.shape(O_seq)[1], self.output_dim))
+        O_seq = self.Mask(O_seq, Q_len, 'mul')
+        return O_seq
+
+
+def timeit(fn, inputs):
+    fn(inputs)
+    start = time.time()
+    for _ in range(FLAGS.repeats):
+        fn(inputs)
+    return (time.time() - start) / FLAGS.repeats
+
+
+def main(_):
+    for seq_len in [int(s) for s in FLAGS.seq_lens.split(',')]:
+        x = np.random.normal(size=(FLAGS.batch_size, seq_len, FLAGS.embedding_dim)).astype('float32')
+        lengths = np.random.randint(1, seq_len + 1, size=(FLAGS.batch_size, 1)).astype('int32')
+        for masked in [False, True]:
+            e = Input(shape=(seq_len, FLAGS.embedding_dim))
+            length = Input(shape=(1,), dtype='int32')
+            inputs = [e, e, e, length, length] if masked else [e, e, e]
+            feed = [x, lengths] if masked else [x]
+
+            reference = ReferenceAttention(FLAGS.nb_head, FLAGS.size_per_head)
+            fused = Attention(FLAGS.nb_head, FLAGS.size_per_head)
+            old = reference(inputs)
+            new = fused(inputs)
+            fused.set_weights(reference.get_weights())
+            old_fn = K.function([e, length] if masked else [e], [old])
+            new_fn = K.function([e, length] if masked else [e], [new])
+
+            max_diff = np.abs(old_fn(feed)[0] - new_fn(feed)[0]).max()
+            assert max_diff < 1e-4, max_diff
+            old_s = timeit(old_fn, feed)
+            new_s = timeit(new_fn, feed)
+            print('seq_len {:>4} {:<8} max|diff| {:.2e}  reference {:>8.1f} samples/s  '
+                  'fused {:>8.1f} samples/s  ({:.2f}x)'.format(seq_len, 'masked' if masked else 'unmasked', max_diff,
+                                                               FLAGS.batch_size / old_s, FLAGS.batch_size / new_s,
+                                                               old_s / new_s))
+
+
+if __name__ == '__main__':
+    tf.app.run()
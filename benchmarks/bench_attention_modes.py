@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+在weibo数据上对比Attention的full/linear/local三种模式在序列长度200、1000、4000下的准确率和吞吐量。
+weibo的句子都很短，把同一类别的句子随机拼接到指定长度（模拟评论串、转发拼接），标签不变
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Dense, Dropout, Embedding, Input
+from keras.models import Model
+from keras.preprocessing.sequence import pad_sequences
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Transformer_ATT'))
+
+from common.dataset import read_data
+from common.vocabulary import PrunedTokenizer
+from Transformer_Attention import Attention, Masked_Average_Pooling, Position_Embedding, Sequence_Length
+
+tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated',
+                       'Data source for the positive data')
+tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf8.txt_updated',
+                       'Data source for the negative data')
+tf.flags.DEFINE_string('seq_lens', '200,1000,4000', '用逗号分隔的序列长度')
+tf.flags.DEFINE_string('modes', 'full,linear,local', '用逗号分隔的attention模式')
+tf.flags.DEFINE_integer('window', 64, 'local attention的窗口大小')
+tf.flags.DEFINE_integer('train_samples', 8000, '每个长度下的训练样本数')
+tf.flags.DEFINE_integer('dev_samples', 1000, '每个长度下的开发集样本数')
+tf.flags.DEFINE_integer('epochs', 2, '训练轮数')
+tf.flags.DEFINE_integer('batch_size', 32, '批量大小')
+FLAGS = tf.flags.FLAGS
+
+
+def long_texts(sequences, labels, seq_len, samples, rng):
+    """同一类别的句子随机拼接到seq_len个词"""
+    by_label = {}
+    for seq, label in zip(sequences, labels):
+        by_label.setdefault(label, []).append(seq)
+    x, y = [], []
+    for _ in range(samples):
+        label = rng.choice(sorted(by_label))
+        words = []
+        while len(words) < seq_len:
+            words.extend(rng.choice(by_label[label]))
+        x.append(words[:seq_len])
+        y.append(label)
+    return pad_sequences(x, maxlen=seq_len, padding='post', truncating='post'), np.asarray(y)
+
+
+def transformer_model(vocab_size, seq_len, mode):
+    # 与Transformer_ATT_sentiment.py中的模型一致，embedding随机初始化
+    sequence_input = Input(shape=(None,), dtype='int32')
+    lengths = Sequence_Length()(sequence_input)
+    embeddings = Embedding(vocab_size, 100)(sequence_input)
+    embeddings = Position_Embedding(max_len=seq_len)(embeddings)
+    O_seq = Attention(8, 16, mode=mode, window=FLAGS.window)([embeddings, embeddings, embeddings, lengths, lengths])
+    O_seq = Masked_Average_Pooling()([O_seq, lengths])
+    O_seq = Dropout(0.5)(O_seq)
+    outputs = Dense(1, activation='sigmoid')(O_seq)
+    model = Model(sequence_input, outputs)
+    model.compile('adam', 'binary_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def main(_):
+    pos_x, pos_y = read_data(FLAGS.positive_data_file, 1)
+    neg_x, neg_y = read_data(FLAGS.negative_data_file, 0)
+    texts = [' '.join(words) for words in pos_x + neg_x]
+    tokenizer = PrunedTokenizer(40000, min_count=2, oov_buckets=100)
+    tokenizer.fit_on_texts(texts)
+    sequences = tokenizer.texts_to_sequences(texts)
+    labels = pos_y + neg_y
+
+    index = list(range(len(texts)))
+    random.Random(10).shuffle(index)
+    dev_size = len(index) // 10
+    train_index, dev_index = index[dev_size:], index[:dev_size]
+
+    print('{:>6}{:>8}{:>12}{:>14}{:>16}'.format('length', 'mode', 'dev acc', 's/epoch', 'predict/s'))
+    for seq_len in [int(s) for s in FLAGS.seq_lens.split(',')]:
+        rng = random.Random(seq_len)
+        x_train, y_train = long_texts([sequences[i] for i in train_index], [labels[i] for i in train_index],
+                                      seq_len, FLAGS.train_samples, rng)
+        x_dev, y_dev = long_texts([sequences[i] for i in dev_index], [labels[i] for i in dev_index],
+                                  seq_len, FLAGS.dev_samples, rng)
+        for mode in FLAGS.modes.split(','):
+            K.clear_session()
+            model = transformer_model(tokenizer.vocab_size, seq_len, mode)
+            try:
+                start = time.time()
+                model.fit(x_train, y_train, batch_size=FLAGS.batch_size, epochs=FLAGS.epochs, verbose=0)
+                epoch_seconds = (time.time() - start) / FLAGS.epochs
+                start = time.time()
+                predictions = model.predict(x_dev, batch_size=FLAGS.batch_size)
+                throughput = len(x_dev) / (time.time() - start)
+            except tf.errors.ResourceExhaustedError:
+                # full attention的得分矩阵为(batch, head, length, length)，长文本时内存不足
+                print('{:>6}{:>8}{:>12}'.format(seq_len, mode, 'OOM'))
+                continue
+            accuracy = np.mean((predictions[:, 0] > 0.5) == y_dev)
+            print('{:>6}{:>8}{:>12.4f}{:>14.2f}{:>16.1f}'.format(seq_len, mode, accuracy, epoch_seconds, throughput))
+
+
+if __name__ == '__main__':
+    tf.app.run()
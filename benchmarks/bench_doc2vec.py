@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""对比Doc2Vec和BERT句向量：编码吞吐量（句/秒）和逻辑回归的准确率，Doc2Vec另外给出jieba逐句分词与并行分词的速度"""
+import os
+import sys
+import time
+
+import jieba
+import numpy as np
+import tensorflow as tf
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BERT'))
+
+from common.dataset import cut_texts, read_data
+from doc2vec_encoder import Doc2VecEncoder
+
+tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated',
+                       'Data source for the positive data')
+tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf8.txt_updated',
+                       'Data source for the negative data')
+tf.flags.DEFINE_integer('doc2vec_size', 100, 'Doc2Vec句向量的维度')
+tf.flags.DEFINE_integer('doc2vec_epochs', 10, 'Doc2Vec训练和推断的轮数')
+tf.flags.DEFINE_integer('workers', 0, 'Doc2Vec和jieba并行分词的进程/线程数，0为全部CPU核')
+tf.flags.DEFINE_string('bert_model_path', '../BERT/chinese_L-12_H-768_A-12', 'BERT模型的目录，为空时只测Doc2Vec')
+tf.flags.DEFINE_integer('bert_sample', 2000, 'BERT编码测吞吐量的句子数（CPU上很慢）')
+FLAGS = tf.flags.FLAGS
+
+
+def evaluate(vectors, y, train_index, test_index):
+    # saga在未标准化的句向量上收敛很慢
+    clf = make_pipeline(StandardScaler(), LogisticRegression(solver='saga', max_iter=1000))
+    clf.fit(vectors[train_index], y[train_index])
+    return np.mean(clf.predict(vectors[test_index]) == y[test_index])
+
+
+def main(_):
+    pos_x, pos_y = read_data(FLAGS.positive_data_file, 1)
+    neg_x, neg_y = read_data(FLAGS.negative_data_file, 0)
+    texts = [''.join(words) for words in pos_x + neg_x]
+    y = np.asarray(pos_y + neg_y)
+    train_index, test_index = train_test_split(np.arange(len(texts)), test_size=0.4, random_state=0)
+
+    start = time.time()
+    for text in texts:
+        list(jieba.cut(text))
+    serial = len(texts) / (time.time() - start)
+    start = time.time()
+    cut_texts(texts, FLAGS.workers)
+    parallel = len(texts) / (time.time() - start)
+    print('jieba: {:.0f} sents/s serial, {:.0f} sents/s parallel'.format(serial, parallel))
+
+    print('{:>10}{:>6}{:>12}{:>16}{:>12}'.format('encoder', 'dim', 'train s', 'encode sents/s', 'accuracy'))
+    start = time.time()
+    # 只在训练集上训练，测试集句子的向量与新句子一样靠推断得到
+    doc2vec = Doc2VecEncoder(FLAGS.doc2vec_size, epochs=FLAGS.doc2vec_epochs,
+                             workers=FLAGS.workers).fit([texts[i] for i in train_index])
+    train_time = time.time() - start
+    start = time.time()
+    vectors = doc2vec.encode(texts)
+    throughput = len(texts) / (time.time() - start)
+    print('{:>10}{:>6}{:>12.1f}{:>16.0f}{:>12.4f}'.format('doc2vec', FLAGS.doc2vec_size, train_time, throughput,
+                                                       evaluate(vectors, y, train_index, test_index)))
+
+    if FLAGS.bert_model_path:
+        from bert_encoder import BertEncoder
+        bert = BertEncoder(FLAGS.bert_model_path)
+        sample = [texts[i] for i in np.random.RandomState(0).permutation(len(texts))[:FLAGS.bert_sample]]
+        start = time.time()
+        bert.encode(sample)
+        throughput = len(sample) / (time.time() - start)
+        vectors = bert.encode(texts)
+        print('{:>10}{:>6}{:>12}{:>16.0f}{:>12.4f}'.format('bert', bert.embedding_size, '-', throughput,
+                                                         evaluate(vectors, y, train_index, test_index)))
+
+
+if __name__ == '__main__':
+    tf.app.run()
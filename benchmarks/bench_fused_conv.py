@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""对比AVCNNModel/KMaxCNNModel中四个独立Conv1D+池化分支与FusedConvPool1D的输出和前向耗时"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Input, Conv1D, GlobalMaxPooling1D, GlobalAveragePooling1D, Flatten, concatenate
+from keras.models import Model
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kashgari.layers import AttentionWeightedAverage, KMaxPooling
+from common.layers import FusedConvPool1D
+
+tf.flags.DEFINE_string('batch_sizes', '32,64,128', '用逗号分隔的batch大小')
+tf.flags.DEFINE_integer('seq_len', 100, '序列长度')
+tf.flags.DEFINE_integer('input_dim', 768, '输入特征维度，BERT为768')
+tf.flags.DEFINE_integer('repeats', 20, '重复次数')
+FLAGS = tf.flags.FLAGS
+
+
+def conv_params(filters):
+    return [{'filters': filters, 'kernel_size': kernel_size, 'kernel_initializer': 'normal',
+             'padding': 'valid', 'activation': 'relu'} for kernel_size in range(1, 5)]
+
+
+def build_reference(inputs, params, pooling, k=3):
+    convs = [Conv1D(**p) for p in params]
+    outputs = [conv(inputs) for conv in convs]
+    pooled = []
+    weights = [[] for _ in convs]
+    for mode in pooling:
+        for i, output in enumerate(outputs):
+            if mode == 'max':
+                pooled.append(GlobalMaxPooling1D()(output))
+            elif mode == 'average':
+                pooled.append(GlobalAveragePooling1D()(output))
+            elif mode == 'attention':
+                layer = AttentionWeightedAverage()
+                pooled.append(layer(output))
+                weights[i].append(layer)
+            elif mode == 'kmax':
+                pooled.append(Flatten()(KMaxPooling(k=k)(output)))
+    merged = concatenate(pooled, axis=1)
+    return merged, convs, weights
+
+
+def timeit(fn, x):
+    fn([x])
+    start = time.time()
+    for _ in range(FLAGS.repeats):
+        fn([x])
+    return (time.time() - start) * 1000 / FLAGS.repeats
+
+
+def bench(name, filters, pooling):
+    inputs = Input(shape=(FLAGS.seq_len, FLAGS.input_dim))
+    params = conv_params(filters)
+    reference, convs, attentions = build_reference(inputs, params, pooling)
+    fused_layer = FusedConvPool1D.from_conv_params(params, pooling=pooling, k=3)
+    fused = fused_layer(inputs)
+
+    fused_weights = []
+    for conv, attention_layers in zip(convs, attentions):
+        fused_weights.extend(conv.get_weights())
+        for layer in attention_layers:
+            fused_weights.extend(layer.get_weights())
+    fused_layer.set_weights(fused_weights)
+
+    reference_fn = K.function([inputs], [reference])
+    fused_fn = K.function([inputs], [fused])
+    for batch_size in [int(b) for b in FLAGS.batch_sizes.split(',')]:
+        x = np.random.normal(size=(batch_size, FLAGS.seq_len, FLAGS.input_dim)).astype('float32')
+        max_diff = np.abs(reference_fn([x])[0] - fused_fn([x])[0]).max()
+        reference_ms = timeit(reference_fn, x)
+        fused_ms = timeit(fused_fn, x)
+        print('{:<8}batch {:>4}  max|diff| {:.2e}  separate {:>8.2f}ms  fused {:>8.2f}ms  speedup {:.2f}x'.format(
+            name, batch_size, max_diff, reference_ms, fused_ms, reference_ms / fused_ms))
+        assert max_diff < 1e-3
+
+
+def main(_):
+    bench('AVCNN', 300, ['max', 'attention', 'average'])
+    bench('KMaxCNN', 180, ['kmax'])
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""对比KMaxCNNModel中四个KMaxPooling+Flatten与一个KMaxPooling1D的输出和前向耗时"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Input, Flatten, concatenate
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kashgari.layers import KMaxPooling
+from common.layers import KMaxPooling1D
+
+tf.flags.DEFINE_string('batch_sizes', '32,64,128', '用逗号分隔的batch大小')
+tf.flags.DEFINE_string('seq_lens', '100,200', '用逗号分隔的序列长度')
+tf.flags.DEFINE_integer('filters', 180, '每个分支的卷积核个数')
+tf.flags.DEFINE_integer('k', 3, 'k-max pooling的k')
+tf.flags.DEFINE_integer('repeats', 20, '重复次数')
+FLAGS = tf.flags.FLAGS
+
+
+def timeit(fn, x):
+    fn(x)
+    start = time.time()
+    for _ in range(FLAGS.repeats):
+        fn(x)
+    return (time.time() - start) * 1000 / FLAGS.repeats
+
+
+def ordered_k_max(x, k):
+    """numpy参考实现：每个通道取最大的k个值，按在序列中的位置排列后与KMaxPooling+Flatten布局一致"""
+    indices = np.sort(np.argsort(-x, axis=1, kind='stable')[:, :k], axis=1)
+    return np.take_along_axis(x, indices, axis=1).reshape(len(x), -1)
+
+
+def bench(seq_len):
+    # conv_0 ~ conv_3 的kernel_size为1~4，valid卷积后长度依次减1
+    inputs = [Input(shape=(seq_len - i, FLAGS.filters)) for i in range(4)]
+    separate = concatenate([Flatten()(KMaxPooling(k=FLAGS.k)(x)) for x in inputs], axis=1)
+    batched = KMaxPooling1D(k=FLAGS.k)(inputs)
+    ordered = KMaxPooling1D(k=FLAGS.k, keep_order=True)(inputs)
+
+    separate_fn = K.function(inputs, [separate])
+    batched_fn = K.function(inputs, [batched])
+    ordered_fn = K.function(inputs, [ordered])
+    for batch_size in [int(b) for b in FLAGS.batch_sizes.split(',')]:
+        x = [np.random.normal(size=(batch_size, seq_len - i, FLAGS.filters)).astype('float32')
+             for i in range(4)]
+        assert np.allclose(separate_fn(x)[0], batched_fn(x)[0])
+        assert np.allclose(np.concatenate([ordered_k_max(b, FLAGS.k) for b in x], axis=1), ordered_fn(x)[0])
+        separate_ms = timeit(separate_fn, x)
+        batched_ms = timeit(batched_fn, x)
+        ordered_ms = timeit(ordered_fn, x)
+        print('seq_len {:>4}  batch {:>4}  KMaxPooling x4 {:>8.2f}ms  KMaxPooling1D {:>8.2f}ms ({:.2f}x)  '
+              'keep_order {:>8.2f}ms ({:.2f}x)'.format(seq_len, batch_size, separate_ms,
+                                                      batched_ms, separate_ms / batched_ms,
+                                                      ordered_ms, separate_ms / ordered_ms))
+
+
+def main(_):
+    for seq_len in [int(s) for s in FLAGS.seq_lens.split(',')]:
+        bench(seq_len)
+
+
+if __name__ == '__main__':
+    tf.app.run()
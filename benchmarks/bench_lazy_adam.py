@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""对比Adam与LazyAdam训练随机初始化embedding时的单步耗时和每步实测的内存分配（RunMetadata中的step stats）"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Dense, Embedding, GlobalAveragePooling1D, LSTM
+from keras.models import Sequential
+from keras.optimizers import Adam
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.optimizers import LazyAdam
+
+tf.flags.DEFINE_integer('vocab_size', 200000, '词表大小（完整Tokenizer在weibo60000上的量级）')
+tf.flags.DEFINE_integer('embedding_dim', 128, 'embedding维度')
+tf.flags.DEFINE_integer('seq_len', 100, '序列长度')
+tf.flags.DEFINE_integer('batch_size', 64, '批量大小')
+tf.flags.DEFINE_integer('steps', 50, '计时的步数')
+tf.flags.DEFINE_integer('trace_steps', 5, '记录内存分配的步数，记录时单步变慢，不与计时同时进行')
+FLAGS = tf.flags.FLAGS
+
+
+def build(optimizer, head, run_metadata=None):
+    model = Sequential()
+    model.add(Embedding(FLAGS.vocab_size, FLAGS.embedding_dim, input_length=FLAGS.seq_len))
+    if head == 'lstm':
+        model.add(LSTM(128))
+    else:
+        model.add(GlobalAveragePooling1D())
+    model.add(Dense(1, activation='sigmoid'))
+    if run_metadata is None:
+        model.compile(optimizer, 'binary_crossentropy')
+    else:
+        # 每次train_on_batch都把各个op的内存分配写入run_metadata
+        model.compile(optimizer, 'binary_crossentropy',
+                      options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE), run_metadata=run_metadata)
+    return model
+
+
+def zipf_batch(rng):
+    ids = np.minimum(rng.zipf(1.2, size=(FLAGS.batch_size, FLAGS.seq_len)), FLAGS.vocab_size - 1)
+    return ids, rng.randint(0, 2, size=(FLAGS.batch_size, 1))
+
+
+def step_time(model, batches):
+    model.train_on_batch(*batches[0])
+    start = time.time()
+    for x, y in batches:
+        model.train_on_batch(x, y)
+    return (time.time() - start) * 1000 / len(batches)
+
+
+def step_memory(model, run_metadata, batches):
+    """
+    :return: (每步所有op分配的MB数, 每步分配器占用的峰值MB数)，取trace_steps步的平均
+    """
+    model.train_on_batch(*batches[0])
+    allocated, peak = [], []
+    for x, y in batches[:FLAGS.trace_steps]:
+        run_metadata.Clear()
+        model.train_on_batch(x, y)
+        memory = [m for dev in run_metadata.step_stats.dev_stats for node in dev.node_stats for m in node.memory]
+        allocated.append(sum(m.total_bytes for m in memory))
+        peak.append(max([m.allocator_bytes_in_use for m in memory] + [0]))
+    return np.mean(allocated) / 2 ** 20, np.mean(peak) / 2 ** 20
+
+
+def main(_):
+    rng = np.random.RandomState(10)
+    batches = [zipf_batch(rng) for _ in range(FLAGS.steps)]
+    unique_rows = np.mean([len(np.unique(x)) for x, _ in batches])
+
+    for head in ['average', 'lstm']:
+        K.clear_session()
+        np.random.seed(10)
+        adam = build(Adam(), head)
+        lazy = build(LazyAdam(), head)
+        lazy.set_weights(adam.get_weights())
+        # 第一步时未出现的行在Adam中的更新量为0，两者结果应一致
+        adam.train_on_batch(*batches[0])
+        lazy.train_on_batch(*batches[0])
+        assert np.allclose(adam.layers[0].get_weights()[0], lazy.layers[0].get_weights()[0], atol=1e-6)
+
+        adam_ms = step_time(adam, batches)
+        lazy_ms = step_time(lazy, batches)
+
+        run_metadata = tf.RunMetadata()
+        adam_mb, adam_peak_mb = step_memory(build(Adam(), head, run_metadata), run_metadata, batches)
+        lazy_mb, lazy_peak_mb = step_memory(build(LazyAdam(), head, run_metadata), run_metadata, batches)
+        print('{:<8} vocab {}  rows/batch {:.0f}  '
+              'Adam {:.2f}ms/step, allocated {:.1f}MB/step, peak {:.1f}MB  '
+              'LazyAdam {:.2f}ms/step, allocated {:.1f}MB/step, peak {:.1f}MB  speedup {:.2f}x'.format(
+                  head, FLAGS.vocab_size, unique_rows, adam_ms, adam_mb, adam_peak_mb,
+                  lazy_ms, lazy_mb, lazy_peak_mb, adam_ms / lazy_ms))
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""对比每次前向都重新计算sin/cos的旧Position_Embedding与预计算位置编码表的新实现的输出和耗时"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Input, Lambda
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Transformer_ATT'))
+
+from Transformer_Attention import Position_Embedding
+
+tf.flags.DEFINE_string('seq_lens', '202,1000', '用逗号分隔的序列长度，202为Transformer_ATT_sentiment.py中的最大句长')
+tf.flags.DEFINE_integer('batch_size', 128, '批量大小')
+tf.flags.DEFINE_integer('embedding_dim', 100, '词向量维度')
+tf.flags.DEFINE_integer('repeats', 50, '重复次数')
+FLAGS = tf.flags.FLAGS
+
+
+def recomputed_position_embedding(x):
+    """原来的Position_Embedding.call（mode='sum'）"""
+    size = int(x.shape[-1])
+    position_j = 1. / K.pow(10000., 2 * K.arange(size / 2, dtype='float32') / size)
+    position_j = K.expand_dims(position_j, 0)
+    position_i = K.cumsum(K.ones_like(x[:, :, 0]), 1) - 1
+    position_i = K.expand_dims(position_i, 2)
+    position_ij = K.dot(position_i, position_j)
+    position_ij = K.concatenate([K.cos(position_ij), K.sin(position_ij)], 2)
+    return position_ij + x
+
+
+def timeit(fn, x):
+    fn([x])
+    start = time.time()
+    for _ in range(FLAGS.repeats):
+        fn([x])
+    return (time.time() - start) * 1000 / FLAGS.repeats
+
+
+def main(_):
+    for seq_len in [int(s) for s in FLAGS.seq_lens.split(',')]:
+        for variable_length in [False, True]:
+            inputs = Input(shape=(None if variable_length else seq_len, FLAGS.embedding_dim))
+            old = Lambda(recomputed_position_embedding)(inputs)
+            new = Position_Embedding(max_len=seq_len)(inputs)
+            old_fn = K.function([inputs], [old])
+            new_fn = K.function([inputs], [new])
+
+            x = np.random.normal(size=(FLAGS.batch_size, seq_len, FLAGS.embedding_dim)).astype('float32')
+            max_diff = np.abs(old_fn([x])[0] - new_fn([x])[0]).max()
+            assert max_diff < 1e-3, max_diff
+            old_ms = timeit(old_fn, x)
+            new_ms = timeit(new_fn, x)
+            print('seq_len {:>5} {:<9} max|diff| {:.2e}  recomputed {:>7.3f}ms  table {:>7.3f}ms  '
+                  'saved {:>7.3f}ms/step ({:.2f}x)'.format(seq_len, 'variable' if variable_length else 'fixed',
+                                                          max_diff, old_ms, new_ms, old_ms - new_ms,
+                                                          old_ms / new_ms))
+
+
+if __name__ == '__main__':
+    tf.app.run()
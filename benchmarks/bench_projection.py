@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""对比BERT句向量PCA降到不同维度后，逻辑回归的准确率、句向量的存储大小和分类吞吐量"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BERT'))
+
+from bert_encoder import BertEncoder
+from common.dataset import read_data
+from common.projection import VectorProjection
+from common.vector_cache import VectorCache
+
+tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated',
+                       'Data source for the positive data')
+tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf8.txt_updated',
+                       'Data source for the negative data')
+tf.flags.DEFINE_string('bert_model_path', '../BERT/chinese_L-12_H-768_A-12', 'BERT模型的目录')
+tf.flags.DEFINE_string('vector_cache_dir', '../BERT/model/vector_cache', '原始句向量的缓存目录，与Bert_LR.py共用')
+tf.flags.DEFINE_string('dims', '0,256,128,64', '用逗号分隔的目标维度，0为不降维')
+tf.flags.DEFINE_boolean('whiten', False, 'PCA降维时是否白化')
+tf.flags.DEFINE_integer('projection_sample', 10000, '拟合PCA使用的训练集句子数')
+tf.flags.DEFINE_integer('repeats', 5, '测试吞吐量的重复次数')
+FLAGS = tf.flags.FLAGS
+
+
+def main(_):
+    pos_x, pos_y = read_data(FLAGS.positive_data_file, 1)
+    neg_x, neg_y = read_data(FLAGS.negative_data_file, 0)
+    texts = [''.join(words) for words in pos_x + neg_x]
+    y = np.asarray(pos_y + neg_y)
+
+    encoder = BertEncoder(FLAGS.bert_model_path)
+    vectors = VectorCache(FLAGS.vector_cache_dir, encoder.encoder_id).get_or_encode(texts, encoder.encode)
+    train_index, test_index = train_test_split(np.arange(len(texts)), test_size=0.4, random_state=0)
+    sample = np.random.RandomState(0).permutation(train_index)[:FLAGS.projection_sample]
+
+    print('{:>6}{:>12}{:>12}{:>16}{:>18}'.format('dim', 'variance', 'accuracy', 'MB/1M sents', 'classify/s'))
+    for dim in [int(d) for d in FLAGS.dims.split(',')]:
+        if dim > 0:
+            projection = VectorProjection(dim, whiten=FLAGS.whiten).fit(vectors[sample])
+            transform, variance = projection.transform, projection.explained_variance_ratio
+        else:
+            dim, transform, variance = vectors.shape[1], lambda x: x, 1.
+        clf = LogisticRegression(solver='saga')
+        clf.fit(transform(vectors[train_index]), y[train_index])
+
+        x_test = vectors[test_index]
+        accuracy = np.mean(clf.predict(transform(x_test)) == y[test_index])
+        # 吞吐量包括降维的耗时
+        start = time.time()
+        for _ in range(FLAGS.repeats):
+            clf.predict_proba(transform(x_test))
+        throughput = len(x_test) * FLAGS.repeats / (time.time() - start)
+        print('{:>6}{:>12.4f}{:>12.4f}{:>16.1f}{:>18.0f}'.format(dim, variance, accuracy,
+                                                              dim * 4 * 1e6 / (1 << 20), throughput))
+
+
+if __name__ == '__main__':
+    tf.app.run()
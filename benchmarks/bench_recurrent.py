@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""对比keras的LSTM/GRU与FusedLSTM/FusedGRU的推理输出和每个epoch的训练耗时"""
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras.layers import Input, Bidirectional, Dense, GRU, LSTM
+from keras.models import Model
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.layers import FusedGRU, FusedLSTM
+
+tf.flags.DEFINE_string('seq_lens', '100,200', '用逗号分隔的序列长度')
+tf.flags.DEFINE_integer('samples', 2048, '每个epoch的样本数')
+tf.flags.DEFINE_integer('batch_size', 32, 'batch大小')
+tf.flags.DEFINE_integer('input_dim', 128, '输入特征维度')
+FLAGS = tf.flags.FLAGS
+
+# (名称, keras层, fused层, 参数, 是否双向)，与LSTM/BiLSTM脚本和BERT/models.py中的循环层一致
+CASES = [
+    ('LSTM+dropout', LSTM, FusedLSTM, {'units': 128, 'dropout': 0.2, 'recurrent_dropout': 0.2}, False),
+    ('BiLSTM', LSTM, FusedLSTM, {'units': 64}, True),
+    ('BiGRU', GRU, FusedGRU, {'units': 64, 'return_sequences': True}, True),
+]
+
+
+def build(layer_cls, params, bidirectional, seq_len):
+    inputs = Input(shape=(seq_len, FLAGS.input_dim))
+    layer = layer_cls(**params)
+    x = Bidirectional(layer)(inputs) if bidirectional else layer(inputs)
+    if params.get('return_sequences'):
+        x = Bidirectional(layer_cls(16))(x) if bidirectional else layer_cls(16)(x)
+    model = Model(inputs, Dense(1, activation='sigmoid')(x))
+    model.compile('adam', 'binary_crossentropy')
+    return model
+
+
+def epoch_time(model, x, y):
+    model.fit(x[:FLAGS.batch_size * 2], y[:FLAGS.batch_size * 2], batch_size=FLAGS.batch_size, verbose=0)
+    start = time.time()
+    model.fit(x, y, batch_size=FLAGS.batch_size, epochs=1, verbose=0)
+    return time.time() - start
+
+
+def main(_):
+    for seq_len in [int(s) for s in FLAGS.seq_lens.split(',')]:
+        x = np.random.normal(size=(FLAGS.samples, seq_len, FLAGS.input_dim)).astype('float32')
+        y = np.random.randint(0, 2, size=(FLAGS.samples, 1))
+        for name, keras_cls, fused_cls, params, bidirectional in CASES:
+            keras_model = build(keras_cls, params, bidirectional, seq_len)
+            fused_model = build(fused_cls, params, bidirectional, seq_len)
+            fused_model.set_weights(keras_model.get_weights())
+            max_diff = np.abs(keras_model.predict(x[:256]) - fused_model.predict(x[:256])).max()
+            assert max_diff < 1e-4
+
+            keras_s = epoch_time(keras_model, x, y)
+            fused_s = epoch_time(fused_model, x, y)
+            print('{:<14}seq_len {:>4}  max|diff| {:.2e}  keras {:>7.2f}s/epoch  fused {:>7.2f}s/epoch  '
+                  'speedup {:.2f}x'.format(name, seq_len, max_diff, keras_s, fused_s, keras_s / fused_s))
+
+
+if __name__ == '__main__':
+    tf.app.run()
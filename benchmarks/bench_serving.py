@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""对BERT/serve.py启动的推理服务压测，给出不同并发数下的p50/p99延迟、吞吐量和平均micro-batch大小"""
+import asyncio
+import json
+import os
+import sys
+import urllib.request
+
+import tensorflow as tf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.serving import load_test
+
+tf.flags.DEFINE_string('host', '127.0.0.1', '推理服务的地址')
+tf.flags.DEFINE_integer('port', 8000, '推理服务的端口')
+tf.flags.DEFINE_string('data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated', '请求中发送的句子')
+tf.flags.DEFINE_string('concurrency', '1,8,32,128', '用逗号分隔的并发客户端数')
+tf.flags.DEFINE_integer('requests', 2000, '每个并发数下的请求数')
+FLAGS = tf.flags.FLAGS
+
+
+def batch_stats():
+    with urllib.request.urlopen('http://{}:{}/stats'.format(FLAGS.host, FLAGS.port)) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def main(_):
+    texts = [line.strip() for line in open(FLAGS.data_file, 'r', encoding='utf-8') if len(line.strip()) > 1]
+    loop = asyncio.get_event_loop()
+    # 预热，包括分词进程加载jieba词典
+    loop.run_until_complete(load_test(FLAGS.host, FLAGS.port, texts, concurrency=4, requests=100))
+
+    print('{:>12}{:>10}{:>10}{:>14}{:>12}{:>8}'.format('concurrency', 'p50 ms', 'p99 ms', 'requests/s',
+                                                        'batch size', 'errors'))
+    for concurrency in [int(c) for c in FLAGS.concurrency.split(',')]:
+        before = batch_stats()
+        result = loop.run_until_complete(load_test(FLAGS.host, FLAGS.port, texts,
+                                                   concurrency=concurrency, requests=FLAGS.requests))
+        after = batch_stats()
+        batch_size = (after['sentences'] - before['sentences']) / max(after['batches'] - before['batches'], 1)
+        print('{:>12}{:>10.1f}{:>10.1f}{:>14.0f}{:>12.1f}{:>8}'.format(concurrency, result['p50_ms'], result['p99_ms'],
+                                                                      result['requests_per_second'], batch_size,
+                                                                      result['errors']))
+
+
+if __name__ == '__main__':
+    tf.app.run()
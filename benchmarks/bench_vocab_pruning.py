@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""对比完整词表与PrunedTokenizer（max_num_words + min_count + oov桶）下随机初始化LSTM/BiLSTM/CNN的参数量和训练耗时"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.layers import Activation, Bidirectional, Conv1D, Dense, Dropout, Embedding, GlobalMaxPooling1D, LSTM
+from keras.models import Sequential
+from keras.preprocessing.sequence import pad_sequences
+from keras.preprocessing.text import Tokenizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.dataset import read_data
+from common.vocabulary import PrunedTokenizer
+
+tf.flags.DEFINE_string('positive_data_file', '../dataset/weibo60000/pos60000_utf8.txt_updated',
+                       'Data source for the positive data')
+tf.flags.DEFINE_string('negative_data_file', '../dataset/weibo60000/neg60000_utf8.txt_updated',
+                       'Data source for the negative data')
+tf.flags.DEFINE_integer('samples', 20000, '参与训练计时的样本数')
+tf.flags.DEFINE_integer('max_num_words', 40000, '词表保留的词语数')
+tf.flags.DEFINE_integer('min_count', 2, '进入词表的最小出现次数')
+tf.flags.DEFINE_integer('oov_buckets', 100, 'oov桶数')
+tf.flags.DEFINE_integer('batch_size', 64, '批量大小')
+FLAGS = tf.flags.FLAGS
+
+
+# 与LSTM/BiLSTM/CNN的random脚本中的模型一致
+def lstm_model(vocab_size, maxlen):
+    model = Sequential()
+    model.add(Embedding(vocab_size, 128, input_length=maxlen))
+    model.add(LSTM(128, dropout=0.2, recurrent_dropout=0.2))
+    model.add(Dropout(0.5))
+    model.add(Dense(1, activation='sigmoid'))
+    return model
+
+
+def bilstm_model(vocab_size, maxlen):
+    model = Sequential()
+    model.add(Embedding(vocab_size, 128, input_length=maxlen))
+    model.add(Bidirectional(LSTM(64)))
+    model.add(Dropout(0.5))
+    model.add(Dense(1, activation='sigmoid'))
+    return model
+
+
+def cnn_model(vocab_size, maxlen):
+    model = Sequential()
+    model.add(Embedding(vocab_size, 100, input_length=maxlen))
+    model.add(Dropout(0.2))
+    model.add(Conv1D(250, 3, padding='valid', activation='relu', strides=1))
+    model.add(GlobalMaxPooling1D())
+    model.add(Dense(250))
+    model.add(Dropout(0.2))
+    model.add(Activation('relu'))
+    model.add(Dense(1))
+    model.add(Activation('sigmoid'))
+    return model
+
+
+def epoch_time(build_fn, vocab_size, x, y):
+    K.clear_session()
+    model = build_fn(vocab_size, x.shape[1])
+    model.compile('adam', 'binary_crossentropy', metrics=['accuracy'])
+    model.fit(x[:FLAGS.batch_size * 2], y[:FLAGS.batch_size * 2], batch_size=FLAGS.batch_size, verbose=0)
+    start = time.time()
+    model.fit(x, y, batch_size=FLAGS.batch_size, epochs=1, verbose=0)
+    return time.time() - start, model.layers[0].count_params(), model.count_params()
+
+
+def main(_):
+    pos_x, pos_y = read_data(FLAGS.positive_data_file, 1)
+    neg_x, neg_y = read_data(FLAGS.negative_data_file, 0)
+    texts = [' '.join(words) for words in pos_x + neg_x]
+    labels = np.asarray(pos_y + neg_y)
+
+    full = Tokenizer()
+    full.fit_on_texts(texts)
+    pruned = PrunedTokenizer(FLAGS.max_num_words, min_count=FLAGS.min_count, oov_buckets=FLAGS.oov_buckets)
+    pruned.fit_on_texts(texts)
+    print(pruned.summary(128))
+
+    random.seed(10)
+    index = random.sample(range(len(texts)), min(FLAGS.samples, len(texts)))
+    sample_texts = [texts[i] for i in index]
+    y = labels[index]
+    maxlen = max(len(text.split(' ')) for text in texts)
+    vocabularies = [('full', full, len(full.word_index) + 1),
+                    ('pruned', pruned, pruned.vocab_size)]
+
+    print('{:<8}{:<8}{:>14}{:>14}{:>12}{:>10}'.format('model', 'vocab', 'embedding', 'total', 's/epoch', 'speedup'))
+    for name, build_fn in [('LSTM', lstm_model), ('BiLSTM', bilstm_model), ('CNN', cnn_model)]:
+        baseline = None
+        for vocab_name, tokenizer, vocab_size in vocabularies:
+            x = pad_sequences(tokenizer.texts_to_sequences(sample_texts), maxlen=maxlen)
+            seconds, embedding_params, total_params = epoch_time(build_fn, vocab_size, x, y)
+            baseline = baseline or seconds
+            print('{:<8}{:<8}{:>14}{:>14}{:>12.2f}{:>10.2f}'.format(name, vocab_name, embedding_params,
+                                                                  total_params, seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""句向量的近似最近邻检索（IVF倒排索引）和kNN分类，新标注的句子直接加入索引，不需要重新训练"""
+import time
+from typing import Tuple
+
+import numpy as np
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def _merge_top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """每行保留得分最高的k个（不排序）"""
+    if scores.shape[1] <= k:
+        return scores, ids
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, top, 1), np.take_along_axis(ids, top, 1)
+
+
+class IVFIndex(object):
+    """
+    Inverted-file index for cosine similarity.
+
+    A spherical k-means on a sample gives `nlist` centroids; every added vector is stored
+    (normalized, float32) in the list of its nearest centroid. A query only scans the
+    `nprobe` lists whose centroids are closest to it. Queries are answered in batches: the
+    (query, list) pairs are grouped by list so every list is scanned with one matrix multiply
+    for all the queries probing it. Vectors can be added at any time after :meth:`train`.
+    """
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, batch_size: int = 4096, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.batch_size = batch_size
+        self.random = np.random.RandomState(seed)
+        self.centroids = None
+        self.labels = np.zeros(0, dtype=np.int64)
+        self._chunks = [[] for _ in range(nlist)]
+        self._lists = [(np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)) for _ in range(nlist)]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _nearest_centroid(self, x: np.ndarray) -> np.ndarray:
+        return np.concatenate([np.argmax(x[i:i + 65536].dot(self.centroids.T), 1)
+                               for i in range(0, len(x), 65536)]) if len(x) else np.zeros(0, dtype=np.int64)
+
+    def train(self, sample: np.ndarray, iterations: int = 10) -> 'IVFIndex':
+        """spherical k-means on a sample of the vectors, e.g. 50 * nlist rows"""
+        x = _normalize(sample)
+        self.nlist = min(self.nlist, len(x))
+        self.nprobe = min(self.nprobe, self.nlist)
+        self._chunks = [[] for _ in range(self.nlist)]
+        self._lists = self._lists[:self.nlist]
+        self.centroids = x[self.random.choice(len(x), self.nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = self._nearest_centroid(x)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, x)
+            counts = np.bincount(assignment, minlength=self.nlist)
+            # 空的簇重新随机取一个样本作为中心
+            empty = counts == 0
+            sums[empty] = x[self.random.choice(len(x), int(empty.sum()))]
+            self.centroids = _normalize(sums)
+        return self
+
+    def add(self, vectors: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """
+        :return: ids of the added vectors
+        """
+        x = _normalize(vectors)
+        ids = np.arange(len(self.labels), len(self.labels) + len(x))
+        self.labels = np.concatenate([self.labels, np.asarray(labels)]) if len(self.labels) else np.asarray(labels)
+        assignment = self._nearest_centroid(x)
+        order = np.argsort(assignment, kind='mergesort')
+        boundaries = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+        for l in range(self.nlist):
+            members = order[boundaries[l]:boundaries[l + 1]]
+            if len(members):
+                self._chunks[l].append((x[members], ids[members]))
+        return ids
+
+    def _list(self, l: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._chunks[l]:
+            # 新加入的向量在第一次检索时才合并进连续的数组
+            vectors, ids = self._lists[l]
+            chunks = ([(vectors, ids)] if len(ids) else []) + self._chunks[l]
+            self._lists[l] = (np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks]))
+            self._chunks[l] = []
+        return self._lists[l]
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (cosine similarities, ids), both (len(queries), k) sorted by similarity; ids are -1
+                 when fewer than k vectors were scanned
+        """
+        results = [self._search_batch(_normalize(queries[i:i + self.batch_size]), k)
+                   for i in range(0, len(queries), self.batch_size)]
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def _search_batch(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(q)
+        probe = np.argpartition(-q.dot(self.centroids.T), self.nprobe - 1, axis=1)[:, :self.nprobe].ravel()
+        query_of = np.repeat(np.arange(n), self.nprobe)
+        order = np.argsort(probe, kind='mergesort')
+        boundaries = np.searchsorted(probe[order], np.arange(self.nlist + 1))
+
+        best_scores = np.full((n, k), -np.inf, dtype=np.float32)
+        best_ids = np.full((n, k), -1, dtype=np.int64)
+        for l in np.unique(probe):
+            vectors, ids = self._list(l)
+            if len(ids) == 0:
+                continue
+            qi = query_of[order[boundaries[l]:boundaries[l + 1]]]
+            scores, top_ids = _merge_top_k(q[qi].dot(vectors.T), np.broadcast_to(ids, (len(qi), len(ids))), k)
+            best_scores[qi], best_ids[qi] = _merge_top_k(np.concatenate([best_scores[qi], scores], 1),
+                                                         np.concatenate([best_ids[qi], top_ids], 1), k)
+        rank = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, rank, 1), np.take_along_axis(best_ids, rank, 1)
+
+    def exact_search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """brute force over every stored vector, the reference for :meth:`recall`"""
+        lists = [self._list(l) for l in range(self.nlist)]
+        vectors = np.concatenate([v for v, ids in lists if len(ids)])
+        ids = np.concatenate([ids for v, ids in lists if len(ids)])
+        results = []
+        for i in range(0, len(queries), self.batch_size):
+            q = _normalize(queries[i:i + self.batch_size])
+            scores, top_ids = _merge_top_k(q.dot(vectors.T), np.broadcast_to(ids, (len(q), len(ids))), k)
+            rank = np.argsort(-scores, axis=1)
+            results.append((np.take_along_axis(scores, rank, 1), np.take_along_axis(top_ids, rank, 1)))
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def recall(self, queries: np.ndarray, k: int = 10) -> float:
+        """share of the exact k nearest neighbours that the IVF search also returns"""
+        _, approximate = self.search(queries, k)
+        _, exact = self.exact_search(queries, k)
+        hits = sum(len(np.intersect1d(a[a >= 0], e)) for a, e in zip(approximate, exact))
+        return hits / float(exact.size)
+
+
+class KNNClassifier(object):
+    """
+    k nearest neighbours vote over an :class:`IVFIndex`, `uniform` (majority vote) or
+    `similarity` weighted ((1 + cosine) / 2 per neighbour). New labelled sentences are
+    added to the index and used by the next query, with no retraining.
+    """
+
+    def __init__(self, index: IVFIndex, k: int = 10, weighting: str = 'uniform', classes=None):
+        if weighting not in ('uniform', 'similarity'):
+            raise ValueError('weighting must be uniform or similarity')
+        self.index = index
+        self.k = k
+        self.weighting = weighting
+        self._classes = None if classes is None else np.asarray(classes)
+
+    @property
+    def classes(self) -> np.ndarray:
+        """默认为索引中出现过的全部标签"""
+        return np.unique(self.index.labels) if self._classes is None else self._classes
+
+    def add(self, vectors: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        return self.index.add(vectors, labels)
+
+    def predict_proba(self, queries: np.ndarray) -> np.ndarray:
+        scores, ids = self.index.search(queries, self.k)
+        found = ids >= 0
+        # 扫描到的向量不足k个时空位的得分为-inf，权重记0
+        weights = found.astype(np.float64) if self.weighting == 'uniform' else np.where(found, (1 + scores) / 2., 0.)
+        all_classes = self.classes
+        classes = np.searchsorted(all_classes, self.index.labels[np.where(found, ids, 0)])
+        rows = np.repeat(np.arange(len(queries)), self.k)
+        votes = np.bincount(rows * len(all_classes) + classes.ravel(), weights=weights.ravel(),
+                            minlength=len(queries) * len(all_classes)).reshape(len(queries), -1)
+        return votes / np.maximum(votes.sum(1, keepdims=True), 1e-12)
+
+    def predict(self, queries: np.ndarray) -> np.ndarray:
+        return self.classes[self.predict_proba(queries).argmax(1)]
+
+    def benchmark(self, queries: np.ndarray, recall_queries: int = 1000) -> dict:
+        """queries/s of batched kNN prediction and recall@k of the IVF search against exact search"""
+        start = time.time()
+        self.predict_proba(queries)
+        qps = len(queries) / (time.time() - start)
+        return {'queries_per_second': qps, 'recall': self.index.recall(queries[:recall_queries], self.k)}
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""大文件离线打分：流式读取、多进程分词、按batch调用模型，结果逐batch追加写入，支持分片和断点续跑"""
+import collections
+import logging
+import os
+import time
+from multiprocessing import Pool
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from common.dataset import jieba_cut
+
+# 一个batch的分词结果 -> (每个句子的类别, 每个句子的置信度)
+ScoreFn = Callable[[List[List[str]]], Tuple[List, np.ndarray]]
+
+
+def available_cores() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def shard_lines(path: str, shard_index: int = 0, num_shards: int = 1, start: int = 0) -> Iterator[Tuple[int, str]]:
+    """
+    流式读取第shard_index个分片的非空行，行号（从0开始）除以num_shards余shard_index的行属于该分片
+    :param start: 跳过行号小于start的行（断点续跑）
+    :return: (行号, 文本)
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line_number, line in enumerate(f):
+            if line_number < start or line_number % num_shards != shard_index:
+                continue
+            text = line.strip()
+            if text:
+                yield line_number, text
+
+
+def shard_output_path(output_path: str, shard_index: int, num_shards: int) -> str:
+    if num_shards == 1:
+        return output_path
+    return '{}.part-{:05d}-of-{:05d}'.format(output_path, shard_index, num_shards)
+
+
+def resume_point(output_path: str) -> int:
+    """
+    已有输出文件时返回最后一条完整结果的下一个行号，并截掉中断时写了一半的行；没有输出时返回0
+    """
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        # 从文件末尾向前找最后两个换行符
+        tail = b''
+        position = size
+        while position > 0 and tail.count(b'\n') < 2:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+        complete = tail[:tail.rfind(b'\n') + 1]
+        f.truncate(position + len(complete))
+    lines = complete.splitlines()
+    if not lines:
+        return 0
+    return int(lines[-1].split(b'\t', 1)[0]) + 1
+
+
+def ordered_parallel_map(pool: Pool, fn: Callable, items: Iterable, max_pending: int) -> Iterator:
+    """
+    与pool.imap相同按输入顺序返回结果，但最多同时提交max_pending个任务，
+    不会像imap那样把整个输入迭代器一次读进内存
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(fn, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkScorer(object):
+    """
+    Scores a text file with one post per line, streaming end to end.
+
+    Lines are read in chunks of `chunk_size` and segmented by `workers` processes; at most
+    2 * workers chunks are in flight, so memory stays flat however large the file is. Segmented
+    posts are regrouped into batches of `batch_size` for `score`, and every batch is appended to
+    the output (`line number \\t label \\t confidence`) and flushed. Re-running on the same output
+    resumes after the last complete line; with `num_shards > 1` every shard writes its own file.
+    """
+
+    def __init__(self,
+                 score: ScoreFn = None,
+                 batch_size: int = 256,
+                 workers: int = 0,
+                 chunk_size: int = 1000,
+                 tokenize: Callable[[List[str]], List[List[str]]] = jieba_cut):
+        """
+        :param score: model call on a batch, may be set after construction
+        :param batch_size: posts per model call
+        :param workers: segmentation processes, 0 for all cores but one (left for the model)
+        :param chunk_size: posts per segmentation task
+        :param tokenize: picklable function segmenting a list of texts
+        """
+        self.score = score
+        self.batch_size = batch_size
+        self.workers = workers or max(available_cores() - 1, 1)
+        self.chunk_size = chunk_size
+        self.tokenize = tokenize
+        # 在加载模型之前启动分词进程，子进程不继承TensorFlow的线程状态
+        self.pool = Pool(self.workers)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def _segmented_posts(self, lines: Iterator[Tuple[int, str]]) -> Iterator[Tuple[int, List[str]]]:
+        texts = chunked(lines, self.chunk_size)
+        # tokenize在子进程中执行，只传函数和文本，不传self
+        for line_numbers, words in ordered_parallel_map(self.pool, _segment_chunk,
+                                                        ((self.tokenize, chunk) for chunk in texts),
+                                                        max_pending=2 * self.workers):
+            yield from zip(line_numbers, words)
+
+    def run(self, input_path: str, output_path: str, shard_index: int = 0, num_shards: int = 1,
+            log_every: int = 100) -> dict:
+        """
+        :return: posts scored in this run, elapsed seconds, posts/s and posts/s per core
+        """
+        output_path = shard_output_path(output_path, shard_index, num_shards)
+        start_line = resume_point(output_path)
+        if start_line:
+            logging.info('resuming {} from line {}'.format(output_path, start_line))
+        posts = self._segmented_posts(shard_lines(input_path, shard_index, num_shards, start_line))
+
+        scored = 0
+        start = time.time()
+        with open(output_path, 'a', encoding='utf-8') as f:
+            for i, batch in enumerate(chunked(posts, self.batch_size)):
+                labels, confidences = self.score([words for _, words in batch])
+                f.write(''.join('{}\t{}\t{:.6f}\n'.format(line_number, label, confidence)
+                                for (line_number, _), label, confidence in zip(batch, labels, confidences)))
+                f.flush()
+                scored += len(batch)
+                if log_every and (i + 1) % log_every == 0:
+                    logging.info('{} posts, {:.0f} posts/s'.format(scored, scored / (time.time() - start)))
+        elapsed = time.time() - start
+        posts_per_second = scored / elapsed if elapsed > 0 else 0.
+        return {'posts': scored,
+                'seconds': elapsed,
+                'posts_per_second': posts_per_second,
+                'posts_per_second_per_core': posts_per_second / available_cores()}
+
+
+def _segment_chunk(task):
+    tokenize, chunk = task
+    return [line_number for line_number, _ in chunk], tokenize([text for _, text in chunk])
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""weibo60000数据集的读取与划分，与BERT目录下训练脚本的处理方式一致"""
+import multiprocessing
+
+import jieba
+import numpy as np
+from keras.utils import Sequence
+from tqdm import tqdm
+
+
+def read_data(dataset_path, label):
+    """读取一个类别的数据，并用jieba分词"""
+    x_list = []
+    y_list = []
+    lines = open(dataset_path, 'r', encoding='utf-8').readlines()
+    for line in tqdm(lines):
+        line = line.strip()
+        if len(line) > 1:
+            y_list.append(label)
+            x_list.append(list(jieba.cut(line)))
+    return x_list, y_list
+
+
+def cut_texts(texts, workers=0):
+    """
+    用jieba的并行模式（多进程，按行分配）对一批句子分词，不支持并行模式的平台上逐句分词
+    :param texts: 句子列表
+    :param workers: 进程数，0为全部CPU核
+    :return: 每个句子的词列表，不含空白
+    """
+    # 句子内的换行等空白统一成空格，保证按行切分后与句子一一对应
+    lines = [' '.join(text.split()) for text in texts]
+    try:
+        jieba.enable_parallel(workers or multiprocessing.cpu_count())
+    except NotImplementedError:
+        return [[word for word in jieba.cut(line) if word.strip()] for line in lines]
+    try:
+        words = jieba.cut('\n'.join(lines) + '\n')
+        result, sentence = [], []
+        for word in words:
+            if word == '\n':
+                result.append(sentence)
+                sentence = []
+            elif word.strip():
+                sentence.append(word)
+        return result
+    finally:
+        jieba.disable_parallel()
+
+
+def jieba_cut(texts):
+    """
+    逐句分词，可以pickle，供推理服务和离线打分的分词进程使用，进程第一次调用时加载jieba词典
+    :param texts: 句子列表
+    :return: 每个句子的词列表，不含空白
+    """
+    return [[word for word in jieba.cut(text.strip()) if word.strip()] for text in texts]
+
+
+def load_weibo_splits(pos_data_path='../dataset/weibo60000/pos60000_utf8.txt_updated',
+                      neg_data_path='../dataset/weibo60000/neg60000_utf8.txt_updated'):
+    """
+    按训练脚本中的下标划分训练集/开发集/测试集
+    :return: (train_x, train_y), (val_x, val_y), (test_x, test_y)
+    """
+    pos_x, pos_y = read_data(pos_data_path, '1')
+    neg_x, neg_y = read_data(neg_data_path, '0')
+
+    train = (pos_x[:41025] + neg_x[:41165], pos_y[:41025] + neg_y[:41165])
+    val = (pos_x[41025:52746] + neg_x[41165:52926], pos_y[41025:52746] + neg_y[41165:52926])
+    test = (pos_x[52746:] + neg_x[52926:], pos_y[52746:] + neg_y[52926:])
+    return train, val, test
+
+
+class LengthTrimmedBatches(Sequence):
+    """
+    post-padding的词id序列按batch截断到batch内最长句子的长度。
+    bucket_size>0时先打乱，再在每bucket_size个样本内按长度排序，使同一batch的句子长度相近、剩余的padding更少；
+    每个epoch结束时重新打乱batch的顺序
+    """
+
+    def __init__(self, x, y, batch_size, bucket_size=0, shuffle=True, seed=10):
+        """
+        :param x: (样本数, max_len)，末尾用0补齐（pad_sequences(..., padding='post')）
+        :param y: 标签
+        :param batch_size:
+        :param bucket_size: 一起按长度排序的样本数，为0时保持打乱后的顺序
+        :param shuffle: 每个epoch结束时是否重新打乱
+        :param seed:
+        """
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.lengths = np.maximum((x != 0).sum(1), 1)
+        self.random = np.random.RandomState(seed)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __getitem__(self, idx):
+        batch = self.batches[idx]
+        return self.x[batch, :self.lengths[batch].max()], self.y[batch]
+
+    def on_epoch_end(self):
+        indices = self.random.permutation(len(self.x)) if self.shuffle else np.arange(len(self.x))
+        if self.bucket_size > 0:
+            indices = np.concatenate([chunk[np.argsort(self.lengths[chunk], kind='mergesort')]
+                                      for chunk in np.array_split(indices, max(len(indices) // self.bucket_size, 1))])
+        self.batches = [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+        if self.shuffle:
+            self.random.shuffle(self.batches)
+
+    def computed_fraction(self):
+        """截断后实际参与计算的位置占补齐到max_len时的比例"""
+        kept = sum(len(batch) * self.lengths[batch].max() for batch in self.batches)
+        return kept / float(self.x.shape[0] * self.x.shape[1])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""把训练好的keras模型复制成只用于推理的版本"""
+import json
+
+import tensorflow as tf
+from keras import backend as K
+from keras.models import Model, model_from_json
+from tensorflow.tools.graph_transforms import TransformGraph
+
+RECURRENT_LAYERS = ('LSTM', 'GRU', 'SimpleRNN', 'FusedLSTM', 'FusedGRU')
+
+
+def set_unroll(config):
+    """递归地把配置中所有循环层设置为unroll=True，序列长度固定时可以去掉while循环"""
+    if isinstance(config, dict):
+        if config.get('class_name') in RECURRENT_LAYERS:
+            config['config']['unroll'] = True
+        for value in config.values():
+            set_unroll(value)
+    elif isinstance(config, list):
+        for value in config:
+            set_unroll(value)
+    return config
+
+
+def inference_copy(model: Model, custom_objects=None, unroll=False):
+    """
+    在新的graph中以learning_phase=0重建模型并拷贝权重，
+    Dropout/SpatialDropout1D在构图时就被去掉，不再依赖learning_phase的tf.cond
+    :param model: 训练好的keras模型
+    :param custom_objects: 自定义层
+    :param unroll: 是否展开循环层
+    :return: (copied model, graph, session)
+    """
+    config = json.loads(model.to_json())
+    if unroll:
+        set_unroll(config)
+    weights = model.get_weights()
+
+    graph = tf.Graph()
+    with graph.as_default():
+        session = tf.Session(graph=graph)
+        with session.as_default():
+            K.set_learning_phase(0)
+            copied = model_from_json(json.dumps(config), custom_objects=custom_objects)
+            copied.set_weights(weights)
+    return copied, graph, session
+
+
+INFERENCE_TRANSFORMS = [
+    'strip_unused_nodes',
+    'remove_nodes(op=Identity, op=CheckNumerics, op=StopGradient)',
+    'fold_constants(ignore_errors=true)',
+    'fold_batch_norms',
+    'fold_old_batch_norms',
+    'merge_duplicate_nodes',
+    'strip_unused_nodes',
+    'sort_by_execution_order'
+]
+
+
+def freeze_inference_graph(model: Model, custom_objects=None, transforms=None):
+    """
+    冻结为只用于推理的graph：变量转为常量，去掉训练用的节点，
+    折叠常量与batch norm，Dropout在learning_phase=0下构图时已被去掉
+    :param model: 训练好的keras模型
+    :param custom_objects: 自定义层
+    :param transforms: graph_transforms的变换列表，默认INFERENCE_TRANSFORMS
+    :return: (graph_def, input names, output names)
+    """
+    copied, graph, session = inference_copy(model, custom_objects)
+    with graph.as_default(), session.as_default():
+        input_names = [tensor.op.name for tensor in copied.inputs]
+        output_names = [tensor.op.name for tensor in copied.outputs]
+        graph_def = tf.graph_util.convert_variables_to_constants(session,
+                                                                 graph.as_graph_def(),
+                                                                 output_names)
+        graph_def = tf.graph_util.remove_training_nodes(graph_def, protected_nodes=output_names)
+        graph_def = TransformGraph(graph_def,
+                                   input_names,
+                                   output_names,
+                                   transforms or INFERENCE_TRANSFORMS)
+    session.close()
+    return graph_def, input_names, output_names
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+from keras import activations, initializers
+from keras import backend as K
+from keras.engine.topology import Layer
+from keras.layers import GRU, LSTM
+
+
+def top_k_steps(inputs, k, keep_order=False):
+    """
+    k largest values along the last axis
+    :param inputs: tensor with shape `(batch_size, channels, steps)`
+    :param k:
+    :param keep_order: keep the selected values in step order instead of descending value order
+    :return: tensor with shape `(batch_size, channels, k)`
+    """
+    values, indices = tf.nn.top_k(inputs, k=k, sorted=not keep_order)
+    if keep_order:
+        # 按选中的下标升序重排，只在k个值上操作
+        order = tf.nn.top_k(-indices, k=k, sorted=True)[1]
+        values = tf.batch_gather(values, order)
+    return values
+
+
+def flatten_k_max(values, filters, k):
+    """
+    lay out `(batch_size, channels, k)` k-max values branch by branch like
+    `KMaxPooling(k)` + `Flatten` on every branch followed by `concatenate`
+    """
+    values = tf.transpose(values, [0, 2, 1])
+    if len(filters) == 1:
+        return K.reshape(values, (-1, k * filters[0]))
+    branches = tf.split(values, filters, axis=2)
+    return K.concatenate([K.reshape(branch, (-1, k * branch_filters))
+                          for branch, branch_filters in zip(branches, filters)], axis=-1)
+
+
+class FusedConvPool1D(Layer):
+    """
+    Several `Conv1D` branches with different kernel sizes over the same sequence, followed by
+    global pooling of every branch, computed as a single convolution.
+
+    The input is right padded once by `max(kernel_sizes) - 1` steps and convolved with the
+    branch kernels zero-padded to the largest kernel size and stacked along the filter axis.
+    Step `t` of branch `i` is then exactly the `valid` convolution output of that branch for
+    `t < steps - kernel_sizes[i] + 1`; the remaining steps are masked out before pooling.
+
+    Weights are kept per branch (`kernel_i`, `bias_i`, `attention_i`) with the same shapes as
+    the separate `Conv1D` / `AttentionWeightedAverage` layers, so trained weights can be copied
+    over directly.
+
+    # Arguments
+        filters: list of int, filters of every branch.
+        kernel_sizes: list of int, kernel size of every branch.
+        pooling: list of pooling applied to every branch, the pooled features are concatenated
+            in this order, branch by branch inside each pooling.
+            `max`: GlobalMaxPooling1D, `average`: GlobalAveragePooling1D,
+            `attention`: AttentionWeightedAverage, `kmax`: KMaxPooling(k) + Flatten.
+        k: k of the `kmax` pooling.
+        keep_order: keep the `kmax` values in step order, see :class:`KMaxPooling1D`.
+    # Input shape
+        3D tensor with shape `(batch_size, steps, features)`
+    # Output shape
+        2D tensor with shape `(batch_size, pooled_features)`
+    """
+
+    POOLING = ('max', 'average', 'attention', 'kmax')
+
+    def __init__(self,
+                 filters,
+                 kernel_sizes,
+                 activation='relu',
+                 kernel_initializer='glorot_uniform',
+                 bias_initializer='zeros',
+                 attention_initializer='uniform',
+                 pooling=('max',),
+                 k=3,
+                 keep_order=False,
+                 **kwargs):
+        if len(filters) != len(kernel_sizes):
+            raise ValueError('filters and kernel_sizes must have the same length')
+        for mode in pooling:
+            if mode not in self.POOLING:
+                raise ValueError('unknown pooling `{}`'.format(mode))
+        self.filters = list(filters)
+        self.kernel_sizes = list(kernel_sizes)
+        self.activation = activations.get(activation)
+        self.kernel_initializer = initializers.get(kernel_initializer)
+        self.bias_initializer = initializers.get(bias_initializer)
+        self.attention_initializer = initializers.get(attention_initializer)
+        self.pooling = list(pooling)
+        self.k = k
+        self.keep_order = keep_order
+        self.max_kernel_size = max(self.kernel_sizes)
+        super(FusedConvPool1D, self).__init__(**kwargs)
+
+    @classmethod
+    def from_conv_params(cls, conv_params, **kwargs):
+        """
+        build from the `Conv1D` hyper parameters of the branches
+        :param conv_params: list of Conv1D kwargs, only `valid` padding and stride 1 are supported
+        :param kwargs: pooling and k
+        :return:
+        """
+        for params in conv_params:
+            if params.get('padding', 'valid') != 'valid' or params.get('strides', 1) != 1:
+                raise ValueError('fused convolution only supports valid padding with stride 1')
+            if params.get('activation') != conv_params[0].get('activation') or \
+                    params.get('kernel_initializer') != conv_params[0].get('kernel_initializer'):
+                raise ValueError('all branches must share activation and kernel_initializer')
+        return cls(filters=[params['filters'] for params in conv_params],
+                   kernel_sizes=[params['kernel_size'] for params in conv_params],
+                   activation=conv_params[0].get('activation'),
+                   kernel_initializer=conv_params[0].get('kernel_initializer', 'glorot_uniform'),
+                   **kwargs)
+
+    def build(self, input_shape):
+        input_dim = input_shape[-1]
+        self.kernels = []
+        self.biases = []
+        self.attentions = []
+        for i, (filters, kernel_size) in enumerate(zip(self.filters, self.kernel_sizes)):
+            self.kernels.append(self.add_weight(name='kernel_{}'.format(i),
+                                                shape=(kernel_size, input_dim, filters),
+                                                initializer=self.kernel_initializer))
+            self.biases.append(self.add_weight(name='bias_{}'.format(i),
+                                               shape=(filters,),
+                                               initializer=self.bias_initializer))
+            if 'attention' in self.pooling:
+                self.attentions.append(self.add_weight(name='attention_{}'.format(i),
+                                                       shape=(filters, 1),
+                                                       initializer=self.attention_initializer))
+
+        # 每个输出通道所属分支的卷积核大小，以及分支的one-hot归属矩阵
+        self.channel_kernel_sizes = np.repeat(self.kernel_sizes, self.filters).astype('int32')
+        self.branch_onehot = np.zeros((len(self.filters), sum(self.filters)), dtype=K.floatx())
+        offset = 0
+        for i, filters in enumerate(self.filters):
+            self.branch_onehot[i, offset: offset + filters] = 1
+            offset += filters
+        super(FusedConvPool1D, self).build(input_shape)
+
+    def fused_kernel(self):
+        kernels = [tf.pad(kernel, [[0, self.max_kernel_size - kernel_size], [0, 0], [0, 0]])
+                   for kernel, kernel_size in zip(self.kernels, self.kernel_sizes)]
+        return K.concatenate(kernels, axis=-1), K.concatenate(self.biases, axis=-1)
+
+    def _attention_pool(self, outputs, steps):
+        total = sum(self.filters)
+        columns = []
+        offset = 0
+        for attention, filters in zip(self.attentions, self.filters):
+            columns.append(tf.pad(attention, [[offset, total - offset - filters], [0, 0]]))
+            offset += filters
+        # (batch, steps, branches)，每个分支一个注意力logit
+        logits = K.dot(outputs, K.concatenate(columns, axis=-1))
+        branch_limits = steps - K.constant(self.kernel_sizes, dtype='int32') + 1
+        branch_valid = K.cast(K.expand_dims(tf.range(steps), 1) < K.expand_dims(branch_limits, 0),
+                              K.floatx())
+        logits_max = K.max(logits - (1 - branch_valid) * 1e9, axis=1, keepdims=True)
+        ai = K.exp(logits - logits_max) * branch_valid
+        att_weights = ai / (K.sum(ai, axis=1, keepdims=True) + K.epsilon())
+        att_weights = K.dot(att_weights, K.constant(self.branch_onehot))
+        return K.sum(outputs * att_weights, axis=1)
+
+    def _kmax_pool(self, masked):
+        values = top_k_steps(tf.transpose(masked, [0, 2, 1]), self.k, self.keep_order)
+        return flatten_k_max(values, self.filters, self.k)
+
+    def call(self, inputs):
+        kernel, bias = self.fused_kernel()
+        padded = K.temporal_padding(inputs, (0, self.max_kernel_size - 1))
+        outputs = self.activation(K.bias_add(K.conv1d(padded, kernel, padding='valid'), bias))
+
+        # (steps, channels)，分支i只有前 steps - kernel_size_i + 1 步是有效输出
+        steps = K.shape(inputs)[1]
+        limits = steps - K.constant(self.channel_kernel_sizes, dtype='int32') + 1
+        valid = K.cast(K.expand_dims(tf.range(steps), 1) < K.expand_dims(limits, 0), K.floatx())
+        masked = outputs - (1 - valid) * 1e9
+
+        pooled = []
+        for mode in self.pooling:
+            if mode == 'max':
+                pooled.append(K.max(masked, axis=1))
+            elif mode == 'average':
+                pooled.append(K.sum(outputs * valid, axis=1) / K.cast(limits, K.floatx()))
+            elif mode == 'attention':
+                pooled.append(self._attention_pool(outputs, steps))
+            elif mode == 'kmax':
+                pooled.append(self._kmax_pool(masked))
+        if len(pooled) == 1:
+            return pooled[0]
+        return K.concatenate(pooled, axis=-1)
+
+    def compute_output_shape(self, input_shape):
+        size = 0
+        for mode in self.pooling:
+            size += sum(self.filters) * (self.k if mode == 'kmax' else 1)
+        return input_shape[0], size
+
+    def get_config(self):
+        config = {
+            'filters': self.filters,
+            'kernel_sizes': self.kernel_sizes,
+            'activation': activations.serialize(self.activation),
+            'kernel_initializer': initializers.serialize(self.kernel_initializer),
+            'bias_initializer': initializers.serialize(self.bias_initializer),
+            'attention_initializer': initializers.serialize(self.attention_initializer),
+            'pooling': self.pooling,
+            'k': self.k,
+            'keep_order': self.keep_order
+        }
+        base_config = super(FusedConvPool1D, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class KMaxPooling1D(Layer):
+    """
+    K-max pooling over the steps of one or several sequences, a drop-in replacement for
+    `KMaxPooling(k)` + `Flatten` on every branch followed by `concatenate`.
+
+    Several branches (e.g. `Conv1D` outputs with different kernel sizes, hence different
+    lengths) are padded to the same length with a large negative value and stacked along the
+    channel axis, so a single transpose and a single `top_k` serve all of them.
+
+    # Arguments
+        k: number of values kept per channel.
+        keep_order: keep the k values in the order they appear in the sequence (the k-max
+            pooling of Kalchbrenner et al.). `False` keeps them in descending value order,
+            the same as `kashgari.layers.KMaxPooling`, so trained weights stay compatible.
+    # Input shape
+        3D tensor with shape `(batch_size, steps, features)`, or a list of them
+    # Output shape
+        2D tensor with shape `(batch_size, k * sum(features))`
+    """
+
+    def __init__(self, k=3, keep_order=False, **kwargs):
+        self.k = k
+        self.keep_order = keep_order
+        super(KMaxPooling1D, self).__init__(**kwargs)
+
+    def call(self, inputs):
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        filters = [K.int_shape(x)[-1] for x in inputs]
+        if len(inputs) > 1:
+            steps = [K.shape(x)[1] for x in inputs]
+            max_steps = K.max(K.stack(steps))
+            inputs = [tf.pad(x, [[0, 0], [0, max_steps - step], [0, 0]], constant_values=-1e9)
+                      for x, step in zip(inputs, steps)]
+        stacked = K.concatenate(inputs, axis=-1) if len(inputs) > 1 else inputs[0]
+        values = top_k_steps(tf.transpose(stacked, [0, 2, 1]), self.k, self.keep_order)
+        return flatten_k_max(values, filters, self.k)
+
+    def compute_output_shape(self, input_shape):
+        if not isinstance(input_shape, list):
+            input_shape = [input_shape]
+        return input_shape[0][0], self.k * sum(shape[-1] for shape in input_shape)
+
+    def get_config(self):
+        config = {
+            'k': self.k,
+            'keep_order': self.keep_order
+        }
+        base_config = super(KMaxPooling1D, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class _FusedRecurrent(object):
+    """
+    `call` shared by :class:`FusedLSTM` and :class:`FusedGRU`.
+
+    The input projection `x_t W + b` of every step is computed for the whole sequence with one
+    matrix multiplication before the loop, and the input / recurrent dropout masks are sampled
+    once per batch outside the step function, so each step only multiplies the previous hidden
+    state by the recurrent kernel. Setting `recurrent_dropout` no longer changes the step cost.
+    """
+
+    def _input_bias(self):
+        raise NotImplementedError()
+
+    def _recurrent_weights(self):
+        raise NotImplementedError()
+
+    def _step(self, x, h_dropped, states, weights):
+        raise NotImplementedError()
+
+    def call(self, inputs, mask=None, training=None, initial_state=None):
+        if isinstance(inputs, list):
+            inputs = inputs[0]
+        if isinstance(mask, list):
+            mask = mask[0]
+        if self.stateful:
+            raise ValueError('{} does not support stateful=True'.format(self.__class__.__name__))
+        if initial_state is None:
+            initial_state = self.get_initial_state(inputs)
+        cell = self.cell
+
+        if 0 < cell.dropout < 1:
+            ones = K.ones_like(inputs[:, 0, :])
+            dp_mask = K.in_train_phase(K.dropout(ones, cell.dropout), ones, training=training)
+            inputs = inputs * K.expand_dims(dp_mask, 1)
+        projected = K.dot(inputs, cell.kernel)
+        if cell.use_bias:
+            projected = K.bias_add(projected, self._input_bias())
+
+        constants = []
+        if 0 < cell.recurrent_dropout < 1:
+            ones = K.ones_like(initial_state[0])
+            constants.append(K.in_train_phase(K.dropout(ones, cell.recurrent_dropout), ones,
+                                              training=training))
+        weights = self._recurrent_weights()
+        num_states = len(initial_state)
+
+        def step(x, states):
+            h_dropped = states[0] * states[num_states] if constants else states[0]
+            return self._step(x, h_dropped, states[:num_states], weights)
+
+        last_output, outputs, states = K.rnn(step,
+                                             projected,
+                                             initial_state,
+                                             constants=constants,
+                                             go_backwards=self.go_backwards,
+                                             mask=mask,
+                                             unroll=self.unroll,
+                                             input_length=K.int_shape(inputs)[1])
+        output = outputs if self.return_sequences else last_output
+        if 0 < cell.dropout + cell.recurrent_dropout:
+            output._uses_learning_phase = True
+            for state in states:
+                state._uses_learning_phase = True
+        if self.return_state:
+            return [output] + list(states)
+        return output
+
+
+class FusedLSTM(_FusedRecurrent, LSTM):
+    """
+    `LSTM` with the input projection hoisted out of the time loop, see :class:`_FusedRecurrent`.
+    Weights have the same names and shapes as `LSTM`, dropout masks are shared by the four
+    gates (as in `LSTM(implementation=2)`).
+    """
+
+    def _input_bias(self):
+        return self.cell.bias
+
+    def _recurrent_weights(self):
+        return self.cell.recurrent_kernel
+
+    def _step(self, x, h_dropped, states, recurrent_kernel):
+        cell = self.cell
+        units = cell.units
+        z = x + K.dot(h_dropped, recurrent_kernel)
+        i = cell.recurrent_activation(z[:, :units])
+        f = cell.recurrent_activation(z[:, units: 2 * units])
+        c = f * states[1] + i * cell.activation(z[:, 2 * units: 3 * units])
+        o = cell.recurrent_activation(z[:, 3 * units:])
+        h = o * cell.activation(c)
+        return h, [h, c]
+
+
+class FusedGRU(_FusedRecurrent, GRU):
+    """
+    `GRU` with the input projection hoisted out of the time loop, see :class:`_FusedRecurrent`.
+    Weights have the same names and shapes as `GRU`, both `reset_after` variants are supported.
+    """
+
+    def _input_bias(self):
+        return self.cell.bias[0] if self.cell.reset_after else self.cell.bias
+
+    def _recurrent_weights(self):
+        cell = self.cell
+        units = cell.units
+        if cell.reset_after:
+            return cell.recurrent_kernel, cell.bias[1] if cell.use_bias else None
+        return cell.recurrent_kernel[:, :2 * units], cell.recurrent_kernel[:, 2 * units:]
+
+    def _step(self, x, h_dropped, states, weights):
+        cell = self.cell
+        units = cell.units
+        h_tm1 = states[0]
+        if cell.reset_after:
+            recurrent_kernel, recurrent_bias = weights
+            inner = K.dot(h_dropped, recurrent_kernel)
+            if recurrent_bias is not None:
+                inner = K.bias_add(inner, recurrent_bias)
+        else:
+            inner = K.dot(h_dropped, weights[0])
+        z = cell.recurrent_activation(x[:, :units] + inner[:, :units])
+        r = cell.recurrent_activation(x[:, units: 2 * units] + inner[:, units: 2 * units])
+        if cell.reset_after:
+            recurrent_h = r * inner[:, 2 * units:]
+        else:
+            recurrent_h = K.dot(r * h_dropped, weights[1])
+        hh = cell.activation(x[:, 2 * units:] + recurrent_h)
+        h = z * h_tm1 + (1 - z) * hh
+        return h, [h]
+
+
+custom_objects = {
+    'FusedConvPool1D': FusedConvPool1D,
+    'KMaxPooling1D': KMaxPooling1D,
+    'FusedLSTM': FusedLSTM,
+    'FusedGRU': FusedGRU
+}
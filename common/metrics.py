@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""向量化的分类指标：准确率、每个类别的P/R/F1、混淆矩阵和AUC，可以一次计算也可以按batch累积"""
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+def accuracy(y_true, y_pred) -> float:
+    y_true, y_pred = np.asarray(y_true), np.asarray(y_pred)
+    if len(y_true) == 0:
+        return 0.
+    return float(np.mean(y_true == y_pred))
+
+
+def probabilities_to_labels(probs: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+    """sigmoid输出(样本数,)/(样本数, 1)按阈值取0/1，softmax输出取argmax"""
+    probs = np.asarray(probs)
+    if probs.ndim == 1 or probs.shape[-1] == 1:
+        return (probs.reshape(-1) > threshold).astype(np.int32)
+    return probs.argmax(-1)
+
+
+def confusion_matrix(y_true, y_pred, labels: Sequence = None) -> np.ndarray:
+    """
+    :param labels: 类别的顺序，默认为出现过的类别排序后的结果
+    :return: (类别数, 类别数)，第i行第j列为真实类别labels[i]被预测为labels[j]的样本数
+    """
+    y_true, y_pred = np.asarray(y_true), np.asarray(y_pred)
+    labels = np.unique(np.concatenate([y_true, y_pred])) if labels is None else np.asarray(labels)
+    order = np.argsort(labels, kind='mergesort')
+    sorted_labels = labels[order]
+    n = len(labels)
+
+    def label_index(y):
+        position = np.clip(np.searchsorted(sorted_labels, y), 0, n - 1)
+        known = sorted_labels[position] == y
+        return order[position], known
+
+    true_index, true_known = label_index(y_true)
+    pred_index, pred_known = label_index(y_pred)
+    known = true_known & pred_known
+    return np.bincount(true_index[known] * n + pred_index[known], minlength=n * n).reshape(n, n)
+
+
+def precision_recall_f1(cm: np.ndarray) -> Dict[str, np.ndarray]:
+    """由混淆矩阵得到每个类别的precision、recall、f1和support，分母为0时记为0"""
+    tp = np.diag(cm).astype(np.float64)
+    predicted = cm.sum(0)
+    support = cm.sum(1)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    denominator = precision + recall
+    f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(tp), where=denominator > 0)
+    return {'precision': precision, 'recall': recall, 'f1': f1, 'support': support}
+
+
+def roc_auc(y_true, scores, pos_label=1) -> float:
+    """
+    二分类AUC，按Mann-Whitney U统计量计算，相同得分取平均秩，不需要逐个阈值计算ROC曲线
+    :param scores: 正类的概率或得分
+    """
+    positive = np.asarray(y_true) == pos_label
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    n_pos = int(positive.sum())
+    n_neg = len(positive) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float('nan')
+    order = np.argsort(scores, kind='mergesort')
+    sorted_scores = scores[order]
+    # 相同得分的样本取平均秩
+    boundaries = np.concatenate([[0], np.flatnonzero(np.diff(sorted_scores)) + 1, [len(scores)]])
+    average_rank = (boundaries[:-1] + boundaries[1:] + 1) / 2.
+    ranks = np.empty(len(scores))
+    ranks[order] = np.repeat(average_rank, np.diff(boundaries))
+    return float((ranks[positive].sum() - n_pos * (n_pos + 1) / 2.) / (n_pos * n_neg))
+
+
+def format_report(cm: np.ndarray, labels: Sequence, auc: float = None, digits: int = 4) -> str:
+    """与sklearn.metrics.classification_report格式一致的文本报告，另外附上AUC"""
+    scores = precision_recall_f1(cm)
+    support = scores['support']
+    total = max(int(support.sum()), 1)
+    names = [str(label) for label in labels]
+    width = max([len(name) for name in names] + [len('weighted avg'), digits])
+    head = '{:>{width}s} ' + ' {:>9}' * 4 + '\n\n'
+    row = '{:>{width}s} ' + ' {:>9.{digits}f}' * 3 + ' {:>9}\n'
+    report = head.format('', 'precision', 'recall', 'f1-score', 'support', width=width)
+    for i, name in enumerate(names):
+        report += row.format(name, scores['precision'][i], scores['recall'][i], scores['f1'][i], int(support[i]),
+                             width=width, digits=digits)
+    report += '\n'
+    report += ('{:>{width}s} ' + ' {:>9}' * 2 + ' {:>9.{digits}f} {:>9}\n').format(
+        'accuracy', '', '', np.trace(cm) / total, total, width=width, digits=digits)
+    for name, weights in [('macro avg', np.ones(len(names)) / max(len(names), 1)),
+                          ('weighted avg', support / total)]:
+        report += row.format(name, scores['precision'].dot(weights), scores['recall'].dot(weights),
+                             scores['f1'].dot(weights), total, width=width, digits=digits)
+    if auc is not None:
+        report += '\n{:>{width}s}  {:>9.{digits}f}\n'.format('auc', auc, width=width, digits=digits)
+    return report
+
+
+def classification_report(y_true, y_pred, labels: Sequence = None, scores=None, digits: int = 4) -> str:
+    """
+    :param scores: 二分类时正类（labels中的最后一个类别）的概率，给出时报告AUC
+    """
+    y_true, y_pred = np.asarray(y_true), np.asarray(y_pred)
+    labels = np.unique(np.concatenate([y_true, y_pred])) if labels is None else np.asarray(labels)
+    cm = confusion_matrix(y_true, y_pred, labels)
+    auc = roc_auc(y_true, scores, pos_label=labels[-1]) if scores is not None and len(labels) == 2 else None
+    return format_report(cm, labels, auc=auc, digits=digits)
+
+
+def binary_report(y_true, probs, threshold: float = 0.5, digits: int = 4) -> str:
+    """sigmoid输出的0/1分类模型的报告，包括AUC"""
+    probs = np.asarray(probs).reshape(-1)
+    return classification_report(np.asarray(y_true).astype(np.int32), probabilities_to_labels(probs, threshold),
+                                 labels=[0, 1], scores=probs, digits=digits)
+
+
+class StreamingMetrics(object):
+    """
+    Accumulates the confusion matrix batch by batch. For binary tasks it also keeps the
+    positive-class score of every sample (8 bytes each) so the AUC is the exact :func:`roc_auc`,
+    the same number the in-memory reports print.
+    """
+
+    def __init__(self, labels: Sequence):
+        self.labels = np.asarray(labels)
+        self.cm = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        self.y_true = []
+        self.scores = []
+
+    def update(self, y_true, y_pred, scores=None):
+        """
+        :param scores: 二分类时正类（labels[1]）的概率或得分，接近0/1的概率会并列，最好传logit等无界的得分
+        """
+        y_true = np.asarray(y_true)
+        self.cm += confusion_matrix(y_true, y_pred, self.labels)
+        if scores is not None and len(self.labels) == 2:
+            self.y_true.append(y_true)
+            self.scores.append(np.asarray(scores, dtype=np.float64).reshape(-1))
+
+    @property
+    def accuracy(self) -> float:
+        return float(np.trace(self.cm) / max(self.cm.sum(), 1))
+
+    @property
+    def auc(self) -> float:
+        if not self.scores:
+            return float('nan')
+        return roc_auc(np.concatenate(self.y_true), np.concatenate(self.scores), pos_label=self.labels[1])
+
+    def report(self, digits: int = 4) -> str:
+        auc = self.auc if self.scores else None
+        return format_report(self.cm, self.labels, auc=auc, digits=digits)
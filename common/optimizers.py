@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""只更新batch中出现过的embedding行的优化器"""
+import tensorflow as tf
+from keras import backend as K
+from keras.optimizers import Adam
+
+
+class LazyAdam(Adam):
+    """
+    Adam that applies sparse (`tf.IndexedSlices`) gradients lazily, as `tf.contrib.opt.LazyAdamOptimizer`.
+
+    Gradients of an `Embedding` table only cover the rows looked up in the batch. `Adam`
+    densifies them and updates the moments and weights of every row each step; here only
+    the rows in the batch get their first / second moments and weights updated (with
+    `scatter_update`), other rows keep their state until they are seen again. Dense gradients
+    are updated exactly as `Adam` does.
+
+    `amsgrad`, weight constraints and `clipnorm` / `clipvalue` fall back to the dense update.
+    """
+
+    def get_updates(self, loss, params):
+        if self.amsgrad or getattr(self, 'clipnorm', 0) or getattr(self, 'clipvalue', 0):
+            return super(LazyAdam, self).get_updates(loss, params)
+
+        grads = K.gradients(loss, params)
+        if None in grads:
+            raise ValueError('An operation has `None` for gradient. Please make sure that all of your ops '
+                             'have a gradient defined (i.e. are differentiable).')
+        self.updates = [K.update_add(self.iterations, 1)]
+
+        lr = self.lr
+        if self.initial_decay > 0:
+            lr = lr * (1. / (1. + self.decay * K.cast(self.iterations, K.dtype(self.decay))))
+        t = K.cast(self.iterations, K.floatx()) + 1
+        lr_t = lr * (K.sqrt(1. - K.pow(self.beta_2, t)) / (1. - K.pow(self.beta_1, t)))
+
+        ms = [K.zeros(K.int_shape(p), dtype=K.dtype(p)) for p in params]
+        vs = [K.zeros(K.int_shape(p), dtype=K.dtype(p)) for p in params]
+        vhats = [K.zeros(1) for _ in params]
+        self.weights = [self.iterations] + ms + vs + vhats
+
+        for p, g, m, v in zip(params, grads, ms, vs):
+            if isinstance(g, tf.IndexedSlices) and getattr(p, 'constraint', None) is None:
+                # 同一行可能在batch中出现多次，先按行合并梯度
+                indices, positions = tf.unique(g.indices)
+                values = tf.unsorted_segment_sum(g.values, positions, tf.shape(indices)[0])
+                m_t = self.beta_1 * tf.gather(m, indices) + (1. - self.beta_1) * values
+                v_t = self.beta_2 * tf.gather(v, indices) + (1. - self.beta_2) * K.square(values)
+                p_t = tf.gather(p, indices) - lr_t * m_t / (K.sqrt(v_t) + self.epsilon)
+                self.updates.append(tf.scatter_update(m, indices, m_t))
+                self.updates.append(tf.scatter_update(v, indices, v_t))
+                self.updates.append(tf.scatter_update(p, indices, p_t))
+                continue
+
+            m_t = (self.beta_1 * m) + (1. - self.beta_1) * g
+            v_t = (self.beta_2 * v) + (1. - self.beta_2) * K.square(g)
+            p_t = p - lr_t * m_t / (K.sqrt(v_t) + self.epsilon)
+            self.updates.append(K.update(m, m_t))
+            self.updates.append(K.update(v, v_t))
+            new_p = p_t
+            if getattr(p, 'constraint', None) is not None:
+                new_p = p.constraint(new_p)
+            self.updates.append(K.update(p, new_p))
+        return self.updates
+
+
+custom_objects = {
+    'LazyAdam': LazyAdam
+}
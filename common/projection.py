@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""句向量降维：在一部分样本上拟合PCA（可选白化），之后分类和缓存都使用降维后的向量"""
+import hashlib
+
+import numpy as np
+from sklearn.decomposition import PCA
+
+
+class VectorProjection(object):
+    """
+    PCA to `dim` dimensions, optionally whitened, folded into a single affine map
+    `x @ W + b` in float32 so projecting a batch is one matrix multiply.
+    """
+
+    def __init__(self, dim: int, whiten: bool = False):
+        self.dim = dim
+        self.whiten = whiten
+        self.W = None
+        self.b = None
+        self.explained_variance_ratio = None
+
+    def fit(self, x: np.ndarray, seed: int = 0) -> 'VectorProjection':
+        """
+        :param x: (samples, input_dim) sample of the vectors, a few thousand rows are enough
+        :param seed:
+        """
+        pca = PCA(n_components=self.dim, svd_solver='randomized', random_state=seed)
+        pca.fit(np.asarray(x, dtype=np.float64))
+        W = pca.components_.T
+        if self.whiten:
+            W = W / np.sqrt(pca.explained_variance_)
+        self.W = W.astype(np.float32)
+        self.b = (-pca.mean_.dot(W)).astype(np.float32)
+        self.explained_variance_ratio = float(pca.explained_variance_ratio_.sum())
+        return self
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        return np.dot(np.asarray(x, dtype=np.float32), self.W) + self.b
+
+    @property
+    def projection_id(self) -> str:
+        """与参数一一对应的标识，作为降维后向量缓存的编码器标识的一部分"""
+        digest = hashlib.sha1(self.W.tobytes())
+        digest.update(self.b.tobytes())
+        return 'pca{}{}:{}'.format(self.dim, '-whiten' if self.whiten else '', digest.hexdigest()[:16])
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, W=self.W, b=self.b, whiten=self.whiten,
+                     explained_variance_ratio=self.explained_variance_ratio)
+
+    @classmethod
+    def load(cls, path: str) -> 'VectorProjection':
+        data = np.load(path)
+        projection = cls(data['W'].shape[1], whiten=bool(data['whiten']))
+        projection.W, projection.b = data['W'], data['b']
+        projection.explained_variance_ratio = float(data['explained_variance_ratio'])
+        return projection
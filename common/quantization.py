@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""训练后int8量化：转换为TFLite模型，在CPU上用TFLite解释器推理"""
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras.models import Model
+
+from common.export import inference_copy
+from common.metrics import accuracy, probabilities_to_labels
+
+
+def convert_to_int8(model: Model,
+                    calibration_inputs,
+                    output_path: str,
+                    custom_objects=None,
+                    calibration_batch_size: int = 1,
+                    allow_select_ops: bool = False) -> str:
+    """
+    把keras模型转换为int8量化的TFLite模型，
+    全连接、卷积、（展开后的）循环层权重以及embedding表都量化为int8，
+    激活值的量化范围由校准数据确定
+    :param model: 训练好的keras模型
+    :param calibration_inputs: 校准数据，一个输入时为ndarray，多个输入时为ndarray列表，通常取训练集的一个样本
+    :param output_path: .tflite文件路径
+    :param custom_objects: 自定义层
+    :param calibration_batch_size: 每次喂给校准器的样本数
+    :param allow_select_ops: 对TFLite不支持的算子回退到tensorflow算子（需要flex delegate）
+    :return: output_path
+    """
+    if not isinstance(calibration_inputs, list):
+        calibration_inputs = [calibration_inputs]
+
+    copied, graph, session = inference_copy(model, custom_objects, unroll=True)
+    with graph.as_default(), session.as_default():
+        dtypes = [tensor.dtype.as_numpy_dtype for tensor in copied.inputs]
+
+        def representative_dataset():
+            for start in range(0, len(calibration_inputs[0]), calibration_batch_size):
+                yield [inputs[start: start + calibration_batch_size].astype(dtype)
+                       for inputs, dtype in zip(calibration_inputs, dtypes)]
+
+        converter = tf.lite.TFLiteConverter.from_session(session, copied.inputs, copied.outputs)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = tf.lite.RepresentativeDataset(representative_dataset)
+        if allow_select_ops:
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS,
+                                                   tf.lite.OpsSet.SELECT_TF_OPS]
+        tflite_model = converter.convert()
+    session.close()
+
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    return output_path
+
+
+class TFLiteRunner(object):
+    """用TFLite解释器按批推理，接口与keras的model.predict一致"""
+
+    def __init__(self, model_path: str):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self._batch_size = None
+
+    def _resize(self, batch_size: int):
+        if batch_size == self._batch_size:
+            return
+        for detail in self.input_details:
+            shape = list(detail['shape'])
+            shape[0] = batch_size
+            self.interpreter.resize_tensor_input(detail['index'], shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def predict_on_batch(self, inputs):
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        self._resize(len(inputs[0]))
+        for detail, value in zip(self.input_details, inputs):
+            self.interpreter.set_tensor(detail['index'], value.astype(detail['dtype']))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_details[0]['index'])
+
+    def predict(self, inputs, batch_size: int = 32):
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        results = []
+        for start in range(0, len(inputs[0]), batch_size):
+            results.append(self.predict_on_batch([item[start: start + batch_size] for item in inputs]))
+        return np.concatenate(results, axis=0)
+
+
+def float_model_size(model: Model) -> int:
+    """float32权重占用的字节数"""
+    return int(sum(np.prod(w.shape) * 4 for w in model.get_weights()))
+
+
+def measure_latency(predict_fn, inputs, batch_size: int = 32, repeats: int = 20) -> float:
+    """单个batch的平均推理耗时（毫秒）"""
+    if not isinstance(inputs, list):
+        inputs = [inputs]
+    batch = [item[:batch_size] for item in inputs]
+    if len(batch) == 1:
+        batch = batch[0]
+    predict_fn(batch)
+    start = time.time()
+    for _ in range(repeats):
+        predict_fn(batch)
+    return (time.time() - start) * 1000 / repeats
+
+
+def quantization_report(model: Model,
+                        calibration_inputs,
+                        test_inputs,
+                        test_labels,
+                        output_path: str,
+                        name: str = None,
+                        custom_objects=None,
+                        batch_size: int = 32) -> dict:
+    """
+    量化模型并对比量化前后的准确率、模型大小和推理延迟
+    :param model: 训练好的keras模型
+    :param calibration_inputs: 校准数据
+    :param test_inputs: 测试数据
+    :param test_labels: 测试标签（类别下标）
+    :param output_path: .tflite文件路径
+    :param name: 报告中显示的模型名
+    :param custom_objects: 自定义层
+    :param batch_size:
+    :return:
+    """
+    convert_to_int8(model, calibration_inputs, output_path, custom_objects=custom_objects)
+    return compare_int8(model, test_inputs, test_labels, output_path, name=name, batch_size=batch_size)
+
+
+def compare_int8(model: Model,
+                 test_inputs,
+                 test_labels,
+                 tflite_path: str,
+                 name: str = None,
+                 batch_size: int = 32) -> dict:
+    """
+    对比keras模型与已转换的int8模型的准确率、模型大小和推理延迟
+    :param tflite_path: :func:`convert_to_int8` 生成的.tflite文件
+    """
+    runner = TFLiteRunner(tflite_path)
+
+    test_labels = np.asarray(test_labels)
+    float_acc = accuracy(test_labels, probabilities_to_labels(model.predict(test_inputs, batch_size=batch_size)))
+    int8_acc = accuracy(test_labels, probabilities_to_labels(runner.predict(test_inputs, batch_size=batch_size)))
+    float_size = float_model_size(model)
+    int8_size = os.path.getsize(tflite_path)
+    float_latency = measure_latency(lambda x: model.predict_on_batch(x), test_inputs, batch_size)
+    int8_latency = measure_latency(runner.predict_on_batch, test_inputs, batch_size)
+
+    report = {
+        'name': name or model.name,
+        'float_accuracy': float_acc,
+        'int8_accuracy': int8_acc,
+        'accuracy_delta': int8_acc - float_acc,
+        'float_size_mb': float_size / 2 ** 20,
+        'int8_size_mb': int8_size / 2 ** 20,
+        'size_reduction': float_size / max(int8_size, 1),
+        'float_latency_ms': float_latency,
+        'int8_latency_ms': int8_latency,
+        'speedup': float_latency / max(int8_latency, 1e-6)
+    }
+    return report
+
+
+def print_report(reports):
+    print('{:<20}{:>10}{:>10}{:>10}{:>12}{:>12}{:>8}{:>12}{:>12}{:>8}'.format(
+        'model', 'acc fp32', 'acc int8', 'delta', 'fp32 MB', 'int8 MB', 'x',
+        'fp32 ms', 'int8 ms', 'x'))
+    for r in reports:
+        print('{:<20}{:>10.4f}{:>10.4f}{:>+10.4f}{:>12.2f}{:>12.2f}{:>8.2f}{:>12.2f}{:>12.2f}{:>8.2f}'.format(
+            r['name'], r['float_accuracy'], r['int8_accuracy'], r['accuracy_delta'],
+            r['float_size_mb'], r['int8_size_mb'], r['size_reduction'],
+            r['float_latency_ms'], r['int8_latency_ms'], r['speedup']))
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+"""基于asyncio的HTTP推理服务：并发请求合并成micro-batch，分词在进程池中进行，每个batch只调用一次模型"""
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from common.dataset import jieba_cut
+
+# 一个batch的分词结果 -> 每个句子的结果（可以转成JSON）
+PredictFn = Callable[[List[List[str]]], List]
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class MicroBatcher(object):
+    """
+    Coalesces concurrent requests into micro-batches.
+
+    A batch is closed when it holds `max_batch_size` sentences or `max_wait_ms` after its first
+    sentence arrived, whichever comes first. Its texts are segmented in a process pool and then
+    scored with a single `predict` call on a dedicated thread, so the event loop keeps accepting
+    requests meanwhile. At most `max_pending_batches` batches are in flight (one segmenting while
+    another one is scored by default); under load the queue grows in the meantime, so the next
+    batch fills up instead of the model running many small batches.
+    """
+
+    def __init__(self,
+                 predict: PredictFn,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.,
+                 tokenize: Callable[[List[str]], List[List[str]]] = jieba_cut,
+                 tokenize_workers: int = 2,
+                 max_pending_batches: int = 2):
+        """
+        :param predict: scores a batch of segmented sentences, e.g. `ClassificationModel.predict` with output_dict;
+                        may be set after construction
+        :param max_batch_size:
+        :param max_wait_ms: longest time the first sentence of a batch waits for others
+        :param tokenize: picklable function segmenting a list of texts, runs in the process pool
+        :param tokenize_workers: segmentation processes, 0 to segment on the predict thread
+        :param max_pending_batches:
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self.tokenize = tokenize
+        self.tokenize_pool = None
+        if tokenize_workers > 0:
+            # 立即启动分词进程并加载词典：在加载模型之前fork，避免子进程继承TensorFlow的线程状态
+            self.tokenize_pool = ProcessPoolExecutor(tokenize_workers)
+            list(self.tokenize_pool.map(tokenize, [['']] * tokenize_workers))
+        # 模型只在一个线程里调用
+        self.predict_pool = ThreadPoolExecutor(max_workers=1)
+        self.max_pending_batches = max_pending_batches
+        self.queue = None
+        self.pending = None
+        self._task = None
+        self.batch_sizes = []
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.pending = asyncio.Semaphore(self.max_pending_batches)
+        self._task = asyncio.ensure_future(self._collect())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.tokenize_pool is not None:
+            self.tokenize_pool.shutdown()
+        self.predict_pool.shutdown()
+
+    async def submit(self, texts: List[str]) -> List:
+        """提交一个请求的句子，返回这些句子的预测结果"""
+        loop = asyncio.get_event_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self.pending.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        loop = asyncio.get_event_loop()
+        texts = [text for text, _ in batch]
+        try:
+            if self.tokenize_pool is not None:
+                words = await loop.run_in_executor(self.tokenize_pool, self.tokenize, texts)
+                results = await loop.run_in_executor(self.predict_pool, self.predict, words)
+            else:
+                results = await loop.run_in_executor(self.predict_pool,
+                                                     lambda: self.predict(self.tokenize(texts)))
+            self.batch_sizes.append(len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logging.exception('batch of {} failed'.format(len(batch)))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.pending.release()
+
+    def stats(self) -> Dict:
+        sizes = np.asarray(self.batch_sizes)
+        return {'batches': len(sizes),
+                'sentences': int(sizes.sum()),
+                'mean_batch_size': float(sizes.mean()) if len(sizes) else 0.}
+
+
+class InferenceServer(object):
+    """
+    Minimal HTTP/1.1 server (keep-alive, JSON only) in front of a :class:`MicroBatcher`.
+
+    * POST /predict with {"text": "..."} returns {"result": ...}, with {"texts": [...]} returns {"results": [...]}
+    * GET /health returns {"status": "ok"}
+    * GET /stats returns the micro-batch statistics
+    """
+
+    def __init__(self, batcher: MicroBatcher, host: str = '0.0.0.0', port: int = 8000,
+                 max_body_bytes: int = 1 << 20):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.max_body_bytes = max_body_bytes
+        self.server = None
+        self.connections = {}
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port=0时使用系统分配的端口
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info('serving on {}:{}'.format(self.host, self.port))
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        # 关闭仍保持着的keep-alive连接，等待处理中的请求结束
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.batcher.stop()
+
+    def run_forever(self):
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.start())
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.stop())
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task() if hasattr(asyncio, 'current_task') else asyncio.Task.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body_bytes:
+                    self._respond(writer, 413, {'error': 'request body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, response = await self._dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                self._respond(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/stats':
+            return 200, self.batcher.stats()
+        if path != '/predict':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        try:
+            request = json.loads(body.decode('utf-8'))
+            texts = [request['text']] if 'text' in request else list(request['texts'])
+            if not all(isinstance(text, str) for text in texts):
+                raise ValueError('texts must be strings')
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': 'expected {{"text": str}} or {{"texts": [str]}}: {}'.format(e)}
+        try:
+            results = await self.batcher.submit(texts)
+        except Exception as e:
+            return 500, {'error': str(e)}
+        return 200, {'result': results[0]} if 'text' in request else {'results': results}
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: int, response: Dict, keep_alive: bool):
+        body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\n' \
+               'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(status, HTTP_STATUS.get(status, ''), len(body),
+                                                                    'keep-alive' if keep_alive else 'close')
+        writer.write(head.encode('latin-1') + body)
+
+
+async def post_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str,
+                    payload) -> Tuple[int, Dict]:
+    """在一个keep-alive连接上发送一次POST请求，供压测客户端使用"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    writer.write('POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n'
+                 'Content-Length: {}\r\n\r\n'.format(path, host, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads((await reader.readexactly(length)).decode('utf-8'))
+
+
+async def load_test(host: str, port: int, texts: List[str], concurrency: int = 32,
+                    requests: int = 2000) -> Dict:
+    """
+    `concurrency` clients, each on its own keep-alive connection, send single-sentence requests
+    back to back until `requests` have been answered
+    :return: p50/p99/mean latency in ms, requests per second and the number of failed requests
+    """
+    latencies = []
+    errors = [0]
+    counter = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in counter:
+                start = time.time()
+                status, _ = await post_json(reader, writer, host, '/predict', {'text': texts[i % len(texts)]})
+                latencies.append(time.time() - start)
+                if status != 200:
+                    errors[0] += 1
+        finally:
+            writer.close()
+
+    start = time.time()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.time() - start
+    latencies = np.asarray(latencies) * 1000
+    return {'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(latencies.mean()),
+            'requests_per_second': len(latencies) / elapsed,
+            'errors': errors[0]}
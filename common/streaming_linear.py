@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""分块读取句向量、用partial_fit增量训练的线性分类器，特征矩阵不需要整体放进内存"""
+from typing import Callable, Iterator
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+from common.metrics import StreamingMetrics
+
+# 给定样本下标（升序）返回这些样本的句向量，如 VectorCache.read_rows 或者直接调用编码器
+ChunkSource = Callable[[np.ndarray], np.ndarray]
+
+# sklearn 1.1把逻辑回归的loss改名为log_loss，1.3起不再接受log
+LOG_LOSS = 'log_loss' if 'log_loss' in getattr(SGDClassifier, 'loss_functions', {}) else 'log'
+
+
+class StreamingLinearClassifier(object):
+    """
+    Logistic regression trained with SGD one chunk at a time.
+
+    Every epoch shuffles the training indices, cuts them into chunks of `chunk_size` and calls
+    `source` for each chunk (sorted, so a memory-mapped store is read mostly sequentially), so
+    only one chunk of vectors is in memory at a time. With `scale=True` an extra first pass
+    fits a :class:`StandardScaler` incrementally, which SGD needs to converge on raw BERT vectors.
+    """
+
+    def __init__(self,
+                 classes,
+                 chunk_size: int = 8192,
+                 epochs: int = 5,
+                 alpha: float = 1e-4,
+                 scale: bool = True,
+                 seed: int = 0):
+        """
+        :param classes: all labels, required by the first partial_fit
+        :param chunk_size: samples read from `source` at a time
+        :param epochs: passes over the training set
+        :param alpha: L2 regularization strength
+        :param scale: standardize the features with statistics from one streaming pass
+        :param seed:
+        """
+        self.classes = np.asarray(classes)
+        self.chunk_size = chunk_size
+        self.epochs = epochs
+        self.scaler = StandardScaler() if scale else None
+        self.clf = SGDClassifier(loss=LOG_LOSS, alpha=alpha, random_state=seed)
+        self.random = np.random.RandomState(seed)
+
+    def chunks(self, indices: np.ndarray, shuffle: bool = False) -> Iterator[np.ndarray]:
+        if shuffle:
+            indices = self.random.permutation(indices)
+        for start in range(0, len(indices), self.chunk_size):
+            yield np.sort(indices[start:start + self.chunk_size])
+
+    def _features(self, source: ChunkSource, chunk: np.ndarray) -> np.ndarray:
+        x = source(chunk)
+        if self.scaler is not None:
+            x = self.scaler.transform(x)
+        return x
+
+    def fit(self, source: ChunkSource, indices: np.ndarray, labels: np.ndarray,
+            eval_indices: np.ndarray = None) -> 'StreamingLinearClassifier':
+        """
+        :param source: vectors of the given sample indices
+        :param indices: training samples
+        :param labels: labels of all samples, indexed like `source`
+        :param eval_indices: samples whose accuracy is printed after every epoch
+        """
+        if self.scaler is not None:
+            for chunk in self.chunks(indices):
+                self.scaler.partial_fit(source(chunk))
+        for epoch in range(self.epochs):
+            for chunk in self.chunks(indices, shuffle=True):
+                self.clf.partial_fit(self._features(source, chunk), labels[chunk], classes=self.classes)
+            if eval_indices is not None:
+                print('epoch {}: accuracy {:.4f}'.format(epoch + 1, self.score(source, eval_indices, labels)))
+        return self
+
+    def predict(self, source: ChunkSource, indices: np.ndarray) -> np.ndarray:
+        """
+        :return: predicted labels of `indices`, in the same order
+        """
+        order = np.argsort(indices, kind='mergesort')
+        predictions = [self.clf.predict(self._features(source, chunk)) for chunk in self.chunks(indices[order])]
+        result = np.empty(len(indices), dtype=self.classes.dtype)
+        result[order] = np.concatenate(predictions) if predictions else []
+        return result
+
+    def evaluate(self, source: ChunkSource, indices: np.ndarray, labels: np.ndarray) -> StreamingMetrics:
+        """accuracy, per-class P/R/F1 and (binary) AUC accumulated chunk by chunk"""
+        result = StreamingMetrics(self.classes)
+        for chunk in self.chunks(np.sort(indices)):
+            x = self._features(source, chunk)
+            # AUC用正类的logit计算，SGD的概率输出集中在0和1附近，会出现大量并列
+            result.update(labels[chunk], self.clf.predict(x), self.clf.decision_function(x))
+        return result
+
+    def score(self, source: ChunkSource, indices: np.ndarray, labels: np.ndarray) -> float:
+        return self.evaluate(source, indices, labels).accuracy
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""按文本内容寻址的句向量磁盘缓存：同一个编码器下已经编码过的句子不再重复编码"""
+import hashlib
+import json
+import logging
+import os
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """全角/半角等统一为NFKC，去掉首尾空白并合并连续空白"""
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).digest()[:16]
+
+
+def key_array(keys: List[bytes]) -> np.ndarray:
+    """16-byte keys as a (n, 16) uint8 array; 'S16' would drop trailing zero bytes"""
+    return np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(-1, 16)
+
+
+def key_list(keys: np.ndarray) -> List[bytes]:
+    data = keys.tobytes()
+    return [data[i:i + 16] for i in range(0, len(data), 16)]
+
+
+class VectorCache(object):
+    """
+    Memory-mapped sentence vectors of one encoder, keyed by the hash of the normalized text.
+
+    Each encoder (identified by `encoder_id`, e.g. the checkpoint path, max length and pooling
+    layer) gets its own directory under `cache_dir` with
+
+    * vectors.f32: float32 rows appended in insertion order, read through `np.memmap`
+    * index.npz: the 16-byte key (a row of a (n, 16) uint8 array) and the last-used clock of every row
+    * meta.json: encoder_id and vector dimension
+
+    With `max_bytes > 0`, :meth:`evict` keeps only the most recently used rows that fit and
+    compacts the files.
+    """
+
+    def __init__(self, cache_dir: str, encoder_id: str, dim: int = None, max_bytes: int = 0):
+        """
+        :param cache_dir:
+        :param encoder_id: everything the vectors depend on besides the text
+        :param dim: vector dimension, taken from the first appended vectors when None
+        :param max_bytes: size limit of vectors.f32, 0 for no limit
+        """
+        self.path = os.path.join(cache_dir, hashlib.sha1(encoder_id.encode('utf-8')).hexdigest()[:16])
+        self.encoder_id = encoder_id
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+        meta_path = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if dim is not None and meta['dim'] != dim:
+                raise ValueError('cache {} holds {}-d vectors, got dim={}'.format(self.path, meta['dim'], dim))
+            dim = meta['dim']
+        self.dim = dim
+
+        index_path = os.path.join(self.path, 'index.npz')
+        if os.path.exists(index_path):
+            index = np.load(index_path)
+            self.keys, self.last_used = index['keys'], index['last_used']
+            if self.keys.dtype.kind == 'S':
+                # 旧版本以'S16'保存，末尾的0字节被去掉了，补齐即可还原
+                self.keys = key_array([key.ljust(16, b'\0') for key in self.keys.tolist()])
+        else:
+            self.keys, self.last_used = np.zeros((0, 16), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+        self.rows = dict((key, row) for row, key in enumerate(key_list(self.keys)))
+        self.clock = int(self.last_used.max()) + 1 if len(self.last_used) else 1
+        self._vectors = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def vector_file(self) -> str:
+        return os.path.join(self.path, 'vectors.f32')
+
+    @property
+    def nbytes(self) -> int:
+        return len(self) * (self.dim or 0) * 4
+
+    def vectors(self) -> np.memmap:
+        if self._vectors is None and len(self) > 0:
+            self._vectors = np.memmap(self.vector_file, dtype=np.float32, mode='r', shape=(len(self), self.dim))
+        return self._vectors
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (len(texts), dim) vectors with zeros for misses, and the boolean mask of hits
+        """
+        return self._lookup_keys([text_key(text) for text in texts])
+
+    def _lookup_keys(self, keys: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.asarray([self.rows.get(key, -1) for key in keys], dtype=np.int64)
+        found = rows >= 0
+        result = np.zeros((len(keys), self.dim or 0), dtype=np.float32)
+        if found.any():
+            result[found] = self.read_rows(rows[found])
+        return result, found
+
+    def rows_of(self, texts: List[str]) -> np.ndarray:
+        """row of every text in vectors.f32, -1 for misses; rows stay valid until the next eviction"""
+        return np.asarray([self.rows.get(text_key(text), -1) for text in texts], dtype=np.int64)
+
+    def read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """vectors of `rows` (in that order), marked as used"""
+        # memmap按行的顺序读取更快
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        self.last_used[unique_rows] = self.clock
+        self.clock += 1
+        return self.vectors()[unique_rows][inverse]
+
+    def append(self, texts: List[str], vectors: np.ndarray):
+        """add the vectors of texts not in the cache yet, then evict if over the size limit"""
+        self._append_keys([text_key(text) for text in texts], vectors)
+        self.evict()
+
+    def _append_keys(self, keys: List[bytes], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'encoder_id': self.encoder_id, 'dim': self.dim}, indent=2, ensure_ascii=False))
+        new = OrderedDict()
+        for key, vector in zip(keys, vectors):
+            if key not in self.rows and key not in new:
+                new[key] = vector
+        if not new:
+            return
+
+        self._vectors = None
+        with open(self.vector_file, 'ab') as f:
+            # 上次写入向量后没有来得及保存index时，文件末尾会多出无主的行
+            f.truncate(self.nbytes)
+            f.write(np.stack(list(new.values())).tobytes())
+        for offset, key in enumerate(new):
+            self.rows[key] = len(self.keys) + offset
+        self.keys = np.concatenate([self.keys, key_array(list(new))])
+        self.last_used = np.concatenate([self.last_used, np.full(len(new), self.clock, dtype=np.int64)])
+        self.clock += 1
+        self.flush()
+
+    def evict(self):
+        """keep the most recently used rows within max_bytes"""
+        if self.max_bytes <= 0 or self.nbytes <= self.max_bytes:
+            return
+        keep = np.sort(np.argsort(-self.last_used, kind='mergesort')[:self.max_bytes // (self.dim * 4)])
+        logging.info('evicting {} of {} cached vectors'.format(len(self) - len(keep), len(self)))
+        tmp_file = self.vector_file + '.tmp'
+        vectors = self.vectors()
+        with open(tmp_file, 'wb') as f:
+            for i in range(0, len(keep), 65536):
+                f.write(np.ascontiguousarray(vectors[keep[i:i + 65536]]).tobytes())
+        self._vectors = None
+        del vectors
+        os.replace(tmp_file, self.vector_file)
+        self.keys, self.last_used = self.keys[keep], self.last_used[keep]
+        self.rows = dict((key, row) for row, key in enumerate(key_list(self.keys)))
+        self.flush()
+
+    def flush(self):
+        """save the index, including the last-used clock updated by lookups"""
+        tmp_file = os.path.join(self.path, 'index.tmp.npz')
+        np.savez(tmp_file, keys=self.keys, last_used=self.last_used)
+        os.replace(tmp_file, os.path.join(self.path, 'index.npz'))
+
+    def get_or_encode(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        vectors of `texts`, only the texts missing from the cache (deduplicated) go through `encode`
+        :param texts:
+        :param encode: e.g. `BertEncoder.encode` or `BertClient.encode`
+        :return: float32 array of shape (len(texts), dim)
+        """
+        keys = [text_key(text) for text in texts]
+        self._encode_missing(texts, keys, encode)
+        result, _ = self._lookup_keys(keys)
+        self.flush()
+        self.evict()
+        return result
+
+    def encode_missing(self, texts: List[str], encode: Callable[[List[str]], np.ndarray], chunk_size: int = 0):
+        """
+        encode and append the texts missing from the cache without loading the cached vectors,
+        `chunk_size` texts per `encode` call (0 for a single call); nothing is evicted
+        """
+        self._encode_missing(texts, [text_key(text) for text in texts], encode, chunk_size)
+
+    def _encode_missing(self, texts, keys, encode, chunk_size=0):
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            if key not in self.rows and key not in missing:
+                missing[key] = i
+        logging.info('vector cache: {} texts, {} to encode'.format(len(texts), len(missing)))
+        missing_keys, missing_index = list(missing), list(missing.values())
+        chunk_size = chunk_size or max(len(missing_keys), 1)
+        for start in range(0, len(missing_keys), chunk_size):
+            chunk = missing_index[start:start + chunk_size]
+            self._append_keys(missing_keys[start:start + chunk_size], encode([texts[i] for i in chunk]))
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""有界词表：高频词单独占一行，其余词按稳定哈希落入少量的桶，embedding矩阵的行数不随语料中的低频词增长"""
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Union
+
+from keras.preprocessing.text import text_to_word_sequence
+
+
+def bucket_hash(token: str, num_buckets: int) -> int:
+    """
+    与进程无关的哈希桶下标（python内置的hash每次启动会随机加盐）
+    :param token:
+    :param num_buckets:
+    :return: [0, num_buckets)
+    """
+    return zlib.crc32(token.encode('utf-8')) % num_buckets
+
+
+class StreamingTopK(object):
+    """
+    Misra-Gries heavy hitters: the frequent items of a stream in one pass with at most
+    `capacity` counters. Every item occurring more than `n / (capacity + 1)` times is kept,
+    and counts are underestimated by at most that much.
+    """
+
+    def __init__(self, k: int, capacity: int = None):
+        self.k = k
+        self.capacity = capacity or 10 * k
+        self.counts: Dict[str, int] = {}
+        self.total = 0
+
+    def update(self, items: Iterable[str]):
+        counts = self.counts
+        for item in items:
+            self.total += 1
+            if item in counts:
+                counts[item] += 1
+            elif len(counts) < self.capacity:
+                counts[item] = 1
+            else:
+                # 计数器已满：所有计数减一并删除归零的项，新项本身也被抵消
+                for key in list(counts):
+                    if counts[key] == 1:
+                        del counts[key]
+                    else:
+                        counts[key] -= 1
+
+    def most_common(self) -> List[str]:
+        if self.k <= 0:
+            return []
+        return [item for item, _ in sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))[:self.k]]
+
+
+class HashingTokenizer(object):
+    """
+    drop-in replacement for `keras.preprocessing.text.Tokenizer` with a fixed vocabulary size.
+
+    Index 0 is padding, `1 .. top_k` are the `top_k` most frequent words (found in one pass
+    by :class:`StreamingTopK`) and every other word is hashed into one of `num_buckets`
+    buckets after them, so `vocab_size = 1 + top_k + num_buckets` rows whatever the corpus size.
+    Unlike `Tokenizer` unknown words are never dropped, they share the bucket rows.
+    """
+
+    def __init__(self, num_buckets: int, top_k: int = 0, counter_capacity: int = None, **kwargs):
+        """
+        :param num_buckets: number of hash buckets
+        :param top_k: number of frequent words with their own row, 0 for pure hashing
+        :param counter_capacity: counters kept while finding the frequent words, default 10 * top_k
+        :param kwargs: filters / lower / split of `text_to_word_sequence`, same defaults as `Tokenizer`
+        """
+        if num_buckets <= 0:
+            raise ValueError('num_buckets must be positive')
+        self.num_buckets = num_buckets
+        self.top_k = top_k
+        self.counter = StreamingTopK(top_k, counter_capacity) if top_k > 0 else None
+        self.text_kwargs = kwargs
+        self.word_index: Dict[str, int] = {}
+
+    @property
+    def vocab_size(self) -> int:
+        return 1 + self.top_k + self.num_buckets
+
+    def _words(self, text: Union[str, List[str]]) -> List[str]:
+        if isinstance(text, str):
+            return text_to_word_sequence(text, **self.text_kwargs)
+        return text
+
+    def fit_on_texts(self, texts: Iterable[Union[str, List[str]]]):
+        """
+        one pass over `texts`, which can be a generator; only needed when top_k > 0
+        """
+        if self.counter is None:
+            return
+        for text in texts:
+            self.counter.update(self._words(text))
+        self.word_index = dict((word, i + 1) for i, word in enumerate(self.counter.most_common()))
+
+    def word_to_index(self, word: str) -> int:
+        idx = self.word_index.get(word)
+        if idx is not None:
+            return idx
+        return 1 + self.top_k + bucket_hash(word, self.num_buckets)
+
+    def texts_to_sequences(self, texts: Iterable[Union[str, List[str]]]) -> List[List[int]]:
+        return [[self.word_to_index(word) for word in self._words(text)] for text in texts]
+
+
+class PrunedTokenizer(HashingTokenizer):
+    """
+    `Tokenizer` that honors `max_num_words` and `min_count`: the kept words are counted exactly
+    and get rows `1 .. len(word_index)`, the tail is hashed into `oov_buckets` rows after them
+    (with `oov_buckets=0` tail words are dropped, like `Tokenizer(num_words=...)`).
+    """
+
+    def __init__(self, max_num_words: int, min_count: int = 1, oov_buckets: int = 100, **kwargs):
+        super(PrunedTokenizer, self).__init__(max(oov_buckets, 1), top_k=max_num_words, **kwargs)
+        self.max_num_words = max_num_words
+        self.min_count = min_count
+        self.oov_buckets = oov_buckets
+        self.counter = None
+        self.num_distinct_words = 0
+
+    @property
+    def vocab_size(self) -> int:
+        return 1 + len(self.word_index) + self.oov_buckets
+
+    @property
+    def full_vocab_size(self) -> int:
+        """rows of the unpruned `Tokenizer` vocabulary"""
+        return 1 + self.num_distinct_words
+
+    def fit_on_texts(self, texts: Iterable[Union[str, List[str]]]):
+        counts = Counter()
+        for text in texts:
+            counts.update(self._words(text))
+        self.num_distinct_words = len(counts)
+        kept = sorted([kv for kv in counts.items() if kv[1] >= self.min_count],
+                      key=lambda kv: (-kv[1], kv[0]))[:self.max_num_words]
+        self.word_index = dict((word, i + 1) for i, (word, _) in enumerate(kept))
+        self.top_k = len(self.word_index)
+
+    def texts_to_sequences(self, texts: Iterable[Union[str, List[str]]]) -> List[List[int]]:
+        if self.oov_buckets > 0:
+            return super(PrunedTokenizer, self).texts_to_sequences(texts)
+        return [[self.word_index[word] for word in self._words(text) if word in self.word_index]
+                for text in texts]
+
+    def summary(self, embedding_dim: int) -> str:
+        full = self.full_vocab_size * embedding_dim
+        pruned = self.vocab_size * embedding_dim
+        return 'vocabulary {} -> {} words + {} oov buckets, embedding parameters {} -> {} ({:.1f}x smaller)'.format(
+            self.num_distinct_words, len(self.word_index), self.oov_buckets, full, pruned, full / pruned)